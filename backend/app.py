@@ -6,6 +6,8 @@ from flask_pymongo import PyMongo
 from dotenv import load_dotenv
 import os
 import sys
+import threading
+import atexit
 
 # Ensure Windows console can print unicode safely (prevents 'charmap' errors)
 if hasattr(sys.stdout, "reconfigure"):
@@ -24,38 +26,146 @@ from routes.admin_routes import admin_bp
 from routes.gov_verify_routes import gov_verify_bp
 from routes.image_routes import image_bp
 from routes.booth_allocation import booth_allocation_bp
+from services.advanced_face_verification import get_verifier
+from services.verification_pool import VerificationPool
+from services.image_fetcher import get_image_fetcher
+from services.thumbnails import get_thumbnail_store
+from services.db_indexes import IndexCheckError, apply_indexes, check_query_plans
+from services.enrollment_cache import get_enrollment_cache
+from services.sms_outbox import loaded_sms_dispatcher, start_sms_dispatcher
+from utils.latency import REGISTRY as LATENCY
 
-# Initialize Flask App
-app = Flask(__name__)
-
-
-# --- Configuration ---
-app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db")
-CORS(app)  # Enable Cross-Origin Resource Sharing
-
-# Initialize PyMongo and attach it to the app
-mongo = PyMongo(app)
-app.mongo = mongo # Make mongo accessible in blueprints via current_app
-
-#Register Blueprints
-# This organizes the routes into separate files for better maintainability
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(admin_bp, url_prefix='/api/admin')
-app.register_blueprint(data_bp, url_prefix='/api') # For dashboard and AI routes
-app.register_blueprint(gov_verify_bp, url_prefix='/api/auth')
-app.register_blueprint(image_bp, url_prefix='/api/admin')
-app.register_blueprint(booth_allocation_bp, url_prefix='/api/booth-allocation') 
-app.register_blueprint(anomaly_bp, url_prefix="/api")
-# app.register_blueprint(data_bp)
-#Root Route 
-@app.route('/')
-def index():
-    """A simple route to confirm the backend is running."""
-    return {"status": "running", "message": "AI Voter Authentication Backend"}
+def create_app():
+    """Build the Flask app and start its background machinery.
+
+    Everything with side effects (index creation and the plan check, the
+    model warm-up, the verification pool, the SMS dispatcher) happens here
+    rather than at import time: spawned worker processes re-import this
+    module as ``__mp_main__`` and must not repeat any of it.
+    Serve with ``python app.py`` or e.g. ``gunicorn "app:create_app()"``.
+    """
+    # Initialize Flask App
+    app = Flask(__name__)
+
+    # --- Configuration ---
+    app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db")
+    CORS(app)  # Enable Cross-Origin Resource Sharing
+
+    # Initialize PyMongo and attach it to the app
+    mongo = PyMongo(app)
+    app.mongo = mongo # Make mongo accessible in blueprints via current_app
+
+    # Every index the routes rely on (services/db_indexes.py), then an explain() check that
+    # no route's query shape is planned as a collection scan. Such a scan refuses to start the
+    # app unless INDEX_CHECK_STRICT=0; an unreachable database only warns.
+    try:
+        apply_indexes(mongo.db)
+        if os.getenv("INDEX_SELF_CHECK", "1") != "0":
+            check_query_plans(mongo.db)
+    except IndexCheckError as e:
+        print(f"[ERROR] {e}")
+        if os.getenv("INDEX_CHECK_STRICT", "1") != "0":
+            raise
+    except Exception as e:
+        print(f"[WARN] Could not apply database indexes: {e}")
+
+    # Shared face verifier: load and warm the model once per process so the first
+    # voters at a booth do not pay for lazy weight loading.
+    face_verifier = get_verifier()
+    app.face_verifier = face_verifier
+    if os.getenv("FACE_BATCHING", "0") == "1":
+        face_verifier.enable_batching(
+            max_batch_size=int(os.getenv("FACE_BATCH_MAX_SIZE", "8")),
+            max_wait_ms=float(os.getenv("FACE_BATCH_MAX_WAIT_MS", "5"))
+        )
+    if os.getenv("FACE_CASCADE", "0") == "1":
+        face_verifier.enable_cascade(
+            accept_below=float(os.getenv("FACE_CASCADE_ACCEPT_BELOW", "0.30")),
+            reject_above=float(os.getenv("FACE_CASCADE_REJECT_ABOVE", "0.80"))
+        )
+    # Adaptive-resolution preprocessing: only a face crop of at most
+    # FACE_PREPROCESS_EMBED_MAX_SIDE px reaches the detector and Facenet.
+    if os.getenv("FACE_PREPROCESS", "1") == "0":
+        face_verifier.configure_preprocessing(enabled=False)
+    else:
+        face_verifier.configure_preprocessing(
+            detect_width=int(os.getenv("FACE_PREPROCESS_DETECT_WIDTH", "320")),
+            embed_max_side=int(os.getenv("FACE_PREPROCESS_EMBED_MAX_SIDE", "320")),
+            fallback_max_side=int(os.getenv("FACE_PREPROCESS_FALLBACK_MAX_SIDE", "640"))
+        )
+    # FACE_MODEL_PRELOAD=0 loads the model on the first verification instead; /health reports "lazy"
+    app.face_model_preload = os.getenv("FACE_MODEL_PRELOAD", "1") != "0"
+    if app.face_model_preload:
+        threading.Thread(target=face_verifier.warm_up, name="face-model-warmup", daemon=True).start()
+
+    # Optional worker-process pool so face verification never runs on request threads.
+    # When FACE_VERIFY_MAX_PENDING jobs are in flight, /authenticate answers 503 + Retry-After.
+    app.verification_pool = None
+    if int(os.getenv("FACE_VERIFY_WORKERS", "0")) > 0:
+        app.verification_pool = VerificationPool(
+            workers=int(os.getenv("FACE_VERIFY_WORKERS")),
+            max_pending=int(os.getenv("FACE_VERIFY_MAX_PENDING", "0")) or None,
+            timeout=float(os.getenv("FACE_VERIFY_TIMEOUT", "30")),
+            cascade=(face_verifier.cascade.accept_below, face_verifier.cascade.reject_above) if face_verifier.cascade else None,
+            preprocessing=face_verifier.preprocessing
+        )
+        atexit.register(app.verification_pool.shutdown)
+
+    # Request handlers only enqueue SMS into the sms_outbox collection; this dispatcher delivers them.
+    # SMS_DISPATCH_IN_APP=0 leaves delivery to another process (run_sms_dispatcher.py).
+    # Every dispatcher shares one send-rate budget (SMS_RATE_PER_SEC) kept in the database.
+    if os.getenv("SMS_DISPATCH_IN_APP", "1") != "0":
+        atexit.register(start_sms_dispatcher(mongo.db).stop)
+
+    #Register Blueprints
+    # This organizes the routes into separate files for better maintainability
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(data_bp, url_prefix='/api') # For dashboard and AI routes
+    app.register_blueprint(gov_verify_bp, url_prefix='/api/auth')
+    app.register_blueprint(image_bp, url_prefix='/api/admin')
+    app.register_blueprint(booth_allocation_bp, url_prefix='/api/booth-allocation') 
+    app.register_blueprint(anomaly_bp, url_prefix="/api")
+    # app.register_blueprint(data_bp)
+    #Root Route 
+    @app.route('/')
+    def index():
+        """A simple route to confirm the backend is running."""
+        return {"status": "running", "message": "AI Voter Authentication Backend"}
+
+    @app.route('/health')
+    def health():
+        """Readiness probe: 503 while the face model is warming up.
+
+        With FACE_MODEL_PRELOAD=0 nothing warms the model up, so the instance
+        is reported ready ("lazy") and the first verification loads it.
+        """
+        face_model = app.face_verifier.status()
+        if face_model["ready"]:
+            return {"status": "ready", "face_model": face_model}, 200
+        if not app.face_model_preload:
+            return {"status": "lazy", "face_model": face_model}, 200
+        return {"status": "warming_up", "face_model": face_model}, 503
+
+    @app.route('/metrics')
+    def metrics():
+        """Per-stage latency histograms (p50/p95/p99) and face pipeline counters."""
+        return {
+            "latency": LATENCY.snapshot(),
+            "face_batching": app.face_verifier.batcher.stats() if app.face_verifier.batcher else None,
+            "verification_pool": app.verification_pool.metrics() if app.verification_pool else None,
+            "image_fetcher": get_image_fetcher().stats(),
+            "thumbnails": get_thumbnail_store(mongo.db).stats(),
+            "enrollment_cache": get_enrollment_cache().stats(),
+            "sms_dispatcher": loaded_sms_dispatcher().stats() if loaded_sms_dispatcher() else None
+        }
+
+    return app
 
 #Main Execution
 if __name__ == '__main__':
     # Runs the Flask app in debug mode
+    app = create_app()
     app.run(debug=True, host='0.0.0.0', port=5000)
     #venv\Scripts\activate
     #pip install -r requirements.txt
\ No newline at end of file
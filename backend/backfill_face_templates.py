@@ -0,0 +1,64 @@
+import os
+import argparse
+from bson import ObjectId
+from pymongo import MongoClient
+import gridfs
+from dotenv import load_dotenv
+
+from services.face_enrollment import build_face_template, store_face_template, get_face_template
+
+# --- Configuration ---
+# Uses the same MONGO_URI as the Flask app (.env is loaded below)
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db")
+DB_NAME = "voter_auth_db"
+
+
+def backfill_face_templates(force=False, limit=0):
+    """Computes Facenet enrollment embeddings for voters whose photo has none yet."""
+
+    print("--- Starting Face Template Backfill ---")
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database(DB_NAME)
+    fs = gridfs.GridFS(db)
+
+    cursor = db.voters.find({"image_id": {"$nin": [None, ""]}}, {"image_id": 1, "face_template": 1})
+    if limit:
+        cursor = cursor.limit(limit)
+
+    done = skipped = failed = 0
+    for voter in cursor:
+        if not force and get_face_template(db, voter):
+            skipped += 1
+            continue
+
+        try:
+            stored_file = fs.get(ObjectId(voter["image_id"]))
+            image_bytes = stored_file.read()
+        except gridfs.NoFile:
+            print(f"   Missing GridFS file {voter['image_id']} for voter {voter['_id']}")
+            failed += 1
+            continue
+
+        template = build_face_template(image_bytes, voter["image_id"], getattr(stored_file, "face_box", None))
+        if not template:
+            failed += 1
+            continue
+
+        store_face_template(db, template, {"_id": voter["_id"]})
+        done += 1
+        if done % 50 == 0:
+            print(f"   Embedded {done} photos...")
+
+    client.close()
+    print(f"✅ Embedded {done}, already current {skipped}, failed {failed}.")
+    print("--- Face Template Backfill Complete ---")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute face embeddings for existing voter photos")
+    parser.add_argument("--force", action="store_true", help="Recompute even when a current template exists")
+    parser.add_argument("--limit", type=int, default=0, help="Only process this many voters (0 = all)")
+    args = parser.parse_args()
+    backfill_face_templates(force=args.force, limit=args.limit)
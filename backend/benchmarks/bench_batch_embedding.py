@@ -0,0 +1,92 @@
+"""Throughput vs. concurrency: micro-batched embedding against one-at-a-time.
+
+Run from backend/:
+    python -m benchmarks.bench_batch_embedding --image path/to/face.jpg
+    python -m benchmarks.bench_batch_embedding --synthetic   # no TensorFlow needed
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def _synthetic_backends(fixed_ms, per_item_ms, max_batch_size, max_wait_ms):
+    # Models a forward pass whose cost is mostly fixed per call, which is what
+    # makes batching pay off on CPU/GPU inference.
+    from services.batch_embedding import BatchingEmbeddingEngine
+
+    lock = threading.Lock()
+
+    def forward(batch):
+        with lock:
+            time.sleep((fixed_ms + per_item_ms * len(batch)) / 1000.0)
+        return np.zeros((len(batch), 128), dtype=np.float32)
+
+    def preprocess(image):
+        return np.zeros((1, 160, 160, 3), dtype=np.float32), {"facial_area": {}}
+
+    def single(image):
+        tensor, _ = preprocess(image)
+        return forward(tensor)[0]
+
+    engine = BatchingEmbeddingEngine(preprocess, forward, max_batch_size, max_wait_ms)
+    return single, engine
+
+
+def _real_backends(max_batch_size, max_wait_ms):
+    from services.advanced_face_verification import AdvancedFaceVerification
+    from services.batch_embedding import facenet_batching_engine
+
+    sequential = AdvancedFaceVerification()
+    sequential.warm_up()
+    engine = facenet_batching_engine(
+        sequential.MODEL_NAME, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+    )
+    return sequential.compute_embedding, engine
+
+
+def _throughput(fn, image, concurrency, requests_per_level):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: fn(image), range(requests_per_level)))
+    return requests_per_level / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Face photo to embed (required unless --synthetic)")
+    parser.add_argument("--synthetic", action="store_true", help="Use a sleep-based stand-in model")
+    parser.add_argument("--fixed-ms", type=float, default=40.0, help="Synthetic per-call cost")
+    parser.add_argument("--per-item-ms", type=float, default=4.0, help="Synthetic per-image cost")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        single, engine = _synthetic_backends(args.fixed_ms, args.per_item_ms, args.max_batch_size, args.max_wait_ms)
+    else:
+        if not args.image:
+            parser.error("--image is required unless --synthetic is given")
+        image = cv2.imread(args.image)
+        single, engine = _real_backends(args.max_batch_size, args.max_wait_ms)
+
+    print(f"{'concurrency':>11} | {'sequential req/s':>16} | {'batched req/s':>13} | {'speedup':>7}")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        seq = _throughput(single, image, concurrency, args.requests)
+        batched = _throughput(engine.embed, image, concurrency, args.requests)
+        print(f"{concurrency:>11} | {seq:>16.1f} | {batched:>13.1f} | {batched / seq:>6.2f}x")
+
+    stats = engine.stats()
+    print(f"\nbatches={stats['batches']} mean_batch_size={stats['mean_batch_size']} "
+          f"mean_queue_wait_ms={stats['mean_queue_wait_ms']} histogram={stats['batch_size_histogram']}")
+    engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
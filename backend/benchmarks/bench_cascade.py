@@ -0,0 +1,94 @@
+"""Accuracy and latency of the verification cascade against the single-stage Facenet path.
+
+Expects a labelled image set laid out as one directory per person:
+    dataset/alice/1.jpg, dataset/alice/2.jpg, dataset/bob/1.jpg, ...
+
+Run from backend/:
+    python -m benchmarks.bench_cascade --dataset path/to/dataset --pairs 200
+"""
+import argparse
+import base64
+import itertools
+import os
+import random
+import time
+
+from services.advanced_face_verification import AdvancedFaceVerification
+
+
+def _load_dataset(root):
+    people = {}
+    for person in sorted(os.listdir(root)):
+        folder = os.path.join(root, person)
+        if not os.path.isdir(folder):
+            continue
+        images = []
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    images.append("data:image/jpeg;base64," + base64.b64encode(f.read()).decode('utf-8'))
+        if images:
+            people[person] = images
+    return people
+
+
+def _make_pairs(people, count, seed):
+    rng = random.Random(seed)
+    genuine = [
+        (a, b, True)
+        for images in people.values()
+        for a, b in itertools.combinations(images, 2)
+    ]
+    names = list(people)
+    impostor = []
+    while len(names) > 1 and len(impostor) < count // 2:
+        p1, p2 = rng.sample(names, 2)
+        impostor.append((rng.choice(people[p1]), rng.choice(people[p2]), False))
+    rng.shuffle(genuine)
+    return genuine[:count - len(impostor)] + impostor
+
+
+def _evaluate(verifier, pairs):
+    latencies, correct, escalated = [], 0, 0
+    for stored, live, same_person in pairs:
+        start = time.perf_counter()
+        result = verifier.comprehensive_verification(stored, live)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        correct += int(bool(result.get('match')) == same_person)
+        stages = (result.get('detailed_scores') or {}).get('stages', [])
+        escalated += int(any(stage['stage'] == 'facenet' for stage in stages))
+    latencies.sort()
+    return {
+        "accuracy": correct / len(pairs),
+        "mean_ms": sum(latencies) / len(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        "facenet_rate": escalated / len(pairs)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", required=True)
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--accept-below", type=float, default=0.30)
+    parser.add_argument("--reject-above", type=float, default=0.80)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pairs = _make_pairs(_load_dataset(args.dataset), args.pairs, args.seed)
+    print(f"{len(pairs)} pairs ({sum(1 for p in pairs if p[2])} genuine)")
+
+    single = AdvancedFaceVerification()
+    single.warm_up()
+    cascade = AdvancedFaceVerification()
+    cascade.enable_cascade(args.accept_below, args.reject_above)
+    cascade.warm_up()
+
+    print(f"{'path':>12} | {'accuracy':>8} | {'mean ms':>8} | {'p99 ms':>8} | {'facenet runs':>12}")
+    for name, verifier in (("single-stage", single), ("cascade", cascade)):
+        r = _evaluate(verifier, pairs)
+        print(f"{name:>12} | {r['accuracy']:>8.3f} | {r['mean_ms']:>8.1f} | {r['p99_ms']:>8.1f} | {r['facenet_rate']:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Per-call time and peak allocations: old base64/PIL decode path vs. single BGR decode.
+
+Run from backend/:
+    python -m benchmarks.bench_decode --image path/to/photo.jpg
+    python -m benchmarks.bench_decode               # synthetic 1280x720 JPEG
+"""
+import argparse
+import base64
+import time
+import tracemalloc
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def old_path(stored_bytes, live_data_url):
+    # What authenticate_voter + comprehensive_verification used to do
+    stored_url = f"data:image/jpeg;base64,{base64.b64encode(stored_bytes).decode('utf-8')}"
+    stored = base64.b64decode(stored_url.split('base64,')[1])
+    stored_cv = cv2.cvtColor(np.array(Image.open(BytesIO(stored))), cv2.COLOR_RGB2BGR)
+    live = base64.b64decode(live_data_url.split('base64,')[1])
+    live_cv = cv2.cvtColor(np.array(Image.open(BytesIO(live))), cv2.COLOR_RGB2BGR)
+    return stored_cv, live_cv
+
+
+def new_path(stored_bytes, live_data_url):
+    from services.advanced_face_verification import AdvancedFaceVerification
+    return AdvancedFaceVerification.to_bgr(stored_bytes), AdvancedFaceVerification.to_bgr(live_data_url)
+
+
+def _measure(fn, args, repeat):
+    fn(*args)
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) * 1000.0 / repeat, peak / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="JPEG used as both stored and live image")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        rng = np.random.default_rng(0)
+        frame = cv2.GaussianBlur(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8), (9, 9), 0)
+        image_bytes = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+    live_data_url = "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode("utf-8")
+
+    print(f"input: {len(image_bytes) / 1024:.0f} KB JPEG, {args.repeat} calls per path")
+    old_ms, old_kb = _measure(old_path, (image_bytes, live_data_url), args.repeat)
+    new_ms, new_kb = _measure(new_path, (image_bytes, live_data_url), args.repeat)
+    print(f"{'path':>6} | {'ms/call':>8} | {'peak KB':>9}")
+    print(f"{'old':>6} | {old_ms:>8.2f} | {old_kb:>9.0f}")
+    print(f"{'new':>6} | {new_ms:>8.2f} | {new_kb:>9.0f}")
+    print(f"saved: {old_ms - new_ms:.2f} ms and {old_kb - new_kb:.0f} KB peak per authentication")
+
+
+if __name__ == "__main__":
+    main()
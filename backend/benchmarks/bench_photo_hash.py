@@ -0,0 +1,58 @@
+"""Upload-time near-duplicate lookup latency of the photo hash index at roll scale.
+
+Fills a PhotoHashIndex with random 64-bit hashes plus a few planted
+near-duplicates, then times single queries (what an upload pays) and checks
+that every planted copy is found.
+
+Run from backend/:
+    python -m benchmarks.bench_photo_hash --size 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from services.photo_hash_index import PHOTO_DUPLICATE_THRESHOLD, PhotoHashIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1000000, help="Photos in the index")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=int, default=PHOTO_DUPLICATE_THRESHOLD)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, np.iinfo(np.int64).max, size=args.size, dtype=np.int64)
+    index = PhotoHashIndex(threshold=args.threshold)
+
+    start = time.perf_counter()
+    for i, value in enumerate(hashes):
+        index.add(i, f"V{i}", int(value))
+    print(f"built {args.size} entries in {time.perf_counter() - start:.1f}s: {index.stats()}")
+
+    # Plant copies of random rows with up to `threshold` flipped bits
+    queries = []
+    for q in range(args.queries):
+        row = int(rng.integers(args.size))
+        flipped = int(hashes[row])
+        for bit in rng.choice(63, size=int(rng.integers(0, args.threshold + 1)), replace=False):
+            flipped ^= 1 << int(bit)
+        queries.append((row, flipped))
+
+    latencies, found = [], 0
+    for row, value in queries:
+        start = time.perf_counter()
+        matches = index.query(value)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        found += any(m["image_id"] == str(row) for m in matches)
+    latencies.sort()
+    print(
+        f"query: p50 {latencies[len(latencies) // 2]:.0f}us, "
+        f"p99 {latencies[int(len(latencies) * 0.99)]:.0f}us, "
+        f"recall {found}/{len(queries)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
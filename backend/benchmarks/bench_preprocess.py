@@ -0,0 +1,76 @@
+"""Latency, peak memory and match-score drift of adaptive-resolution preprocessing.
+
+Each input photo is rescaled to a set of capture resolutions (VGA webcam up
+to a 12MP phone camera) and embedded with preprocessing off (the full frame
+goes to DeepFace) and on (only a model-sized crop around the face does).
+Score drift is the cosine distance between the two embeddings of the same
+frame; with two or more photos, pairwise match distances are compared too.
+
+Run from backend/ with one or more face photos:
+    python -m benchmarks.bench_preprocess --images alice1.jpg alice2.jpg bob.jpg
+"""
+import argparse
+import itertools
+import time
+import tracemalloc
+
+import cv2
+
+from services.advanced_face_verification import AdvancedFaceVerification
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080), (4032, 3024)]
+
+
+def _embed(verifier, frame, repeat):
+    verifier.compute_embedding(frame)
+    tracemalloc.start()
+    result = verifier.compute_embedding(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        verifier.compute_embedding(frame)
+    return result['embedding'], (time.perf_counter() - start) * 1000.0 / repeat, peak / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="+", required=True, help="Face photos to rescale and embed")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--embed-max-side", type=int, default=AdvancedFaceVerification.EMBED_MAX_SIDE)
+    parser.add_argument("--detect-width", type=int, default=AdvancedFaceVerification.DETECT_WIDTH)
+    args = parser.parse_args()
+
+    full = AdvancedFaceVerification()
+    full.configure_preprocessing(enabled=False)
+    adaptive = AdvancedFaceVerification()
+    adaptive.configure_preprocessing(detect_width=args.detect_width, embed_max_side=args.embed_max_side)
+    full.warm_up()
+
+    photos = [cv2.imread(path, cv2.IMREAD_COLOR) for path in args.images]
+    print(f"{'resolution':>10} | {'image':>5} | {'full ms':>8} | {'crop ms':>8} | {'full KB':>9} | {'crop KB':>8} | {'drift':>6}")
+    for width, height in RESOLUTIONS:
+        label = f"{width}x{height}"
+        embeddings = {"full": [], "crop": []}
+        for i, photo in enumerate(photos):
+            frame = cv2.resize(photo, (width, height), interpolation=cv2.INTER_LINEAR)
+            try:
+                full_emb, full_ms, full_kb = _embed(full, frame, args.repeat)
+                crop_emb, crop_ms, crop_kb = _embed(adaptive, frame, args.repeat)
+            except Exception as e:
+                print(f"{label:>10} | {i:>5} | no face: {e}")
+                continue
+            embeddings["full"].append(full_emb)
+            embeddings["crop"].append(crop_emb)
+            drift = max(0.0, AdvancedFaceVerification.cosine_distance(full_emb, crop_emb))
+            print(f"{label:>10} | {i:>5} | {full_ms:>8.1f} | {crop_ms:>8.1f} | {full_kb:>9.0f} | {crop_kb:>8.0f} | {drift:>6.4f}")
+
+        for a, b in itertools.combinations(range(len(embeddings["full"])), 2):
+            before = AdvancedFaceVerification.cosine_distance(embeddings["full"][a], embeddings["full"][b])
+            after = AdvancedFaceVerification.cosine_distance(embeddings["crop"][a], embeddings["crop"][b])
+            print(f"{'':>10}   pair {a}-{b}: match distance {before:.4f} -> {after:.4f} ({after - before:+.4f})")
+
+
+if __name__ == "__main__":
+    main()
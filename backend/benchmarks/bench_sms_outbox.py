@@ -0,0 +1,94 @@
+"""Request-side SMS cost before and after the outbox, and how fast the dispatcher drains it.
+
+Starts fake_sms_server.py in-process, then:
+"before" sends each message synchronously over HTTP, as the request handler
+used to; "after" only inserts into the outbox. Finally a dispatcher drains
+the queued messages and reports delivered messages per second, retries and
+dead letters against the fake provider's latency, failure rate and cap.
+
+Needs a MongoDB at MONGO_URI; uses (and clears) the outbox of a separate
+database. Run from backend/:
+    python -m benchmarks.bench_sms_outbox --messages 500 --rate 50 --workers 8
+    python -m benchmarks.bench_sms_outbox --failure-rate 0.1 --provider-cap 40
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from pymongo import MongoClient
+
+from fake_sms_server import FakeSmsServer
+from services.db_indexes import INDEX_REGISTRY, apply_indexes
+from services.sms_outbox import SMS_DEAD, SMS_SENT, SmsDispatcher, enqueue_sms
+from utils.sms import SmsSendError, TwilioTransport
+
+
+def _ms(samples):
+    samples = sorted(samples)
+    return f"p50 {statistics.median(samples) * 1000:.2f} ms, p95 {samples[int(len(samples) * 0.95) - 1] * 1000:.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=50, help="Dispatcher rate limit, messages per second")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Fake provider response time")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of sends answered 503")
+    parser.add_argument("--provider-cap", type=int, default=None, help="Fake provider's per-second cap (429 above it)")
+    parser.add_argument("--sync-samples", type=int, default=30, help="Synchronous sends to time for 'before'")
+    args = parser.parse_args()
+
+    server = FakeSmsServer(("127.0.0.1", 0), args.latency_ms, args.failure_rate, args.provider_cap)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    transport = TwilioTransport("ACbench", "token", "+10000000000", base_url=base_url, pool_size=args.workers)
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db"))
+    db = client["voter_auth_bench"]
+    db.sms_outbox.delete_many({})
+    apply_indexes(db, {"sms_outbox": INDEX_REGISTRY["sms_outbox"]})
+
+    before = []
+    for i in range(args.sync_samples):
+        start = time.perf_counter()
+        try:
+            transport.send("9876543210", f"Benchmark message {i}")
+        except SmsSendError:
+            pass
+        before.append(time.perf_counter() - start)
+
+    after = []
+    for i in range(args.messages):
+        start = time.perf_counter()
+        enqueue_sms(db, "9876543210", f"Benchmark message {i}", kind="bench")
+        after.append(time.perf_counter() - start)
+
+    print(f"request-side cost  before (sync send): {_ms(before)}")
+    print(f"request-side cost  after (enqueue):    {_ms(after)}")
+
+    dispatcher = SmsDispatcher(db, transport=transport, workers=args.workers, rate_per_sec=args.rate,
+                               max_attempts=5, backoff_base=0.2, backoff_max=2.0, poll_interval=0.05)
+    start = time.perf_counter()
+    dispatcher.start()
+    while db.sms_outbox.count_documents({"status": {"$nin": [SMS_SENT, SMS_DEAD]}}):
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    dispatcher.stop()
+
+    stats = dispatcher.stats()
+    sent = db.sms_outbox.count_documents({"status": SMS_SENT})
+    print(f"drained {args.messages} messages in {elapsed:.2f}s: {sent / elapsed:.1f} delivered/s "
+          f"(limit {args.rate}/s, {args.workers} workers)")
+    print(f"sent {sent}, retried {stats.get('retried', 0)}, dead {stats.get('dead', 0)}, "
+          f"batches {stats.get('batches', 0)}; provider saw {server.stats()}")
+
+    db.sms_outbox.delete_many({})
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
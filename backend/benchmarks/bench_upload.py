@@ -0,0 +1,79 @@
+"""Photo uploads per second before and after caching the Haar detector and reusing its face box.
+
+Times the CPU side of one upload: validation, then preparing the enrollment
+crop (and, with --with-embedding, the Facenet embedding itself).
+"before" rebuilds the cascade from XML for validation and detects the face a
+second time for enrollment; "after" uses the per-thread detector and crops
+with the box validation returned. GridFS writes are left out: they are the
+same on both paths.
+
+Run from backend/:
+    python -m benchmarks.bench_upload --images path/to/photos/
+    python -m benchmarks.bench_upload --with-embedding --images path/to/photos/
+"""
+import argparse
+import os
+import time
+
+import cv2
+
+from services.advanced_face_verification import AdvancedFaceVerification
+from utils.image_validator import VoterImageValidator
+
+
+def _upload_before(validator, verifier, image_bytes, with_embedding):
+    cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    result = validator.validate_image(image_bytes)
+    if not result["valid"]:
+        return False
+    image = verifier.to_bgr(image_bytes)
+    if with_embedding:
+        verifier.compute_embedding(image)
+    else:
+        verifier.prepare_for_embedding(image)
+    return True
+
+
+def _upload_after(validator, verifier, image_bytes, with_embedding):
+    result = validator.validate_image(image_bytes)
+    if not result["valid"]:
+        return False
+    image = verifier.to_bgr(image_bytes)
+    if with_embedding:
+        verifier.compute_embedding(image, face_box=result.get("face_box"))
+    else:
+        verifier.prepare_for_embedding(image, result.get("face_box"))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Directory of voter photos")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--with-embedding", action="store_true", help="Include the Facenet embedding per upload")
+    args = parser.parse_args()
+
+    images = []
+    for name in sorted(os.listdir(args.images)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(os.path.join(args.images, name), 'rb') as f:
+                images.append(f.read())
+
+    validator = VoterImageValidator()
+    verifier = AdvancedFaceVerification()
+    if args.with_embedding:
+        verifier.warm_up()
+
+    print(f"{len(images)} photos, {args.repeat} passes each")
+    for name, upload in (("before", _upload_before), ("after", _upload_after)):
+        accepted = sum(upload(validator, verifier, image, args.with_embedding) for image in images)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for image in images:
+                upload(validator, verifier, image, args.with_embedding)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>7}: {args.repeat * len(images) / elapsed:.1f} uploads/s ({accepted}/{len(images)} passed validation)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Peak memory of concurrent photo uploads as JSON/base64, multipart and raw bodies.
+
+Posts the same photos to /api/admin/upload-voter-image from --concurrency
+threads in each encoding and reports the traced Python/NumPy allocation
+peak per encoding, plus the process RSS high-water mark. Each encoding runs
+against a fresh set of voter ids in the given (throwaway) database, with
+duplicate-photo checks disabled so every upload reaches GridFS.
+
+Run from backend/ against a scratch MongoDB:
+    python -m benchmarks.bench_upload_memory --images path/to/photos/ --mongo-uri mongodb://localhost:27017/upload_bench
+"""
+import argparse
+import base64
+import io
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+from flask import Flask
+from flask_pymongo import PyMongo
+
+from routes.admin_routes import admin_bp
+
+
+def _json_request(voter_id, image_bytes):
+    image = "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode("ascii")
+    return {"json": {"voter_id": voter_id, "image": image, "allow_duplicate_photo": True}}
+
+
+def _multipart_request(voter_id, image_bytes):
+    return {
+        "data": {"voter_id": voter_id, "allow_duplicate_photo": "true", "image": (io.BytesIO(image_bytes), "photo.jpg")},
+        "content_type": "multipart/form-data"
+    }
+
+
+def _raw_request(voter_id, image_bytes):
+    return {
+        "query_string": {"voter_id": voter_id, "allow_duplicate_photo": "1"},
+        "data": image_bytes,
+        "content_type": "image/jpeg"
+    }
+
+
+def _upload_all(app, images, concurrency, build_request, prefix):
+    statuses = []
+
+    def worker(offset):
+        client = app.test_client()
+        for i in range(offset, len(images), concurrency):
+            response = client.post("/api/admin/upload-voter-image", **build_request(f"{prefix}{i:07d}", images[i]))
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Directory of compliant voter photos")
+    parser.add_argument("--mongo-uri", required=True, help="Scratch database; uploads are written to it")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=4, help="Times each photo is uploaded per encoding")
+    args = parser.parse_args()
+
+    photos = []
+    for name in sorted(os.listdir(args.images)):
+        if name.lower().endswith((".jpg", ".jpeg")):
+            with open(os.path.join(args.images, name), "rb") as f:
+                photos.append(f.read())
+    images = photos * args.repeat
+
+    app = Flask(__name__)
+    app.config["MONGO_URI"] = args.mongo_uri
+    app.mongo = PyMongo(app)
+    app.register_blueprint(admin_bp, url_prefix="/api/admin")
+
+    print(f"{len(images)} uploads of {len(photos)} photos, {args.concurrency} concurrent")
+    for name, build_request, prefix in (("json", _json_request, "JSN"), ("multipart", _multipart_request, "MPT"), ("raw", _raw_request, "RAW")):
+        tracemalloc.start()
+        start = time.perf_counter()
+        statuses = _upload_all(app, images, args.concurrency, build_request, prefix)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(
+            f"{name:>9}: traced peak {peak / 1024 / 1024:.1f}MB, RSS high-water {rss_mb:.0f}MB, "
+            f"{len(images) / elapsed:.1f} uploads/s, {statuses.count(200)}/{len(statuses)} stored"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Per-photo time of the old four-decode VoterImageValidator vs. the single-decode pipeline.
+
+The old path is reproduced inline: PIL open, then a separate cv2.imdecode +
+cvtColor for each of the orientation, blur and face checks, with the Haar
+cascade rebuilt per photo. The new path is timed in full-report and
+fail-fast mode, and its verdicts are checked against the old path.
+
+Run from backend/:
+    python -m benchmarks.bench_validator --images path/to/photos/
+    python -m benchmarks.bench_validator            # synthetic mix of passing and failing photos
+"""
+import argparse
+import io
+import os
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.image_validator import VoterImageValidator
+
+
+def old_validate(validator, image_bytes):
+    # What validate_image used to do: one PIL open plus three OpenCV decodes
+    image = Image.open(io.BytesIO(image_bytes))
+    errors = []
+    for validation in (
+        validator._validate_format(image),
+        validator._validate_file_size(image_bytes),
+        validator._validate_dimensions(image),
+    ):
+        if not validation["valid"]:
+            errors.append(validation["error"])
+    for check in ("orientation", "blur", "face"):
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if check == "orientation":
+            validation = validator._validate_orientation(gray)
+        elif check == "blur":
+            validation = validator._validate_blur(gray)
+        else:
+            # the Haar cascade used to be parsed from XML on every call
+            cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+            validation = validator._validate_face_detection(gray)
+        if not validation["valid"]:
+            errors.append(validation["error"])
+    return {"valid": not errors, "errors": errors}
+
+
+def _load_images(path):
+    images = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(os.path.join(path, name), 'rb') as f:
+                images.append(f.read())
+    return images
+
+
+def _synthetic_images(validator, count):
+    # Right-size photos plus oversized and undersized ones, so fail-fast has something to skip
+    rng = np.random.default_rng(0)
+    sizes = [(validator.REQUIRED_WIDTH_PX, validator.REQUIRED_HEIGHT_PX), (1280, 960), (200, 150)]
+    images = []
+    for i in range(count):
+        w, h = sizes[i % len(sizes)]
+        frame = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (21, 21), 0)
+        images.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return images
+
+
+def _time(fn, images, repeat):
+    results = [fn(image) for image in images]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for image in images:
+            fn(image)
+    return (time.perf_counter() - start) * 1000.0 / (repeat * len(images)), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory of sample photos")
+    parser.add_argument("--count", type=int, default=30, help="Synthetic photos when --images is not given")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    validator = VoterImageValidator()
+    images = _load_images(args.images) if args.images else _synthetic_images(validator, args.count)
+    print(f"{len(images)} photos, {args.repeat} passes each")
+
+    old_ms, old_results = _time(lambda b: old_validate(validator, b), images, args.repeat)
+    full_ms, full_results = _time(lambda b: validator.validate_image(b), images, args.repeat)
+    fast_ms, fast_results = _time(lambda b: validator.validate_image(b, fail_fast=True), images, args.repeat)
+
+    print(f"{'path':>10} | {'ms/photo':>9} | {'photos/s':>9}")
+    for name, ms in (("old", old_ms), ("full", full_ms), ("fail-fast", fast_ms)):
+        print(f"{name:>10} | {ms:>9.2f} | {1000.0 / ms:>9.1f}")
+
+    disagree = sum(
+        old["valid"] != full["valid"] or full["valid"] != fast["valid"]
+        for old, full, fast in zip(old_results, full_results, fast_results)
+    )
+    print(f"verdict mismatches vs. old validator: {disagree}/{len(images)}")
+
+
+if __name__ == "__main__":
+    main()
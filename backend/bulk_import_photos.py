@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import argparse
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from services.bulk_import import BulkPhotoImport, PhotoSource
+
+# --- Configuration ---
+# Uses the same MONGO_URI as the Flask app (.env is loaded below)
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db")
+DB_NAME = "voter_auth_db"
+
+
+def bulk_import_photos(source_path, job_id=None, workers=None, batch_size=100, full_report=False):
+    """Validates and stores a zip or directory of <voter_id>.jpg photos, printing NDJSON per photo."""
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database(DB_NAME)
+    source = PhotoSource(source_path)
+    job = BulkPhotoImport(db, source, job_id=job_id, workers=workers, batch_size=batch_size, fail_fast=not full_report)
+
+    print(f"--- Bulk photo import: {len(source.names)} photos, job {job.job_id} ---", file=sys.stderr)
+    try:
+        for line in job.run():
+            print(json.dumps(line, default=str), flush=True)
+    except KeyboardInterrupt:
+        print(f"Interrupted. Resume with: --job-id {job.job_id}", file=sys.stderr)
+    finally:
+        source.close()
+        client.close()
+    print("Run backfill_face_templates.py to precompute embeddings for the new photos.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-validate and store voter photos named <voter_id>.jpg")
+    parser.add_argument("source", help="Zip archive or directory of photos")
+    parser.add_argument("--job-id", help="Resume an earlier job from its checkpoint")
+    parser.add_argument("--workers", type=int, default=0, help="Validation processes (default: CPUs - 1)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Photos stored per GridFS batch")
+    parser.add_argument("--full-report", action="store_true", help="Run every check instead of stopping at the first failure")
+    args = parser.parse_args()
+    bulk_import_photos(args.source, args.job_id, args.workers or None, args.batch_size, args.full_report)
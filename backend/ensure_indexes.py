@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import argparse
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from services.db_indexes import IndexCheckError, apply_indexes, check_query_plans
+
+# --- Configuration ---
+# Uses the same MONGO_URI as the Flask app (.env is loaded below)
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db")
+DB_NAME = "voter_auth_db"
+
+
+def ensure_indexes(check_only=False, skip_check=False):
+    """Creates every registered index and verifies no route query shape is a COLLSCAN. Returns an exit code."""
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database(DB_NAME)
+    try:
+        failed = []
+        if not check_only:
+            failed = apply_indexes(db)["failed"]
+            for failure in failed:
+                print(json.dumps(failure, default=str), file=sys.stderr)
+        if not skip_check:
+            for plan in check_query_plans(db):
+                print(f"   {plan['shape']:<36} {' > '.join(plan['stages'])}")
+        return 1 if failed else 0
+    except IndexCheckError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the database indexes the API relies on and verify query plans")
+    parser.add_argument("--check-only", action="store_true", help="Only run the explain() check")
+    parser.add_argument("--skip-check", action="store_true", help="Only create indexes")
+    args = parser.parse_args()
+    sys.exit(ensure_indexes(args.check_only, args.skip_check))
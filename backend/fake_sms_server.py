@@ -0,0 +1,100 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Stand-in for Twilio's Messages endpoint, for load-testing the SMS dispatcher:
+#   python fake_sms_server.py --port 8099 --latency-ms 150 --rate-limit 10 --failure-rate 0.05
+# then start the backend with SMS_API_BASE_URL=http://127.0.0.1:8099 and any
+# TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN / TWILIO_PHONE_NUMBER values.
+
+
+class FakeSmsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=100, failure_rate=0.0, rate_limit=None, quiet=True):
+        super().__init__(address, FakeSmsHandler)
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.counts = {"accepted": 0, "failed": 0, "throttled": 0}
+
+    def admit(self):
+        """Count a request against the per-second cap; False means answer 429"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start, self.window_count = now, 0
+            self.window_count += 1
+            return self.rate_limit is None or self.window_count <= self.rate_limit
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class FakeSmsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the real API allows
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        time.sleep(self.server.latency_ms / 1000 * random.uniform(0.5, 1.5))
+
+        if not self.server.admit():
+            self.server.count("throttled")
+            return self._reply(429, {"code": 20429, "message": "Too Many Requests"})
+        if random.random() < self.server.failure_rate:
+            self.server.count("failed")
+            return self._reply(503, {"code": 20503, "message": "Service Unavailable"})
+        if not form.get("To") or not form.get("Body"):
+            return self._reply(400, {"code": 21604, "message": "A 'To' phone number and a 'Body' are required."})
+
+        self.server.count("accepted")
+        self._reply(201, {"sid": "SM" + uuid.uuid4().hex, "to": form["To"][0], "status": "queued"})
+
+    def do_GET(self):
+        self._reply(200, self.server.stats())
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake SMS provider for load-testing the SMS dispatcher")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=100, help="Mean response time per message")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered 503")
+    parser.add_argument("--rate-limit", type=int, default=None, help="Messages per second before answering 429")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = FakeSmsServer((args.host, args.port), args.latency_ms, args.failure_rate, args.rate_limit, quiet=not args.verbose)
+    print(f"[INFO] Fake SMS server on http://{args.host}:{args.port} (GET / for counts)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"[INFO] {server.stats()}")
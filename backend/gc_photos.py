@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import argparse
+from datetime import timedelta
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from services.db_indexes import apply_indexes
+from services.photo_store import PhotoStore
+
+# --- Configuration ---
+# Uses the same MONGO_URI as the Flask app (.env is loaded below)
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db")
+DB_NAME = "voter_auth_db"
+
+
+def gc_photos(grace_hours=1.0, include_legacy=False, dry_run=True):
+    """Deletes GridFS photos that no voter points at, current or in history."""
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database(DB_NAME)
+    try:
+        apply_indexes(db)
+        result = PhotoStore(db).collect_garbage(
+            grace=timedelta(hours=grace_hours), include_legacy=include_legacy, dry_run=dry_run
+        )
+        print(json.dumps(result, indent=2))
+        if dry_run and result["garbage"]:
+            print("Dry run: nothing deleted. Re-run with --delete to remove these files.", file=sys.stderr)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Garbage-collect voter photos that are no longer referenced")
+    parser.add_argument("--delete", action="store_true", help="Actually delete (default is a dry run)")
+    parser.add_argument("--grace-hours", type=float, default=1.0, help="Never touch files younger than this")
+    parser.add_argument("--include-legacy", action="store_true",
+                        help="Also consider files stored before content addressing (no sha256)")
+    args = parser.parse_args()
+    gc_photos(args.grace_hours, args.include_legacy, dry_run=not args.delete)
@@ -1,5 +1,9 @@
-from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from datetime import datetime, timedelta
+import json
+import os
+import tempfile
+import zipfile
 from bson import ObjectId
 import gridfs
 import base64
@@ -7,19 +11,33 @@ import base64
 # Import validation functions and image validator
 from utils.validation import validate_voter_id, validate_aadhaar, validate_indian_phone, calculate_age   
 from utils.image_validator import VoterImageValidator
+from utils.gridfs_response import IMMUTABLE_MAX_AGE, send_grid_file
+from utils.upload_stream import UploadTooLarge, photo_bytes, read_photo_upload
+from utils.request_limits import NORMALIZE_REQUEST_MAX_BYTES, limit_request_body, normalize_requested
+from services.face_enrollment import enroll_photo, embed_image_bytes, get_face_template
+from services.face_index import DUPLICATE_THRESHOLD, FACE_SEARCH_MAX_K, get_face_index, record_duplicate_anomalies
+from services.thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, get_thumbnail_store
+from services.photo_store import PhotoStore
+from services.bulk_import import BulkPhotoImport, PhotoSource
+from services.photo_hash_index import (
+    PHOTO_DUPLICATE_THRESHOLD, find_reused_photo, get_photo_hash_index,
+    record_duplicate_photo_anomalies, store_photo_hash
+)
 
 admin_bp = Blueprint('admin_bp', __name__)   
 
 @admin_bp.route('/voters', methods=['GET', 'POST'])
+@limit_request_body()
 def manage_voters():
     mongo = current_app.mongo
     if request.method == 'POST':
-        data = request.json
+        # JSON with a base64 image, or multipart/raw with the photo streamed as bytes
+        try:
+            data, image_data = read_photo_upload()
+        except UploadTooLarge as e:
+            return jsonify({"error": "Image validation failed", "details": [str(e)]}), 400
         errors = []
 
-        # Extract image data if provided
-        image_data = data.pop('image', None)
-
         # Validation
         if not validate_voter_id(data.get('voter_id', '')):
             errors.append("Invalid Voter ID format (must be ABC1234567).")
@@ -48,6 +66,7 @@ def manage_voters():
 
         # Image validation and processing
         image_id = None
+        face_template = None
         if image_data:
             try:
                 # Validate image
@@ -62,19 +81,25 @@ def manage_voters():
                     }), 400
                 
                 # Process and store image
-                if image_data.startswith('data:image'):
-                    image_data = image_data.split(',')[1]
+                image_bytes = photo_bytes(image_data)
                 
-                image_bytes = base64.b64decode(image_data)
+                # The same photo (or a recompressed copy) must not be enrolled for another voter
+                photo_hash, reused = find_reused_photo(mongo.db, image_bytes, data['voter_id'].upper())
+                if reused and not data.get('allow_duplicate_photo'):
+                    return jsonify({
+                        "error": "This photo is already enrolled for another voter",
+                        "duplicate_of": _with_voter_details(mongo.db, reused[:5])
+                    }), 409
                 
-                # Store in GridFS
-                fs = gridfs.GridFS(mongo.db)
-                image_id = fs.put(
-                    image_bytes,
-                    filename=f"voter_photo_{data['voter_id'].upper()}",
-                    content_type="image/jpeg",
-                    voter_id=data['voter_id'].upper(),
-                    upload_date=datetime.utcnow()
+                # Store in GridFS (content-addressed: an identical photo is not written twice)
+                image_id, created = PhotoStore(mongo.db).store_voter_photo(
+                    image_bytes, data['voter_id'].upper(), face_box=validation_result.get("face_box")
+                )
+                if created:
+                    store_photo_hash(mongo.db, image_id, data['voter_id'].upper(), photo_hash)
+                face_template = enroll_photo(
+                    mongo.db, image_bytes, image_id, voter_id=data['voter_id'].upper(),
+                    face_box=validation_result.get("face_box"), reuse_existing=not created
                 )
                 
             except Exception as e:
@@ -96,7 +121,8 @@ def manage_voters():
             "age": calculate_age(data['date_of_birth']), 
             "created_at": datetime.utcnow(),
             "has_voted": False,
-            "image_id": str(image_id) if image_id else None  # Store image reference
+            "image_id": str(image_id) if image_id else None,  # Store image reference
+            "face_template": face_template  # Precomputed embedding used at authentication
         }
         
         result = mongo.db.voters.insert_one(new_voter_data)     
@@ -107,20 +133,25 @@ def manage_voters():
         }), 201
 
     # GET request - Return all voters
-    voters = list(mongo.db.voters.find().sort("created_at", -1))
+    voters = list(mongo.db.voters.find({}, {"face_template": 0}).sort("created_at", -1))
     for voter in voters:
         voter['_id'] = str(voter['_id'])     
+        # Cacheable binary URL, so list screens do not re-download photos on every render
+        voter['image_url'] = f"/api/admin/images/{voter['image_id']}" if voter.get('image_id') else None
+        voter['thumbnail_url'] = f"/api/admin/images/{voter['image_id']}/thumbnail" if voter.get('image_id') else None
     return jsonify(voters)
 
 @admin_bp.route('/add-voter', methods=['POST'])
+@limit_request_body()
 def add_voter():
     """Dedicated endpoint for adding voters (alternative to the combined endpoint above)"""
     mongo = current_app.mongo
-    data = request.json
+    # JSON with a base64 image, or multipart/raw with the photo streamed as bytes
+    try:
+        data, image_data = read_photo_upload()
+    except UploadTooLarge as e:
+        return jsonify({"error": "Validation failed", "details": [str(e)]}), 400
     errors = []
-
-    # Extract image data if provided
-    image_data = data.pop('image', None)
     
     # Validate required fields
     required_fields = ['voter_id', 'aadhar_number', 'phone_number', 'full_name', 'date_of_birth', 'address', 'constituency', 'polling_station']
@@ -153,8 +184,6 @@ def add_voter():
     # Add default values
     data['has_voted'] = False
     data['voting_timestamp'] = None
-    data['otp_code'] = None
-    data['otp_expires_at'] = None
     data['voter_id'] = data['voter_id'].upper()
     data['age'] = calculate_age(data['date_of_birth'])
     data['created_at'] = datetime.utcnow()
@@ -172,24 +201,29 @@ def add_voter():
             
             if validation_result["valid"]:
                 # Store image
-                if image_data.startswith('data:image'):
-                    image_data = image_data.split(',')[1]
+                image_bytes = photo_bytes(image_data)
                 
-                image_bytes = base64.b64decode(image_data)
+                photo_hash, reused = find_reused_photo(mongo.db, image_bytes, data['voter_id'])
+                if reused and not data.get('allow_duplicate_photo'):
+                    return jsonify({
+                        "success": True,
+                        "voter_id": voter_id,
+                        "image_uploaded": False,
+                        "image_errors": ["This photo is already enrolled for another voter"],
+                        "duplicate_of": _with_voter_details(mongo.db, reused[:5]),
+                        "message": "Voter added but photo is a duplicate"
+                    })
                 
-                fs = gridfs.GridFS(mongo.db)
-                image_id = fs.put(
-                    image_bytes,
-                    filename=f"voter_photo_{data['voter_id']}",
-                    content_type="image/jpeg",
-                    voter_id=data['voter_id'],
-                    upload_date=datetime.utcnow()
+                # Stores the photo (once per content) and points the voter's image_id at it
+                image_id, created = PhotoStore(mongo.db).store_voter_photo(
+                    image_bytes, data['voter_id'], face_box=validation_result.get("face_box")
                 )
-                
-                # Update voter with image_id
-                mongo.db.voters.update_one(
-                    {"_id": result.inserted_id},
-                    {"$set": {"image_id": str(image_id)}}
+                if created:
+                    store_photo_hash(mongo.db, image_id, data['voter_id'], photo_hash)
+                enroll_photo(
+                    mongo.db, image_bytes, image_id, {"_id": result.inserted_id},
+                    voter_id=data['voter_id'], face_box=validation_result.get("face_box"),
+                    reuse_existing=not created
                 )
                 
                 return jsonify({
@@ -256,12 +290,70 @@ def get_voter_image(voter_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@admin_bp.route('/voters/<voter_id>/image/raw', methods=['GET'])
+def get_voter_image_raw(voter_id):
+    """Voter's photo as binary, streamed from GridFS (revalidated through its ETag)"""
+    try:
+        voter = current_app.mongo.db.voters.find_one({"_id": ObjectId(voter_id)}, {"image_id": 1})
+        if not voter or not voter.get('image_id'):
+            return jsonify({"error": "Image not found"}), 404
+        return _send_image(voter['image_id'], immutable=False)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route('/images/<image_id>', methods=['GET'])
+def get_image(image_id):
+    """A stored photo by its image_id, as binary; the content behind an id never changes"""
+    try:
+        return _send_image(image_id, immutable=True)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route('/images/<image_id>/thumbnail', methods=['GET'])
+def get_image_thumbnail(image_id):
+    """Small preview of a stored photo for list screens (?size=64|160, ?format=webp|jpeg)"""
+    try:
+        size = request.args.get('size', default=THUMBNAIL_SIZES[0], type=int)
+        fmt = request.args.get('format')
+        if fmt is None:
+            fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+        if size not in THUMBNAIL_SIZES or fmt not in THUMBNAIL_FORMATS:
+            return jsonify({"error": f"Thumbnail sizes are {list(THUMBNAIL_SIZES)}, formats {list(THUMBNAIL_FORMATS)}"}), 400
+        
+        try:
+            data = get_thumbnail_store(current_app.mongo.db).get(image_id, size, fmt)
+        except gridfs.NoFile:
+            return jsonify({"error": "Image file not found in storage"}), 404
+        
+        response = Response(data, mimetype=THUMBNAIL_FORMATS[fmt][1])
+        response.set_etag(f"{image_id}-{size}-{fmt}")
+        response.cache_control.private = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        if 'format' not in request.args:
+            response.vary.add('Accept')
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _send_image(image_id, immutable):
+    fs = gridfs.GridFS(current_app.mongo.db)
+    try:
+        image_file = fs.get(ObjectId(image_id))
+    except gridfs.NoFile:
+        return jsonify({"error": "Image file not found in storage"}), 404
+    return send_grid_file(image_file, immutable=immutable)
+
 @admin_bp.route('/upload-voter-image', methods=['POST'])
+@limit_request_body(normalize_max_bytes=NORMALIZE_REQUEST_MAX_BYTES)
 def upload_voter_image():
     """Standalone image upload endpoint"""
     try:
-        data = request.json
-        image_data = data.get('image')
+        # JSON with a base64 image, multipart/form-data, or a raw image/jpeg|png body (?voter_id=...)
+        try:
+            data, image_data = read_photo_upload(normalize_max_bytes=NORMALIZE_REQUEST_MAX_BYTES)
+        except UploadTooLarge as e:
+            return jsonify({"success": False, "errors": [str(e)]}), 400
         voter_id = data.get('voter_id')
         
         if not image_data or not voter_id:
@@ -270,38 +362,58 @@ def upload_voter_image():
         # Initialize validator
         validator = VoterImageValidator()
         
-        # Validate image
-        validation_result = validator.validate_image(image_data)
+        # Normalize mode: crop, resize and re-encode the photo server-side instead of rejecting it
+        normalized = {}
+        if normalize_requested(data):
+            try:
+                normalized_bytes, normalization = validator.normalize_image(image_data)
+            except Exception as e:
+                return jsonify({"success": False, "errors": [f"Could not normalize image: {e}"]}), 400
+            image_data = 'data:image/jpeg;base64,' + base64.b64encode(normalized_bytes).decode('ascii')
+            normalized = {"normalized_image": image_data, "normalization": normalization}
+        
+        # Validate image; fail_fast stops at the first failing check instead of reporting all
+        validation_result = validator.validate_image(image_data, fail_fast=bool(data.get('fail_fast')))
+        if normalized:
+            normalized["validation"] = {"valid": validation_result["valid"], "checks": validation_result.get("checks", [])}
         
         if not validation_result["valid"]:
             return jsonify({
                 "success": False, 
-                "errors": validation_result.get("errors", [validation_result.get("error")])
+                "errors": validation_result.get("errors", [validation_result.get("error")]),
+                **normalized
             }), 400
         
         # Extract image bytes
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
+        image_bytes = photo_bytes(image_data)
         
-        image_bytes = base64.b64decode(image_data)
-        
-        # Store in GridFS
         mongo = current_app.mongo
-        fs = gridfs.GridFS(mongo.db)
+        photo_hash, reused = find_reused_photo(mongo.db, image_bytes, voter_id)
+        if reused and not data.get('allow_duplicate_photo'):
+            return jsonify({
+                "success": False,
+                "errors": ["This photo is already enrolled for another voter"],
+                "duplicate_of": _with_voter_details(mongo.db, reused[:5]),
+                **normalized
+            }), 409
         
-        # Store image
-        image_id = fs.put(
-            image_bytes,
-            filename=f"voter_photo_{voter_id}",
-            content_type="image/jpeg",
-            voter_id=voter_id,
-            upload_date=datetime.utcnow()
+        # Store in GridFS (content-addressed) and make it the voter's current photo
+        image_id, created = PhotoStore(mongo.db).store_voter_photo(
+            image_bytes, voter_id, face_box=validation_result.get("face_box")
+        )
+        if created:
+            store_photo_hash(mongo.db, image_id, voter_id, photo_hash)
+        face_template = enroll_photo(
+            mongo.db, image_bytes, image_id, voter_id=voter_id, face_box=validation_result.get("face_box"),
+            reuse_existing=not created
         )
         
         return jsonify({
             "success": True,
             "image_id": str(image_id),
-            "message": "Image uploaded and validated successfully"
+            "face_embedding_stored": face_template is not None,
+            "message": "Image uploaded and validated successfully",
+            **normalized
         })
         
     except Exception as e:
@@ -317,11 +429,10 @@ def delete_voter(voter_id):
     if not voter:
         return jsonify({"error": "Voter not found"}), 404
     
-    # Delete associated image if it exists
+    # Delete the voter's photos, current and superseded, unless another voter shares the content
     if voter.get('image_id'):
         try:
-            fs = gridfs.GridFS(mongo.db)
-            fs.delete(ObjectId(voter['image_id']))
+            PhotoStore(mongo.db).release_voter(voter['voter_id'], voter['image_id'])
         except Exception as e:
             print(f"Warning: Could not delete image {voter['image_id']}: {e}")
     
@@ -335,6 +446,174 @@ def delete_voter(voter_id):
         "image_deleted": voter.get('image_id') is not None
     })
 
+def _search_k(value):
+    """A face search's k as an int clamped to 1..FACE_SEARCH_MAX_K; ValueError if it is not a number"""
+    if isinstance(value, bool):
+        raise ValueError("k must be an integer")
+    return min(max(int(value), 1), FACE_SEARCH_MAX_K)
+
+def _with_voter_details(db, matches):
+    """Attach name/booth details to face index matches"""
+    voters = {
+        v['voter_id']: v
+        for v in db.voters.find(
+            {"voter_id": {"$in": [m['voter_id'] for m in matches]}},
+            {"voter_id": 1, "full_name": 1, "polling_station": 1}
+        )
+    }
+    for match in matches:
+        voter = voters.get(match['voter_id'])
+        match['voter'] = {
+            "_id": str(voter['_id']),
+            "full_name": voter.get('full_name'),
+            "polling_station": voter.get('polling_station')
+        } if voter else None
+    return matches
+
+@admin_bp.route('/voters/<voter_id>/similar-faces', methods=['GET'])
+def similar_faces(voter_id):
+    """k enrolled voters whose photos are closest to this voter's photo"""
+    mongo = current_app.mongo
+    voter = mongo.db.voters.find_one({"_id": ObjectId(voter_id)})
+    if not voter:
+        return jsonify({"error": "Voter not found"}), 404
+
+    face_template = get_face_template(mongo.db, voter)
+    if not face_template:
+        return jsonify({"error": "No face embedding stored for this voter"}), 404
+
+    try:
+        k = _search_k(request.args.get('k', 5))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    matches = get_face_index(mongo.db).search(face_template['embedding'], k=k, exclude_label=voter['voter_id'])
+    return jsonify({"voter_id": voter['voter_id'], "matches": _with_voter_details(mongo.db, matches)})
+
+@admin_bp.route('/face-search', methods=['POST'])
+@limit_request_body()
+def face_search():
+    """k enrolled voters whose photos are closest to an uploaded image"""
+    data = request.get_json(silent=True) or {}
+    image_data = data.get('image')
+    if not image_data or not isinstance(image_data, str):
+        return jsonify({"error": "Image data is required"}), 400
+    try:
+        k = _search_k(data.get('k', 5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be an integer"}), 400
+
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    try:
+        representation = embed_image_bytes(base64.b64decode(image_data))
+    except Exception as e:
+        return jsonify({"error": f"Face not detected: {str(e)}"}), 400
+
+    mongo = current_app.mongo
+    matches = get_face_index(mongo.db).search(representation['embedding'], k=k)
+    return jsonify({"matches": _with_voter_details(mongo.db, matches)})
+
+@admin_bp.route('/face-duplicates/scan', methods=['POST'])
+def scan_face_duplicates():
+    """Scan the whole roll for one face enrolled under several voter IDs"""
+    mongo = current_app.mongo
+    threshold = float((request.get_json(silent=True) or {}).get('threshold', DUPLICATE_THRESHOLD))
+
+    index = get_face_index(mongo.db)
+    pairs = index.find_duplicates(threshold=threshold)
+    recorded = record_duplicate_anomalies(mongo.db, pairs, threshold)
+    return jsonify({
+        "status": "scan_complete",
+        "index": index.stats(),
+        "duplicates_found": recorded,
+        "pairs": pairs[:100]
+    })
+
+@admin_bp.route('/photo-duplicates/scan', methods=['POST'])
+def scan_photo_duplicates():
+    """Scan the whole roll for the same photo file enrolled under several voter IDs"""
+    mongo = current_app.mongo
+    threshold = int((request.get_json(silent=True) or {}).get('threshold', PHOTO_DUPLICATE_THRESHOLD))
+
+    index = get_photo_hash_index(mongo.db)
+    pairs = index.find_duplicates(threshold=threshold)
+    recorded = record_duplicate_photo_anomalies(mongo.db, pairs)
+    return jsonify({
+        "status": "scan_complete",
+        "index": index.stats(),
+        "duplicates_found": recorded,
+        "pairs": pairs[:100]
+    })
+
+@admin_bp.route('/photo-store/gc', methods=['POST'])
+def collect_photo_garbage():
+    """Delete stored photos no voter points at any more (dry run unless "delete": true)"""
+    options = request.get_json(silent=True) or {}
+    result = PhotoStore(current_app.mongo.db).collect_garbage(
+        grace=timedelta(hours=float(options.get('grace_hours', 1))),
+        include_legacy=bool(options.get('include_legacy')),
+        dry_run=not options.get('delete')
+    )
+    return jsonify({"status": "gc_complete", **result})
+
+@admin_bp.route('/bulk-upload-voter-images', methods=['POST'])
+def bulk_upload_voter_images():
+    """Validate and store a batch of photos named <voter_id>.jpg, streaming NDJSON results.
+
+    Send a zip as multipart field 'archive', or JSON {"directory": "..."} for a
+    folder under BULK_IMPORT_ROOT on the server (disabled when that is not
+    set). Pass the returned job_id again to resume an interrupted job.
+    """
+    params = request.form if request.files else (request.get_json(silent=True) or {})
+    archive_path = None
+    if 'archive' in request.files:
+        # The upload is spooled to disk: the results stream outlives the request's file handle
+        with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp:
+            request.files['archive'].save(tmp)
+        source_ref = archive_path = tmp.name
+    elif params.get('directory'):
+        import_root = os.getenv("BULK_IMPORT_ROOT")
+        if not import_root:
+            return jsonify({"error": "Server-side directory imports are disabled (BULK_IMPORT_ROOT is not set)"}), 403
+        import_root = os.path.realpath(import_root)
+        source_ref = os.path.realpath(os.path.join(import_root, params['directory']))
+        if os.path.commonpath([import_root, source_ref]) != import_root:
+            return jsonify({"error": "Directory must be inside the configured import root"}), 403
+        if not os.path.isdir(source_ref):
+            return jsonify({"error": "Directory not found on server"}), 400
+    else:
+        return jsonify({"error": "Provide a zip file as 'archive' or a 'directory' path"}), 400
+
+    try:
+        source = PhotoSource(source_ref)
+    except zipfile.BadZipFile:
+        os.remove(archive_path)
+        return jsonify({"error": "Archive is not a valid zip file"}), 400
+
+    job = BulkPhotoImport(
+        current_app.mongo.db,
+        source,
+        job_id=params.get('job_id'),
+        workers=params.get('workers') or os.getenv("BULK_IMPORT_WORKERS"),
+        batch_size=int(params.get('batch_size', 100)),
+        # fail-fast by default: a rejected photo only needs its first error in a bulk report
+        fail_fast=str(params.get('full_report', '')).lower() not in ('1', 'true')
+    )
+
+    def generate():
+        try:
+            for line in job.run():
+                yield json.dumps(line, default=str) + "\n"
+        except Exception as e:
+            print(f"[ERROR] Bulk photo import {job.job_id} stopped: {e}")
+            yield json.dumps({"job_id": job.job_id, "status": "failed", "error": str(e)}) + "\n"
+        finally:
+            source.close()
+            if archive_path:
+                os.remove(archive_path)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @admin_bp.route('/booths', methods=['GET', 'POST'])
 def manage_booths():
     """Manage polling booths"""
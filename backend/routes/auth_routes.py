@@ -1,15 +1,45 @@
 from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime, timedelta
-import random
-import base64
+from datetime import datetime
 from bson import ObjectId
 import gridfs
 from utils.validation import calculate_age
-from utils.sms import send_sms
-from services.advanced_face_verification import AdvancedFaceVerification
+from services.advanced_face_verification import get_verifier
+from services.verification_pool import VerificationPoolBusy
+from services.face_enrollment import enroll_photo, get_face_template
+from services.enrollment_cache import get_enrollment_cache
+from services.sms_outbox import enqueue_sms
+from services.otp_store import (
+    OTP_EXPIRED, OTP_LOCKED, OTP_MISSING, OTP_TTL, OTP_VERIFIED, get_otp_store
+)
+from utils.latency import REGISTRY as LATENCY, span
 
 auth_bp = Blueprint('auth_bp', __name__)
 
+def _run_face_verification(method, *args):
+    """Run a verifier method in the worker pool when configured, else in-process"""
+    pool = getattr(current_app, 'verification_pool', None)
+    if pool is not None:
+        result = pool.run(method, *args)
+        # Spans recorded inside a worker process land in that process's registry
+        LATENCY.observe_all(result.get('timings'))
+        return result
+    return getattr(get_verifier(), method)(*args)
+
+def _attach_timings(face_result, route_timings, debug):
+    """Per-request stage timings go into detailed_scores only when debug is requested"""
+    timings = dict(face_result.pop('timings', None) or {}, **route_timings)
+    if debug:
+        face_result['detailed_scores'] = dict(face_result.get('detailed_scores') or {}, timings=timings)
+    return face_result
+
+def _busy_response(e):
+    response = jsonify({
+        "error": "Face verification is busy. Please retry shortly.",
+        "retry_after": e.retry_after
+    })
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
 @auth_bp.route('/authenticate', methods=['POST'])
 def authenticate_voter():
     data = request.json
@@ -36,28 +66,63 @@ def authenticate_voter():
         return jsonify({"error": "Voter is not eligible to vote (under 18)."}), 403
 
     if voter.get('has_voted'):
+        voter.pop('face_template', None)
         voter['_id'] = str(voter['_id'])
         return jsonify({"status": "already_voted", "voter": voter}), 200
 
-    # Perform face verification if live_image_data is provided
-    if data.get('live_image_data'):
+    # Perform face verification if a live image or a burst of live frames is provided
+    live_frames = data.get('live_frames')
+    if live_frames is not None and not isinstance(live_frames, list):
+        return jsonify({"error": "live_frames must be a list of images"}), 400
+    if data.get('live_image_data') or live_frames:
         if not voter.get('image_id'):
             return jsonify({"error": "No stored photo found for this voter. Please contact admin."}), 400
         
+        route_timings = {}
         try:
-            fs = gridfs.GridFS(mongo.db)
-            stored_image_file = fs.get(ObjectId(voter['image_id']))
-            
-            # Convert stored image to base64 data URL for comparison
-            stored_image_bytes = stored_image_file.read()
-            stored_image_base64 = base64.b64encode(stored_image_bytes).decode('utf-8')
-            stored_image_data_url = f"data:image/jpeg;base64,{stored_image_base64}"
-            
-            # Perform face verification
-            verifier = AdvancedFaceVerification()
-            # Create a temporary URL-like string that the verifier can use
-            # We'll modify the verifier to handle base64 data URLs directly
-            face_result = verifier.comprehensive_verification(stored_image_data_url, data['live_image_data'])
+            with span('auth_face_total', route_timings):
+                with span('template_lookup', route_timings):
+                    face_template = get_face_template(mongo.db, voter)
+
+                stored_reference = None
+                if not face_template:
+                    # Retries for the same photo are served from the worker's enrollment cache
+                    enrollment_cache = get_enrollment_cache()
+                    cached = enrollment_cache.get(voter['image_id'])
+                    if cached is not None:
+                        face_template, stored_reference = cached["template"], cached["reference"]
+                    else:
+                        # No precomputed embedding yet: read the stored photo once and enroll it
+                        with span('gridfs_read', route_timings):
+                            fs = gridfs.GridFS(mongo.db)
+                            stored_file = fs.get(ObjectId(voter['image_id']))
+                            stored_image_bytes = stored_file.read()
+                        with span('enrollment', route_timings):
+                            # face_box was saved with the photo at upload, so no second detection pass
+                            face_box = getattr(stored_file, 'face_box', None)
+                            face_template = enroll_photo(
+                                mongo.db, stored_image_bytes, voter['image_id'], {"_id": voter['_id']},
+                                voter_id=voter['voter_id'], face_box=face_box
+                            )
+                        if face_template:
+                            enrollment_cache.put_template(voter['image_id'], face_template)
+                        else:
+                            with span('reference_decode', route_timings):
+                                stored_reference = enrollment_cache.put_reference(
+                                    stored_image_bytes, voter['image_id'], face_box
+                                )
+
+                if face_template:
+                    # Only the live frame is embedded; the stored photo is never re-processed
+                    face_result = _run_face_verification(
+                        'verify_against_template', face_template, data.get('live_image_data'), live_frames
+                    )
+                else:
+                    # Embedding the stored photo failed; fall back to full pairwise comparison on the decoded photo
+                    face_result = _run_face_verification(
+                        'verify_images', stored_reference, data.get('live_image_data'), live_frames
+                    )
+            face_result = _attach_timings(face_result, route_timings, data.get('debug'))
             
             if not face_result.get('match', False):
                 return jsonify({
@@ -66,46 +131,53 @@ def authenticate_voter():
                     "detailed_scores": face_result.get('detailed_scores')
                 }), 403
             
+        except VerificationPoolBusy as e:
+            return _busy_response(e)
         except Exception as e:
             print(f"Face verification error: {e}")
             return jsonify({"error": f"Face verification failed: {str(e)}"}), 500
 
-    otp = str(random.randint(100000, 999999))
-    expires_at = datetime.utcnow() + timedelta(minutes=5)
+    # Only the OTP's hash is stored, in its own collection; the voter document is not written
+    otp = get_otp_store(mongo.db).issue(voter['_id'])
 
-    mongo.db.voters.update_one(
-        {"_id": voter['_id']},
-        {"$set": {"otp_code": otp, "otp_expires_at": expires_at}}
-    )
-
-    send_sms(
+    # Delivered by the background SMS dispatcher; an OTP that expires undelivered is not sent
+    enqueue_sms(
+        mongo.db,
         voter['phone_number'],
-        f"Your Voter Authentication OTP is {otp}. It is valid for 5 minutes."
+        f"Your Voter Authentication OTP is {otp}. It is valid for {int(OTP_TTL.total_seconds() // 60)} minutes.",
+        kind="otp",
+        expires_at=datetime.utcnow() + OTP_TTL
     )
 
-    return jsonify({
+    response = {
         "status": "otp_sent",
         "voter_id": str(voter['_id']),
         "message": f"OTP sent to mobile ending in ******{voter['phone_number'][-4:]}",
         "otp_for_testing": otp
-    })
+    }
+    if data.get('debug') and (data.get('live_image_data') or live_frames):
+        response["detailed_scores"] = face_result.get('detailed_scores')
+    return jsonify(response)
 @auth_bp.route('/verify-otp', methods=['POST'])
 def verify_otp():
     data = request.json
     mongo = current_app.mongo
     
-    voter = mongo.db.voters.find_one({"_id": ObjectId(data['voter_id'])})
+    voter_oid = ObjectId(data['voter_id'])
 
-    if not voter or 'otp_code' not in voter:
+    outcome = get_otp_store(mongo.db).verify(voter_oid, str(data['otp']))
+    if outcome == OTP_MISSING:
         return jsonify({"error": "Invalid request or session."}), 400
-
-    if datetime.utcnow() > voter.get('otp_expires_at', datetime.min):
+    if outcome == OTP_EXPIRED:
         return jsonify({"error": "OTP has expired. Please try again."}), 410
-
-    if data['otp'] != voter['otp_code']:
+    if outcome == OTP_LOCKED:
+        return jsonify({"error": "Too many invalid OTP attempts. Please authenticate again."}), 429
+    if outcome != OTP_VERIFIED:
         return jsonify({"error": "Invalid OTP provided."}), 400
 
-    mongo.db.voters.update_one({"_id": voter['_id']}, {"$unset": {"otp_code": "", "otp_expires_at": ""}})
+    voter = mongo.db.voters.find_one({"_id": voter_oid}, {"face_template": 0})
+    if not voter:
+        return jsonify({"error": "Invalid request or session."}), 400
 
     voter['_id'] = str(voter['_id'])
     return jsonify({"status": "verified", "voter": voter})
@@ -122,7 +194,7 @@ def record_vote():
     try:
         voter_object_id = ObjectId(voter_id_str)
 
-        voter_check = mongo.db.voters.find_one({"_id": voter_object_id})
+        voter_check = mongo.db.voters.find_one({"_id": voter_object_id}, {"face_template": 0})
         if voter_check and voter_check.get("has_voted"):
             voter_check['_id'] = str(voter_check['_id'])
             return jsonify(voter_check), 200
@@ -140,11 +212,15 @@ def record_vote():
         if result.modified_count == 0:
             return jsonify({"error": "Voter not found or vote could not be recorded."}), 404
 
-        updated_voter = mongo.db.voters.find_one({"_id": voter_object_id})
+        updated_voter = mongo.db.voters.find_one({"_id": voter_object_id}, {"face_template": 0})
         
         if updated_voter:
             confirmation_id = f"VT{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            send_sms(updated_voter['phone_number'], f"Your vote has been successfully recorded. Confirmation ID: {confirmation_id}.")
+            enqueue_sms(
+                mongo.db, updated_voter['phone_number'],
+                f"Your vote has been successfully recorded. Confirmation ID: {confirmation_id}.",
+                kind="vote_confirmation"
+            )
         
         updated_voter['_id'] = str(updated_voter['_id'])
         
@@ -160,16 +236,22 @@ def compare_faces_advanced():
     data = request.json
     stored_image_url = data.get('stored_image_url')
     live_image_data = data.get('live_image_data')
+    # Optional burst of live frames for multi-frame liveness
+    live_frames = data.get('live_frames')
     
-    if not stored_image_url or not live_image_data:
+    if not stored_image_url or not (live_image_data or live_frames):
         return jsonify({"error": "Missing image data"}), 400
+    if live_frames is not None and not isinstance(live_frames, list):
+        return jsonify({"error": "live_frames must be a list of images"}), 400
     
     try:
-        verifier = AdvancedFaceVerification()
-        result = verifier.comprehensive_verification(stored_image_url, live_image_data)
+        result = _run_face_verification('comprehensive_verification', stored_image_url, live_image_data, live_frames)
+        result = _attach_timings(result, {}, data.get('debug'))
         
         return jsonify(result), 200
         
+    except VerificationPoolBusy as e:
+        return _busy_response(e)
     except Exception as e:
         print(f"Face verification error: {e}")
         return jsonify({
@@ -6,11 +6,12 @@ data_bp = Blueprint('data_bp', __name__)
 @data_bp.route('/dashboard/stats')
 def get_dashboard_stats():
     mongo = current_app.mongo
-    total_voters = mongo.db.voters.count_documents({})
+    # Collection metadata count; count_documents({}) would scan every voter
+    total_voters = mongo.db.voters.estimated_document_count()
     voted_count = mongo.db.voters.count_documents({"has_voted": True})
     
     recent_votes = list(mongo.db.voters.find(
-        {"has_voted": True}
+        {"has_voted": True}, {"face_template": 0}
     ).sort("voting_timestamp", -1).limit(10))
     
     for vote in recent_votes:
@@ -90,7 +91,7 @@ def dashboard_stats():
     recent_votes = list(
         mongo.db.voters.find(
             {"has_voted": True},
-            {"_id": 0}
+            {"_id": 0, "face_template": 0}
         ).sort("voting_timestamp", -1).limit(10)
     )
 
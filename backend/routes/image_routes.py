@@ -1,19 +1,25 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, jsonify, current_app
 import base64
-import gridfs
-from bson import ObjectId
-import io
-from PIL import Image
 from utils.image_validator import VoterImageValidator
+from utils.gridfs_response import send_grid_file
+from utils.upload_stream import UploadTooLarge, photo_bytes, read_photo_upload
+from utils.request_limits import NORMALIZE_REQUEST_MAX_BYTES, limit_request_body, normalize_requested
+from services.face_enrollment import enroll_photo
+from services.photo_hash_index import find_reused_photo, store_photo_hash
+from services.photo_store import PhotoStore
 
 image_bp = Blueprint('image_bp', __name__)
 
 @image_bp.route('/upload-voter-image', methods=['POST'])
+@limit_request_body(normalize_max_bytes=NORMALIZE_REQUEST_MAX_BYTES)
 def upload_voter_image():
     """Upload and validate voter photo"""
     try:
-        data = request.json
-        image_data = data.get('image')
+        # JSON with a base64 image, multipart/form-data, or a raw image/jpeg|png body (?voter_id=...)
+        try:
+            data, image_data = read_photo_upload(normalize_max_bytes=NORMALIZE_REQUEST_MAX_BYTES)
+        except UploadTooLarge as e:
+            return jsonify({"success": False, "errors": [str(e)]}), 400
         voter_id = data.get('voter_id')
         
         if not image_data or not voter_id:
@@ -22,37 +28,57 @@ def upload_voter_image():
         # Initialize validator
         validator = VoterImageValidator()
         
-        # Validate image
-        validation_result = validator.validate_image(image_data)
+        # Normalize mode: crop, resize and re-encode the photo server-side instead of rejecting it
+        normalized = {}
+        if normalize_requested(data):
+            try:
+                normalized_bytes, normalization = validator.normalize_image(image_data)
+            except Exception as e:
+                return jsonify({"success": False, "errors": [f"Could not normalize image: {e}"]}), 400
+            image_data = 'data:image/jpeg;base64,' + base64.b64encode(normalized_bytes).decode('ascii')
+            normalized = {"normalized_image": image_data, "normalization": normalization}
+        
+        # Validate image; fail_fast stops at the first failing check instead of reporting all
+        validation_result = validator.validate_image(image_data, fail_fast=bool(data.get('fail_fast')))
+        if normalized:
+            normalized["validation"] = {"valid": validation_result["valid"], "checks": validation_result.get("checks", [])}
         
         if not validation_result["valid"]:
             return jsonify({
                 "success": False, 
-                "errors": validation_result.get("errors", [validation_result.get("error")])
+                "errors": validation_result.get("errors", [validation_result.get("error")]),
+                **normalized
             }), 400
         
         # Extract image bytes
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
+        image_bytes = photo_bytes(image_data)
         
-        # Store in GridFS (for large files)
         db = current_app.mongo.db
-        fs = gridfs.GridFS(db)
-        
-        # Store image
-        image_id = fs.put(
-            image_bytes,
-            filename=f"voter_photo_{voter_id}",
-            content_type="image/jpeg",
-            voter_id=voter_id
+        # Reject the same photo (or a recompressed copy) already enrolled for another voter
+        photo_hash, reused = find_reused_photo(db, image_bytes, voter_id)
+        if reused and not data.get('allow_duplicate_photo'):
+            return jsonify({
+                "success": False,
+                "errors": ["This photo is already enrolled for another voter"],
+                "duplicate_of": reused[:5],
+                **normalized
+            }), 409
+        
+        # Store in GridFS (content-addressed) and make it the voter's current photo
+        image_id, created = PhotoStore(db).store_voter_photo(image_bytes, voter_id, face_box=validation_result.get("face_box"))
+        if created:
+            store_photo_hash(db, image_id, voter_id, photo_hash)
+        face_template = enroll_photo(
+            db, image_bytes, image_id, voter_id=voter_id, face_box=validation_result.get("face_box"),
+            reuse_existing=not created
         )
         
         return jsonify({
             "success": True,
             "image_id": str(image_id),
-            "message": "Image uploaded and validated successfully"
+            "face_embedding_stored": face_template is not None,
+            "message": "Image uploaded and validated successfully",
+            **normalized
         })
         
     except Exception as e:
@@ -62,11 +88,8 @@ def upload_voter_image():
 def get_voter_image(voter_id):
     """Retrieve voter photo"""
     try:
-        db = current_app.mongo.db
-        fs = gridfs.GridFS(db)
-        
-        # Find image by voter_id
-        image_file = fs.find_one({"voter_id": voter_id})
+        # Current photo through the voter's pointer: an indexed point query
+        image_file = PhotoStore(current_app.mongo.db).get_current(voter_id)
         
         if not image_file:
             return jsonify({"error": "Image not found"}), 404
@@ -80,4 +103,18 @@ def get_voter_image(voter_id):
         })
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+@image_bp.route('/voter-image/<voter_id>', methods=['GET'])
+def get_voter_image_raw(voter_id):
+    """Voter photo as binary, streamed from GridFS with ETag and Range support"""
+    try:
+        image_file = PhotoStore(current_app.mongo.db).get_current(voter_id)
+        
+        if not image_file:
+            return jsonify({"error": "Image not found"}), 404
+        
+        return send_grid_file(image_file)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,63 @@
+import os
+import time
+import argparse
+from datetime import datetime
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from services.db_indexes import apply_indexes
+from services.sms_outbox import SMS_DEAD, SMS_PENDING, start_sms_dispatcher
+
+# --- Configuration ---
+# Uses the same MONGO_URI and SMS_* settings as the Flask app (.env is loaded below)
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/voter_auth_db")
+DB_NAME = "voter_auth_db"
+
+
+def requeue_dead(db, kind=None):
+    """Moves dead-lettered messages that still have a body back to pending."""
+    query = {"status": SMS_DEAD, "body": {"$exists": True}}
+    if kind:
+        query["kind"] = kind
+    result = db.sms_outbox.update_many(
+        query,
+        {"$set": {"status": SMS_PENDING, "attempts": 0, "next_attempt_at": datetime.utcnow()}, "$unset": {"dead_at": ""}}
+    )
+    print(f"[OK] Requeued {result.modified_count} dead-lettered messages")
+
+
+def run_dispatcher(stats_interval=30):
+    """Delivers the SMS outbox from a dedicated process (start the app with SMS_DISPATCH_IN_APP=0)."""
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database(DB_NAME)
+    apply_indexes(db)
+    dispatcher = start_sms_dispatcher(db)
+    print(f"[INFO] SMS dispatcher running with {dispatcher.workers} workers at {dispatcher.rate_limiter.rate}/s")
+    try:
+        while True:
+            time.sleep(stats_interval)
+            print(f"[INFO] {dispatcher.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.stop()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the SMS outbox dispatcher, or requeue dead letters")
+    parser.add_argument("--requeue-dead", action="store_true", help="Requeue dead-lettered messages and exit")
+    parser.add_argument("--kind", help="With --requeue-dead, only messages of this kind (e.g. vote_confirmation)")
+    parser.add_argument("--stats-interval", type=float, default=30, help="Seconds between stats lines")
+    args = parser.parse_args()
+
+    if args.requeue_dead:
+        client = MongoClient(MONGO_URI)
+        try:
+            requeue_dead(client.get_default_database(DB_NAME), args.kind)
+        finally:
+            client.close()
+    else:
+        run_dispatcher(args.stats_interval)
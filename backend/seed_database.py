@@ -65,8 +65,6 @@ def create_voters():
             "polling_station": random.choice(POLLING_STATIONS[constituency]),
             "has_voted": False,
             "voting_timestamp": None,
-            "otp_code": None,
-            "otp_expires_at": None,
             # We don't need to store age, it can be calculated on the fly
         }
         voters_to_insert.append(voter)
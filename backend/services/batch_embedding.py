@@ -0,0 +1,177 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+from deepface import DeepFace
+
+
+class BatchingEmbeddingEngine:
+    """Micro-batches embedding requests from concurrent callers.
+
+    Callers preprocess their own frame (face detection is per-image anyway and
+    OpenCV releases the GIL), then block on a Future while a single worker
+    thread collects up to ``max_batch_size`` inputs or waits at most
+    ``max_wait_ms`` after the first one, and runs one forward pass for all of
+    them.
+    """
+
+    def __init__(self, preprocess_fn, forward_fn, max_batch_size=8, max_wait_ms=5.0):
+        self.preprocess_fn = preprocess_fn
+        self.forward_fn = forward_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "items": 0,
+            "errors": 0,
+            "total_wait_ms": 0.0,
+            "total_forward_ms": 0.0
+        }
+        self._batch_sizes = collections.Counter()
+        self._recent_batches = collections.deque(maxlen=100)
+
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="face-embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, image):
+        """Preprocess on the calling thread and queue the tensor; returns a Future"""
+        try:
+            tensor, meta = self.preprocess_fn(image)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        return self.submit_tensor(tensor, meta)
+
+    def submit_tensor(self, tensor, meta):
+        """Queue an already-preprocessed input; returns a Future"""
+        future = Future()
+        self._queue.put((tensor, meta, future, time.perf_counter()))
+        return future
+
+    def embed(self, image, timeout=30):
+        return self.submit(image).result(timeout=timeout)
+
+    def shutdown(self):
+        self._running = False
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            wait_ms = sum((started - enqueued) for _, _, _, enqueued in batch) * 1000.0 / len(batch)
+            try:
+                outputs = self.forward_fn(np.concatenate([tensor for tensor, _, _, _ in batch], axis=0))
+                for (_, meta, future, _), output in zip(batch, outputs):
+                    future.set_result({"embedding": [float(v) for v in output], **meta})
+                failed = False
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                failed = True
+            forward_ms = (time.perf_counter() - started) * 1000.0
+
+            with self._stats_lock:
+                self._stats["batches"] += 1
+                self._stats["items"] += len(batch)
+                self._stats["errors"] += int(failed)
+                self._stats["total_wait_ms"] += wait_ms * len(batch)
+                self._stats["total_forward_ms"] += forward_ms
+                self._batch_sizes[len(batch)] += 1
+                self._recent_batches.append({
+                    "size": len(batch),
+                    "queue_wait_ms": round(wait_ms, 2),
+                    "forward_ms": round(forward_ms, 2),
+                    "failed": failed
+                })
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._stats["batches"]
+            items = self._stats["items"]
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queued": self._queue.qsize(),
+                "batches": batches,
+                "items": items,
+                "errors": self._stats["errors"],
+                "mean_batch_size": round(items / batches, 2) if batches else 0,
+                "mean_queue_wait_ms": round(self._stats["total_wait_ms"] / items, 2) if items else 0,
+                "mean_forward_ms": round(self._stats["total_forward_ms"] / batches, 2) if batches else 0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "recent_batches": list(self._recent_batches)[-10:]
+            }
+
+
+def _pad_to_input(face, target_size):
+    """Resize with black padding exactly like deepface's preprocessing.resize_image"""
+    factor = min(target_size[0] / face.shape[0], target_size[1] / face.shape[1])
+    face = cv2.resize(face, (int(face.shape[1] * factor), int(face.shape[0] * factor)))
+    diff_0 = target_size[0] - face.shape[0]
+    diff_1 = target_size[1] - face.shape[1]
+    face = np.pad(
+        face,
+        ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+        "constant"
+    )
+    if face.shape[0:2] != target_size:
+        face = cv2.resize(face, (target_size[1], target_size[0]))
+    face = face.astype(np.float32)
+    if face.max() > 1:
+        face /= 255.0
+    return face[np.newaxis, ...]
+
+
+def facenet_batching_engine(model_name='Facenet', lock=None, max_batch_size=8, max_wait_ms=5.0):
+    """Engine that reproduces DeepFace.represent for one face per image, batched"""
+    client = DeepFace.build_model(model_name)
+    keras_model = getattr(client, 'model', client)
+    input_shape = tuple(getattr(client, 'input_shape', (160, 160)))
+    target_size = (input_shape[1], input_shape[0])
+    lock = lock or threading.Lock()
+
+    def preprocess(image):
+        face = DeepFace.extract_faces(image, detector_backend='opencv', enforce_detection=True, align=True)[0]
+        area = face['facial_area']
+        # extract_faces returns RGB in [0, 1]; Facenet was trained on BGR like DeepFace.represent feeds it
+        tensor = _pad_to_input(np.ascontiguousarray(face['face'][:, :, ::-1]), target_size)
+        return tensor, {"facial_area": {k: int(area.get(k, 0)) for k in ('x', 'y', 'w', 'h')}}
+
+    def forward(batch):
+        with lock:
+            return np.asarray(keras_model(batch, training=False))
+
+    return BatchingEmbeddingEngine(preprocess, forward, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
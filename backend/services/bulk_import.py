@@ -0,0 +1,314 @@
+import hashlib
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from services.photo_hash_index import loaded_photo_hash_index, photo_hash_fields, photo_hashes
+from services.photo_store import PhotoStore, photo_sha256
+from utils.image_validator import VoterImageValidator
+from utils.upload_stream import PHOTO_MAX_BYTES
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# GridFS's default chunk size; files written here read back like fs.put ones
+GRIDFS_CHUNK_SIZE = 255 * 1024
+
+
+class PhotoSource:
+    """Photos in a zip archive or a directory, listed in a stable (sorted) order.
+
+    Each file is keyed by its name: ``ABC1234567.jpg`` belongs to voter
+    ``ABC1234567``. The sorted listing is what makes a job resumable: the
+    checkpoint is simply how far into it the job got.
+    """
+
+    def __init__(self, source):
+        self._dir = None
+        self._zip = None
+        if isinstance(source, str) and os.path.isdir(source):
+            self._dir = source
+            self.names = sorted(n for n in os.listdir(source) if n.lower().endswith(PHOTO_EXTENSIONS))
+        else:
+            self._zip = zipfile.ZipFile(source)
+            self.names = sorted(
+                info.filename for info in self._zip.infolist()
+                if not info.is_dir()
+                and info.filename.lower().endswith(PHOTO_EXTENSIONS)
+                and not info.filename.startswith('__MACOSX/')
+            )
+
+    @staticmethod
+    def voter_id_for(name):
+        return os.path.splitext(os.path.basename(name))[0].strip().upper()
+
+    def fingerprint(self):
+        return hashlib.sha1("\n".join(self.names).encode("utf-8")).hexdigest()
+
+    def size(self, name):
+        """Uncompressed size, known without reading (or inflating) the photo"""
+        if self._zip is not None:
+            return self._zip.getinfo(name).file_size
+        return os.path.getsize(os.path.join(self._dir, name))
+
+    def read(self, name, max_bytes=PHOTO_MAX_BYTES):
+        """The photo's bytes, never more than ``max_bytes + 1`` of them"""
+        if self._zip is not None:
+            with self._zip.open(name) as f:
+                return f.read(max_bytes + 1)
+        with open(os.path.join(self._dir, name), "rb") as f:
+            return f.read(max_bytes + 1)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+# --- Worker process side ---
+_worker_validator = None
+
+
+def _init_worker():
+    global _worker_validator
+    _worker_validator = VoterImageValidator()
+
+
+def _validate_in_worker(image_bytes, fail_fast):
+    try:
+        result = _worker_validator.validate_image(image_bytes, fail_fast=fail_fast)
+        if result["valid"]:
+            result["photo_hash"] = photo_hashes(image_bytes)
+        return result
+    except Exception as e:
+        return {"valid": False, "error": f"Image processing failed: {e}"}
+
+
+# --- Job side ---
+class BulkPhotoImport:
+    """Validate a district's photos in a process pool and store the passing ones in GridFS.
+
+    ``run()`` yields one result dict per photo, in listing order, as each
+    batch is flushed: a header line first and a summary line last. Progress
+    is checkpointed in ``bulk_import_jobs`` after every batch, so re-running
+    with the same ``job_id`` and the same source skips what was already
+    stored.
+    """
+
+    def __init__(self, db, source, job_id=None, workers=None, batch_size=100, fail_fast=True,
+                 max_photo_bytes=PHOTO_MAX_BYTES):
+        self.db = db
+        self.max_photo_bytes = max_photo_bytes
+        self.source = source
+        self.job_id = job_id or str(ObjectId())
+        self.workers = max(1, int(workers or max(1, (os.cpu_count() or 2) - 1)))
+        self.batch_size = max(1, int(batch_size))
+        self.fail_fast = fail_fast
+
+    def _load_job(self):
+        fingerprint = self.source.fingerprint()
+        job = self.db.bulk_import_jobs.find_one({"_id": self.job_id})
+        if job is None:
+            job = {
+                "_id": self.job_id,
+                "fingerprint": fingerprint,
+                "total": len(self.source.names),
+                "position": 0,
+                "counts": {"stored": 0, "invalid": 0, "unknown_voter": 0},
+                "status": "running",
+                "started_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }
+            self.db.bulk_import_jobs.insert_one(job)
+        elif job["fingerprint"] != fingerprint:
+            raise ValueError(f"Job {self.job_id} was started on a different set of photos")
+        return job
+
+    def run(self):
+        job = self._load_job()
+        position = job["position"]
+        counts = dict(job["counts"])
+        yield {
+            "job_id": self.job_id,
+            "total": job["total"],
+            "resumed_from": position,
+            "workers": self.workers
+        }
+
+        pending = deque()
+        batch = []
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            # spawn, not fork: the Flask process may already have TensorFlow loaded
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        try:
+            names = iter(self.source.names[position:])
+            # Keep a bounded window of photos in flight so a huge archive is never all in memory
+            window = self.workers * 4
+            while True:
+                while len(pending) < window:
+                    name = next(names, None)
+                    if name is None:
+                        break
+                    # An oversized member (or a zip bomb) is rejected from its header, not inflated
+                    if self.source.size(name) > self.max_photo_bytes:
+                        pending.append((name, b"", self._rejected(self.source.size(name))))
+                        continue
+                    image_bytes = self.source.read(name, self.max_photo_bytes)
+                    if len(image_bytes) > self.max_photo_bytes:
+                        pending.append((name, b"", self._rejected(len(image_bytes))))
+                        continue
+                    pending.append((name, image_bytes, executor.submit(_validate_in_worker, image_bytes, self.fail_fast)))
+                if not pending:
+                    break
+
+                name, image_bytes, future = pending.popleft()
+                batch.append((name, image_bytes, future.result()))
+                if len(batch) >= self.batch_size:
+                    position += len(batch)
+                    yield from self._flush(batch, position, counts)
+                    batch = []
+
+            if batch:
+                position += len(batch)
+                yield from self._flush(batch, position, counts)
+
+            self.db.bulk_import_jobs.update_one(
+                {"_id": self.job_id},
+                {"$set": {"status": "completed", "updated_at": datetime.utcnow()}}
+            )
+            yield {"job_id": self.job_id, "status": "completed", "processed": position, **counts}
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _rejected(self, size):
+        future = Future()
+        future.set_result({
+            "valid": False,
+            "errors": [f"Image too large ({size // 1024}KB). Maximum {self.max_photo_bytes // 1024}KB allowed."]
+        })
+        return future
+
+    def _flush(self, batch, position, counts):
+        """Store a batch of validated photos with two insert_many calls and checkpoint.
+
+        Content already stored for that voter (same SHA-256) is not written
+        again; the voter is simply pointed at the existing file.
+        """
+        voter_ids = {PhotoSource.voter_id_for(name) for name, _, result in batch if result["valid"]}
+        known_voters = {
+            v["voter_id"] for v in self.db.voters.find({"voter_id": {"$in": list(voter_ids)}}, {"voter_id": 1})
+        }
+        # Photos this job already stored before an interruption keep their first copy
+        already_stored = {
+            f["source_name"]: f["_id"]
+            for f in self.db.fs.files.find(
+                {"bulk_job": self.job_id, "source_name": {"$in": [name for name, _, _ in batch]}},
+                {"source_name": 1}
+            )
+        }
+        digests = {name: photo_sha256(image_bytes) for name, image_bytes, result in batch if result["valid"]}
+        # Content is deduplicated per voter, never across voters
+        stored_content = {
+            (f["voter_id"], f["sha256"]): f["_id"]
+            for f in self.db.fs.files.find(
+                {"voter_id": {"$in": list(voter_ids)}, "sha256": {"$in": list(set(digests.values()))}},
+                {"voter_id": 1, "sha256": 1}
+            )
+        }
+
+        files, chunks, pointers, lines = [], [], [], []
+        now = datetime.utcnow()
+        for name, image_bytes, result in batch:
+            voter_id = PhotoSource.voter_id_for(name)
+            line = {"file": name, "voter_id": voter_id}
+            if not result["valid"]:
+                line.update(status="invalid", errors=result.get("errors", [result.get("error")]))
+                counts["invalid"] += 1
+            elif voter_id not in known_voters:
+                line.update(status="unknown_voter")
+                counts["unknown_voter"] += 1
+            else:
+                image_id = already_stored.get(name) or stored_content.get((voter_id, digests[name]))
+                if image_id is None:
+                    image_id = ObjectId()
+                    stored_content[(voter_id, digests[name])] = image_id
+                    files.append({
+                        "_id": image_id,
+                        "filename": f"voter_photo_{voter_id}",
+                        "length": len(image_bytes),
+                        "chunkSize": GRIDFS_CHUNK_SIZE,
+                        "uploadDate": now,
+                        "content_type": "image/png" if name.lower().endswith(".png") else "image/jpeg",
+                        "voter_id": voter_id,
+                        "upload_date": now,
+                        "face_box": result.get("face_box"),
+                        "photo_hash": photo_hash_fields(result["photo_hash"]),
+                        "sha256": digests[name],
+                        "bulk_job": self.job_id,
+                        "source_name": name
+                    })
+                    chunks.extend(
+                        {"files_id": image_id, "n": n, "data": image_bytes[offset:offset + GRIDFS_CHUNK_SIZE]}
+                        for n, offset in enumerate(range(0, len(image_bytes), GRIDFS_CHUNK_SIZE))
+                    )
+                pointers.append((voter_id, image_id, digests[name]))
+                line.update(status="stored", image_id=str(image_id))
+                counts["stored"] += 1
+            lines.append(line)
+
+        # Chunks before file documents, as GridFS itself does, so a visible file is always complete
+        if chunks:
+            self.db.fs.chunks.insert_many(chunks, ordered=False)
+        if files:
+            files, pointers, lines = self._insert_files(files, pointers, lines)
+        PhotoStore(self.db).set_current_many(pointers)
+        hash_index = loaded_photo_hash_index()
+        if hash_index is not None:
+            for doc in files:
+                hash_index.add(doc["_id"], doc["voter_id"], doc["photo_hash"]["phash"])
+        self.db.bulk_import_jobs.update_one(
+            {"_id": self.job_id},
+            {"$set": {"position": position, "counts": counts, "updated_at": datetime.utcnow()}}
+        )
+        return lines
+
+    def _insert_files(self, files, pointers, lines):
+        """insert_many the file documents, cleaning up after any that were refused.
+
+        The chunks of a refused file are deleted straight away. A refusal on
+        the (voter_id, sha256) index means another upload stored the same
+        content for that voter in the meantime, and the voter is pointed at
+        that file instead. Any other failure is raised once the chunks are gone.
+        """
+        try:
+            self.db.fs.files.insert_many(files, ordered=False)
+            return files, pointers, lines
+        except BulkWriteError as e:
+            refused = {files[err["index"]]["_id"]: err for err in e.details.get("writeErrors", [])}
+            self.db.fs.chunks.delete_many({"files_id": {"$in": list(refused)}})
+            if any(err.get("code") != 11000 for err in refused.values()):
+                raise
+        except Exception:
+            inserted = {f["_id"] for f in self.db.fs.files.find({"_id": {"$in": [f["_id"] for f in files]}}, {"_id": 1})}
+            self.db.fs.chunks.delete_many({"files_id": {"$in": [f["_id"] for f in files if f["_id"] not in inserted]}})
+            raise
+
+        digests = {f["_id"]: (f["voter_id"], f["sha256"]) for f in files if f["_id"] in refused}
+        winners = {
+            (f["voter_id"], f["sha256"]): f["_id"]
+            for f in self.db.fs.files.find(
+                {"voter_id": {"$in": [v for v, _ in digests.values()]}, "sha256": {"$in": [d for _, d in digests.values()]}},
+                {"voter_id": 1, "sha256": 1}
+            )
+        }
+        remap = {image_id: winners[digest] for image_id, digest in digests.items()}
+        pointers = [(voter_id, remap.get(image_id, image_id), digest) for voter_id, image_id, digest in pointers]
+        for line in lines:
+            if ObjectId.is_valid(line.get("image_id", "")) and ObjectId(line["image_id"]) in remap:
+                line["image_id"] = str(remap[ObjectId(line["image_id"])])
+        return [f for f in files if f["_id"] not in refused], pointers, lines
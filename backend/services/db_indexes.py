@@ -0,0 +1,142 @@
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+
+# Every index the application relies on, per collection. apply_indexes() creates
+# them idempotently (create_index is a no-op for an index that already exists),
+# at startup and from ensure_indexes.py. Names are left to MongoDB's defaults so
+# an index created by hand with the same keys is recognised as the same index.
+INDEX_REGISTRY = {
+    "voters": [
+        # Identity fields: authentication and the admin duplicate check look voters up by each of them.
+        # Only voter_id is unique: a shared Aadhaar or phone number is what the anomaly
+        # detectors look for, so the database must be able to hold one.
+        {"keys": [("voter_id", ASCENDING)], "unique": True},
+        {"keys": [("aadhar_number", ASCENDING)]},
+        {"keys": [("phone_number", ASCENDING)]},
+        {"keys": [("has_voted", ASCENDING), ("voting_timestamp", DESCENDING)]},
+        {"keys": [("created_at", DESCENDING)]},
+        {"keys": [("image_id", ASCENDING)]},
+    ],
+    "anomalies": [
+        {"keys": [("detected_at", DESCENDING)]},
+        {"keys": [("booth_name", ASCENDING), ("detection_type", ASCENDING)]},
+        {"keys": [("detection_type", ASCENDING), ("image_ids", ASCENDING)]},
+    ],
+    "locality_booth_mapping": [
+        {"keys": [("booth_id", ASCENDING)], "unique": True},
+    ],
+    "fs.files": [
+        # Photo content is deduplicated per voter, never across voters
+        {"keys": [("voter_id", ASCENDING), ("sha256", ASCENDING)], "unique": True,
+         "partialFilterExpression": {"sha256": {"$exists": True}}},
+        {"keys": [("voter_id", ASCENDING), ("uploadDate", DESCENDING)]},
+        {"keys": [("uploadDate", ASCENDING)]},
+        {"keys": [("photo_hash.phash", ASCENDING)]},
+        {"keys": [("bulk_job", ASCENDING), ("source_name", ASCENDING)]},
+    ],
+    "voter_photos": [
+        {"keys": [("image_id", ASCENDING)]},
+        {"keys": [("history.image_id", ASCENDING)]},
+    ],
+    "otps": [
+        # TTL: the server drops OTPs once expires_at has passed
+        {"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+    ],
+    "sms_outbox": [
+        # The dispatcher's claim query: ready pending messages and expired leases
+        {"keys": [("status", ASCENDING), ("next_attempt_at", ASCENDING)]},
+        {"keys": [("claim", ASCENDING)], "sparse": True},
+        # Delivered and expired messages are kept a week; dead letters stay until handled
+        {"keys": [("finished_at", ASCENDING)], "expireAfterSeconds": 7 * 24 * 3600},
+    ],
+    "thumbnails.files": [
+        {"keys": [("image_id", ASCENDING), ("size", ASCENDING), ("format", ASCENDING)]},
+    ],
+}
+
+# One representative query per filtered or sorted route, as (name, collection,
+# filter, sort). Routes that read a whole collection on purpose (booth lists,
+# anomaly detection) are not listed: a scan is the right plan for them.
+QUERY_SHAPES = [
+    ("auth.authenticate", "voters",
+     {"voter_id": "ABC1234567", "aadhar_number": "123456789012", "phone_number": "9876543210"}, None),
+    ("admin.voter_duplicate_check", "voters",
+     {"$or": [{"voter_id": "ABC1234567"}, {"aadhar_number": "123456789012"}, {"phone_number": "9876543210"}]}, None),
+    ("admin.list_voters", "voters", {}, [("created_at", DESCENDING)]),
+    ("photos.voter_by_image", "voters", {"image_id": "000000000000000000000000"}, None),
+    ("dashboard.voted_count", "voters", {"has_voted": True}, None),
+    ("dashboard.recent_votes", "voters", {"has_voted": True}, [("voting_timestamp", DESCENDING)]),
+    ("anomalies.list", "anomalies", {}, [("detected_at", DESCENDING)]),
+    ("anomalies.upsert", "anomalies", {"booth_name": "Booth 1", "detection_type": "Low Turnout"}, None),
+    ("anomalies.duplicate_photo_upsert", "anomalies",
+     {"detection_type": "Duplicate Photo", "image_ids": ["a", "b"]}, None),
+    ("booths.by_booth_id", "locality_booth_mapping", {"booth_id": "B001"}, None),
+    ("photos.by_sha256", "fs.files", {"voter_id": "ABC1234567", "sha256": "0" * 64}, None),
+    ("photos.by_voter", "fs.files", {"voter_id": "ABC1234567"}, [("uploadDate", DESCENDING)]),
+    ("photos.gc_candidates", "fs.files", {"uploadDate": {"$lt": datetime(2000, 1, 1)}, "sha256": {"$exists": True}}, None),
+    ("photos.bulk_already_stored", "fs.files", {"bulk_job": "job", "source_name": {"$in": ["a.jpg"]}}, None),
+    ("photos.pointer_references", "voter_photos",
+     {"$or": [{"image_id": "000000000000000000000000"}, {"history.image_id": "000000000000000000000000"}]}, None),
+    ("otp.verify", "otps",
+     {"_id": "000000000000000000000000", "otp_hash": "0" * 64, "expires_at": {"$gt": datetime(2000, 1, 1)}}, None),
+    ("sms.claim_ready", "sms_outbox",
+     {"$or": [{"status": "pending", "next_attempt_at": {"$lte": datetime(2000, 1, 1)}},
+              {"status": "sending", "lease_until": {"$lt": datetime(2000, 1, 1)}}]}, [("next_attempt_at", ASCENDING)]),
+    ("sms.claimed_batch", "sms_outbox", {"claim": "000000000000000000000000"}, None),
+    ("thumbnails.lookup", "thumbnails.files", {"image_id": "000000000000000000000000", "size": 64, "format": "webp"}, None),
+]
+
+
+class IndexCheckError(RuntimeError):
+    """A route's query shape is planned as a collection scan"""
+
+
+def apply_indexes(db, registry=None):
+    """Create every registered index; returns {"ensured": [...], "failed": [...]}.
+
+    A failure (typically a unique index over data that already has
+    duplicates) is reported and the remaining indexes are still created.
+    """
+    report = {"ensured": [], "failed": []}
+    for collection, specs in (registry or INDEX_REGISTRY).items():
+        for spec in specs:
+            options = {k: v for k, v in spec.items() if k != "keys"}
+            try:
+                name = db[collection].create_index(spec["keys"], **options)
+                report["ensured"].append(f"{collection}.{name}")
+            except Exception as e:
+                report["failed"].append({"collection": collection, "keys": spec["keys"], "error": str(e)})
+                print(f"[ERROR] Could not create index {spec['keys']} on {collection}: {e}")
+    print(f"[OK] {len(report['ensured'])} indexes ensured, {len(report['failed'])} failed")
+    return report
+
+
+def _plan_stages(plan):
+    """Every stage name in an explain() plan tree, whatever the server version's layout"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def check_query_plans(db, shapes=None):
+    """explain() every registered query shape; raise IndexCheckError if any would scan its collection"""
+    results, scans = [], []
+    for name, collection, query, sort in (shapes or QUERY_SHAPES):
+        cursor = db[collection].find(query).limit(10)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        results.append({"shape": name, "collection": collection, "stages": stages})
+        if "COLLSCAN" in stages:
+            scans.append(f"{name} ({collection}: {query})")
+    if scans:
+        raise IndexCheckError("Query shapes planned as COLLSCAN: " + "; ".join(scans))
+    print(f"[OK] Query plan check: {len(results)} route query shapes use indexes")
+    return results
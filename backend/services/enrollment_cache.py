@@ -0,0 +1,91 @@
+import collections
+import os
+import threading
+
+from services.advanced_face_verification import AdvancedFaceVerification
+from utils.byte_lru import ByteBoundedLRU
+from utils.face_detection import crop_face
+
+
+class EnrollmentCache:
+    """Byte-bounded LRU of what authentication needs from a stored photo, keyed by image_id.
+
+    Authentication normally works from the face template on the voter
+    document. When that is missing, the stored photo is read from GridFS
+    and enrolled; if enrollment fails, every retry at the booth would read,
+    decode and try to embed the same photo again. This cache keeps, per
+    image_id, either the template that enrollment produced or the decoded,
+    face-cropped reference used for pairwise comparison, so a retry costs
+    neither a GridFS read nor a decode. The photo store invalidates an
+    image_id when a voter's photo is replaced or deleted.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self._lock = threading.Lock()
+        self._entries = ByteBoundedLRU(max_bytes)
+        self._counters = collections.Counter()
+
+    def get(self, image_id):
+        """{"template": ..., "reference": ...} for a photo, or None on a miss"""
+        with self._lock:
+            cached = self._entries.get(str(image_id))
+            self._counters["hits" if cached is not None else "misses"] += 1
+        if cached is None:
+            return None
+        entry = cached[0]
+        # Callers get their own copy of the pixels, as with the image fetcher's references
+        reference = entry["reference"]
+        return {"template": entry["template"], "reference": reference.copy() if reference is not None else None}
+
+    def put_template(self, image_id, template):
+        # A 128-d embedding plus its metadata; the lists dominate
+        nbytes = 64 * (len(template.get("embedding") or []) + len(template.get("light_embedding") or [])) + 512
+        self._put(image_id, {"template": template, "reference": None}, nbytes)
+
+    def put_reference(self, image_bytes, image_id, face_box=None):
+        """Decode (and crop to ``face_box``) a stored photo, cache it and return a copy"""
+        image = AdvancedFaceVerification.to_bgr(image_bytes)
+        if face_box:
+            image = crop_face(image, face_box).copy()
+        self._put(image_id, {"template": None, "reference": image}, image.nbytes)
+        return image.copy()
+
+    def _put(self, image_id, entry, nbytes):
+        with self._lock:
+            self._entries.put(str(image_id), entry, nbytes)
+
+    def invalidate(self, image_id):
+        with self._lock:
+            if self._entries.get(str(image_id)) is not None:
+                self._entries.pop(str(image_id))
+                self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self._entries),
+                "memory_bytes": self._entries.size,
+                "max_bytes": self._entries.max_bytes
+            }
+
+
+_enrollment_cache = None
+_enrollment_cache_lock = threading.Lock()
+
+
+def get_enrollment_cache():
+    """Process-wide cache sized from ENROLLMENT_CACHE_MB"""
+    global _enrollment_cache
+    if _enrollment_cache is None:
+        with _enrollment_cache_lock:
+            if _enrollment_cache is None:
+                _enrollment_cache = EnrollmentCache(int(os.getenv("ENROLLMENT_CACHE_MB", "64")) * 1024 * 1024)
+    return _enrollment_cache
+
+
+def loaded_enrollment_cache():
+    """The cache if something has used it; invalidation skips creating it"""
+    return _enrollment_cache
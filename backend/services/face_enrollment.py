@@ -0,0 +1,107 @@
+from datetime import datetime
+from bson import ObjectId
+from services.advanced_face_verification import AdvancedFaceVerification, get_verifier
+from services.face_index import loaded_face_index
+
+
+def embed_image_bytes(image_bytes):
+    """Decode encoded image bytes and return the Facenet embedding of its face"""
+    return get_verifier().compute_embedding(AdvancedFaceVerification.to_bgr(image_bytes))
+
+
+def build_face_template(image_bytes, image_id, face_box=None):
+    """Embed an enrollment photo once so authentication only has to embed the live frame.
+
+    ``face_box`` is the box found during upload validation; when given, the
+    photo is cropped directly instead of running face detection again.
+    Returns None (and logs) when no face can be embedded; callers keep the photo
+    and authentication falls back to full image comparison.
+    """
+    verifier = get_verifier()
+    try:
+        img = AdvancedFaceVerification.to_bgr(image_bytes)
+        representation = verifier.compute_embedding(img, face_box=face_box)
+    except Exception as e:
+        print(f"[WARN] Could not compute face embedding for image {image_id}: {e}")
+        return None
+
+    template = {
+        "image_id": str(image_id),
+        "model": AdvancedFaceVerification.MODEL_NAME,
+        "embedding": representation["embedding"],
+        "facial_area": representation["facial_area"],
+        "created_at": datetime.utcnow()
+    }
+    if verifier.cascade is not None:
+        # Lets the verification cascade settle clear cases without Facenet
+        try:
+            template["light_embedding"] = verifier.cascade.light_embedding(img, tuple(face_box) if face_box else None)
+        except Exception as e:
+            print(f"[WARN] Could not compute light embedding for image {image_id}: {e}")
+    return template
+
+
+def store_face_template(db, template, voter_filter=None):
+    """Persist a template on the GridFS file and, when given, on the voter document"""
+    db.fs.files.update_one(
+        {"_id": ObjectId(template["image_id"])},
+        {"$set": {"face_template": template}}
+    )
+    if voter_filter is not None:
+        db.voters.update_one(voter_filter, {"$set": {"face_template": template}})
+
+
+def enroll_photo(db, image_bytes, image_id, voter_filter=None, voter_id=None, face_box=None, reuse_existing=False):
+    """Compute and store the template for a freshly uploaded photo.
+
+    ``voter_id`` is the EPIC number the photo belongs to; it labels the photo in
+    the duplicate-face index so that a voter never matches their own photos.
+    With ``reuse_existing`` (the photo store already had this exact content)
+    the template already on the file is reused instead of embedding again.
+    """
+    template = None
+    if reuse_existing:
+        file_doc = db.fs.files.find_one({"_id": ObjectId(image_id)}, {"face_template": 1})
+        template = (file_doc or {}).get("face_template")
+        if not _is_current(template, image_id):
+            template = None
+    if template is None:
+        template = build_face_template(image_bytes, image_id, face_box)
+    if template:
+        store_face_template(db, template, voter_filter)
+        index = loaded_face_index()
+        if index is not None:
+            index.add(image_id, voter_id, template["embedding"])
+    return template
+
+
+def get_face_template(db, voter):
+    """Return the current template for a voter without touching GridFS chunks.
+
+    A template is only trusted when it was computed from the voter's current
+    image_id and with the current model.
+    """
+    image_id = voter.get("image_id")
+    if not image_id:
+        return None
+
+    template = voter.get("face_template")
+    if _is_current(template, image_id):
+        return template
+
+    # Photos uploaded through the standalone endpoints carry the template on the file document
+    file_doc = db.fs.files.find_one({"_id": ObjectId(image_id)}, {"face_template": 1})
+    template = (file_doc or {}).get("face_template")
+    if _is_current(template, image_id):
+        db.voters.update_one({"_id": voter["_id"]}, {"$set": {"face_template": template}})
+        return template
+    return None
+
+
+def _is_current(template, image_id):
+    return bool(
+        template
+        and template.get("image_id") == str(image_id)
+        and template.get("model") == AdvancedFaceVerification.MODEL_NAME
+        and template.get("embedding")
+    )
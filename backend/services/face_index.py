@@ -0,0 +1,288 @@
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from services.advanced_face_verification import AdvancedFaceVerification
+
+# Cosine distance under which two enrollment photos are treated as the same person.
+# Tighter than the 1:1 verification threshold because a 1:N scan over a whole
+# roll has far more chances to produce a false pair.
+DUPLICATE_THRESHOLD = 0.30
+# Most neighbours a face search may ask for
+FACE_SEARCH_MAX_K = 50
+# Removed rows are only masked; once they are this fraction of the rows the arrays are rebuilt
+COMPACT_DEAD_FRACTION = 0.25
+
+
+class FaceIndex:
+    """In-memory nearest-neighbour index over enrollment embeddings.
+
+    Rows are L2-normalised so cosine distance is ``1 - dot``. ``exact`` mode is a
+    single matrix product over the roll; ``ivf`` mode partitions rows into
+    ``n_lists`` k-means cells and only searches the ``nprobe`` closest cells.
+    Entries are keyed by GridFS image_id and labelled with the EPIC voter_id so
+    that several photos of the same voter are never reported as duplicates.
+    """
+
+    def __init__(self, dim=128, mode='exact', n_lists=256, nprobe=8):
+        self.dim = dim
+        self.mode = mode
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._keys = []
+        self._labels = []
+        self._row_of = {}
+
+        self._centroids = None
+        self._lists = None
+
+    def __len__(self):
+        return len(self._row_of)
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, key, label, embedding):
+        """Insert or replace one entry"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self.remove(key)
+            row = len(self._keys)
+            if row == len(self._vectors):
+                self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+                self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+            self._vectors[row] = vector
+            self._alive[row] = True
+            self._keys.append(str(key))
+            self._labels.append(label)
+            self._row_of[str(key)] = row
+            if self._centroids is not None:
+                cell = int(np.argmax(self._centroids @ vector))
+                self._lists[cell] = np.append(self._lists[cell], row)
+
+    def remove(self, key):
+        with self._lock:
+            row = self._row_of.pop(str(key), None)
+            if row is not None:
+                self._alive[row] = False
+                dead = len(self._keys) - len(self._row_of)
+                if len(self._keys) >= 1024 and dead > COMPACT_DEAD_FRACTION * len(self._keys):
+                    self._compact()
+
+    def _compact(self):
+        """Drop removed rows and renumber the live ones; IVF cells keep their centroids"""
+        rows = np.flatnonzero(self._alive[:len(self._keys)])
+        capacity = max(1024, 1 << int(len(rows)).bit_length())
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(rows)] = self._vectors[rows]
+        self._vectors = vectors
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[:len(rows)] = True
+        self._keys = [self._keys[row] for row in rows]
+        self._labels = [self._labels[row] for row in rows]
+        self._row_of = {key: row for row, key in enumerate(self._keys)}
+        if self._centroids is not None:
+            new_rows = np.arange(len(rows))
+            assign = self._assign(new_rows, self._centroids)
+            self._lists = [new_rows[assign == cell] for cell in range(self.n_lists)]
+
+    def build_ivf(self, iterations=10, sample_size=100000, seed=0):
+        """Train k-means cells over the current rows (no-op for small rolls)"""
+        with self._lock:
+            rows = np.flatnonzero(self._alive[:len(self._keys)])
+            if len(rows) < self.n_lists * 4:
+                self._centroids, self._lists = None, None
+                return False
+
+            rng = np.random.default_rng(seed)
+            sample = self._vectors[rng.choice(rows, size=min(sample_size, len(rows)), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                assign = np.argmax(sample @ centroids.T, axis=1)
+                for cell in range(self.n_lists):
+                    members = sample[assign == cell]
+                    if len(members):
+                        centroids[cell] = members.mean(axis=0)
+                centroids = self._normalize(centroids)
+
+            assign = self._assign(rows, centroids)
+            self._centroids = centroids
+            self._lists = [rows[assign == cell] for cell in range(self.n_lists)]
+            return True
+
+    def _assign(self, rows, centroids, block=65536):
+        out = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), block):
+            chunk = self._vectors[rows[start:start + block]]
+            out[start:start + block] = np.argmax(chunk @ centroids.T, axis=1)
+        return out
+
+    def _candidate_rows(self, vector):
+        if self.mode != 'ivf' or self._centroids is None:
+            return np.flatnonzero(self._alive[:len(self._keys)])
+        cells = np.argsort(-(self._centroids @ vector))[:self.nprobe]
+        rows = np.concatenate([self._lists[c] for c in cells])
+        return rows[self._alive[rows]]
+
+    def search(self, embedding, k=5, exclude_label=None):
+        """Return the k nearest entries as dicts with key, label and cosine distance"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            rows = self._candidate_rows(vector)
+            if len(rows) == 0:
+                return []
+            sims = self._vectors[rows] @ vector
+            # Over-fetch a little so excluded (same-voter) rows rarely force a full sort
+            want = min(len(rows), k + 16)
+            order = np.argpartition(-sims, want - 1)[:want]
+            order = order[np.argsort(-sims[order])]
+            results = self._take(rows, sims, order, k, exclude_label)
+            if len(results) < k and want < len(rows):
+                results = self._take(rows, sims, np.argsort(-sims), k, exclude_label)
+            return results
+
+    def _take(self, rows, sims, order, k, exclude_label):
+        results = []
+        for i in order:
+            row = rows[i]
+            if exclude_label is not None and self._labels[row] == exclude_label:
+                continue
+            results.append({
+                "image_id": self._keys[row],
+                "voter_id": self._labels[row],
+                "distance": round(max(0.0, float(1.0 - sims[i])), 4)
+            })
+            if len(results) == k:
+                break
+        return results
+
+    def find_duplicates(self, threshold=DUPLICATE_THRESHOLD, max_block_cells=1 << 26):
+        """All pairs of differently-labelled entries closer than ``threshold``.
+
+        Exact mode compares blocks of rows against the upper triangle of the
+        matrix; IVF mode assigns each row to its two nearest cells and only
+        compares rows that share a cell.
+        """
+        min_sim = 1.0 - threshold
+        with self._lock:
+            alive_rows = np.flatnonzero(self._alive[:len(self._keys)])
+            if self.mode == 'ivf' and self._centroids is not None:
+                groups = self._scan_groups(alive_rows)
+            else:
+                groups = [alive_rows]
+
+            pairs = {}
+            for rows in groups:
+                vectors = self._vectors[rows]
+                # bound each similarity block to ~256MB of float32
+                block = max(1, min(4096, max_block_cells // len(rows)))
+                for start in range(0, len(rows), block):
+                    # compare against rows from `start` on and drop j <= i, so every pair is visited once
+                    sims = vectors[start:start + block] @ vectors[start:].T
+                    sims[np.tril_indices(sims.shape[0])] = -1.0
+                    for i, j in zip(*np.nonzero(sims >= min_sim)):
+                        a, b = rows[start + i], rows[start + j]
+                        if self._labels[a] == self._labels[b]:
+                            continue
+                        pair = (min(a, b), max(a, b))
+                        pairs[pair] = max(pairs.get(pair, -1.0), float(sims[i, j]))
+
+            return [
+                {
+                    "image_ids": [self._keys[a], self._keys[b]],
+                    "voter_ids": [self._labels[a], self._labels[b]],
+                    "distance": round(max(0.0, 1.0 - sim), 4)
+                }
+                for (a, b), sim in sorted(pairs.items(), key=lambda item: -item[1])
+            ]
+
+    def _scan_groups(self, rows, block=65536):
+        cells = [[] for _ in range(self.n_lists)]
+        for start in range(0, len(rows), block):
+            chunk_rows = rows[start:start + block]
+            nearest = np.argsort(-(self._vectors[chunk_rows] @ self._centroids.T), axis=1)[:, :2]
+            for row, (c1, c2) in zip(chunk_rows, nearest):
+                cells[c1].append(row)
+                cells[c2].append(row)
+        return [np.array(c, dtype=np.int64) for c in cells if len(c) > 1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self),
+                "mode": 'ivf' if self.mode == 'ivf' and self._centroids is not None else 'exact',
+                "n_lists": self.n_lists if self._centroids is not None else None,
+                "nprobe": self.nprobe
+            }
+
+
+_face_index = None
+_face_index_lock = threading.Lock()
+
+
+def load_face_index(db):
+    """Build an index from every stored enrollment template"""
+    index = FaceIndex(
+        mode=os.getenv("FACE_INDEX_MODE", "exact"),
+        n_lists=int(os.getenv("FACE_INDEX_LISTS", "256")),
+        nprobe=int(os.getenv("FACE_INDEX_NPROBE", "8"))
+    )
+    cursor = db.fs.files.find(
+        {"face_template.model": AdvancedFaceVerification.MODEL_NAME},
+        {"voter_id": 1, "face_template.embedding": 1}
+    )
+    for doc in cursor:
+        index.add(doc["_id"], doc.get("voter_id"), doc["face_template"]["embedding"])
+    if index.mode == 'ivf':
+        index.build_ivf()
+    print(f"[OK] Face index loaded: {index.stats()}")
+    return index
+
+
+def get_face_index(db):
+    """Process-wide index, loaded from Mongo on first use"""
+    global _face_index
+    if _face_index is None:
+        with _face_index_lock:
+            if _face_index is None:
+                _face_index = load_face_index(db)
+    return _face_index
+
+
+def loaded_face_index():
+    """The index if it has already been loaded; incremental updates skip loading it"""
+    return _face_index
+
+
+def record_duplicate_anomalies(db, pairs, threshold=DUPLICATE_THRESHOLD):
+    """Upsert one 'Duplicate Face' anomaly per suspicious pair of voters"""
+    voter_ids = {v for pair in pairs for v in pair["voter_ids"]}
+    stations = {
+        v["voter_id"]: v.get("polling_station")
+        for v in db.voters.find({"voter_id": {"$in": list(voter_ids)}}, {"voter_id": 1, "polling_station": 1})
+    }
+    for pair in pairs:
+        first, second = pair["voter_ids"]
+        db.anomalies.update_one(
+            {"detection_type": "Duplicate Face", "image_ids": pair["image_ids"]},
+            {"$set": {
+                "booth_name": stations.get(first) or stations.get(second),
+                "detection_type": "Duplicate Face",
+                "details": f"Voters {first} and {second} have near-identical enrollment photos (distance {pair['distance']:.3f})",
+                "confidence_score": round(max(0.0, 1.0 - pair["distance"] / (2 * threshold)), 2),
+                "voter_ids": pair["voter_ids"],
+                "image_ids": pair["image_ids"],
+                "detected_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    return len(pairs)
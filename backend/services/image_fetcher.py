@@ -0,0 +1,216 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.advanced_face_verification import AdvancedFaceVerification
+from utils.byte_lru import ByteBoundedLRU
+from utils.face_detection import crop_face, detect_largest_face
+
+
+class ImageFetchError(ValueError):
+    """The URL answered with something that is not a usable reference photo"""
+
+
+class ImageFetcher:
+    """Connection-pooled fetcher for reference photos given by URL.
+
+    Bodies are kept in a byte-bounded memory LRU and, if ``disk_cache_dir`` is
+    set, on disk with their ETag/Last-Modified so stale entries are revalidated
+    with a conditional GET instead of downloaded again. The decoded,
+    face-cropped reference is cached separately so repeat comparisons skip
+    decoding and detection as well. Responses that redirect more than
+    ``max_redirects`` times, are not ``image/*`` or exceed ``max_body_bytes``
+    are rejected before they are cached.
+    """
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, disk_cache_dir=None,
+                 max_age=300, connect_timeout=3.0, read_timeout=10.0, pool_size=10,
+                 max_body_bytes=5 * 1024 * 1024, max_redirects=3):
+        self.max_age = max_age
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_body_bytes = max_body_bytes
+        self.disk_cache_dir = disk_cache_dir
+        if disk_cache_dir:
+            os.makedirs(disk_cache_dir, exist_ok=True)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=1)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.max_redirects = max_redirects
+
+        self._lock = threading.Lock()
+        # body cache: url -> {"content", "etag", "last_modified", "fetched_at"}
+        self._bodies = ByteBoundedLRU(max_memory_bytes // 2)
+        # decoded reference cache: (url, validator) -> cropped BGR array
+        self._references = ByteBoundedLRU(max_memory_bytes // 2)
+        self._counters = collections.Counter()
+        self._fetch_ms = collections.deque(maxlen=1000)
+
+    def fetch(self, url):
+        """Return the body of ``url``, from cache when still fresh"""
+        entry = self._cached_entry(url)
+        if entry is not None and time.time() - entry["fetched_at"] < self.max_age:
+            return entry
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        start = time.perf_counter()
+        with self._session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if entry is not None and response.status_code == 304:
+                content = None
+            else:
+                response.raise_for_status()
+                content = self._read_body(url, response)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        with self._lock:
+            self._fetch_ms.append(elapsed_ms)
+            if content is None:
+                self._counters["revalidated"] += 1
+                entry = dict(entry, fetched_at=time.time())
+            else:
+                self._counters["downloaded"] += 1
+                entry = {
+                    "content": content,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": time.time()
+                }
+            self._bodies.put(url, entry, len(entry["content"]))
+        self._write_disk(url, entry)
+        return entry
+
+    def _read_body(self, url, response):
+        """The body of an image response, read no further than max_body_bytes"""
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not content_type.startswith("image/"):
+            self._count("rejected")
+            raise ImageFetchError(f"{url} is not an image (Content-Type {content_type or 'missing'})")
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > self.max_body_bytes:
+            self._count("rejected")
+            raise ImageFetchError(f"{url} is {declared} bytes, over the {self.max_body_bytes} byte limit")
+
+        body = bytearray()
+        # Content-Length can be absent or wrong; the limit holds for the bytes actually sent
+        for chunk in response.iter_content(64 * 1024):
+            body += chunk
+            if len(body) > self.max_body_bytes:
+                self._count("rejected")
+                raise ImageFetchError(f"{url} is over the {self.max_body_bytes} byte limit")
+        return bytes(body)
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def fetch_reference(self, url):
+        """Decoded BGR reference photo, cropped around the face when one is found"""
+        entry = self.fetch(url)
+        key = (url, entry.get("etag") or entry.get("last_modified") or hashlib.sha1(entry["content"]).hexdigest())
+        with self._lock:
+            cached = self._references.get(key)
+            if cached is not None:
+                self._counters["reference_hits"] += 1
+                return cached[0].copy()
+            self._counters["reference_misses"] += 1
+
+        image = AdvancedFaceVerification.to_bgr(entry["content"])
+        box = detect_largest_face(image)
+        if box is not None:
+            image = crop_face(image, box).copy()
+        with self._lock:
+            self._references.put(key, image, image.nbytes)
+        return image.copy()
+
+    def _cached_entry(self, url):
+        with self._lock:
+            cached = self._bodies.get(url)
+            if cached is not None:
+                self._counters["memory_hits"] += 1
+                return cached[0]
+        entry = self._read_disk(url)
+        with self._lock:
+            if entry is not None:
+                self._counters["disk_hits"] += 1
+                self._bodies.put(url, entry, len(entry["content"]))
+            else:
+                self._counters["misses"] += 1
+        return entry
+
+    def _disk_paths(self, url):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_cache_dir, name), os.path.join(self.disk_cache_dir, name + ".json")
+
+    def _read_disk(self, url):
+        if not self.disk_cache_dir:
+            return None
+        body_path, meta_path = self._disk_paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                return dict(meta, content=f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, url, entry):
+        if not self.disk_cache_dir:
+            return
+        body_path, meta_path = self._disk_paths(url)
+        try:
+            with open(body_path + ".tmp", "wb") as f:
+                f.write(entry["content"])
+            os.replace(body_path + ".tmp", body_path)
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({k: entry[k] for k in ("etag", "last_modified", "fetched_at")}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        except OSError as e:
+            print(f"[WARN] Could not write image cache for {url}: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            fetch_ms = sorted(self._fetch_ms)
+            return {
+                **self._counters,
+                "hit_rate": round((lookups - self._counters["misses"]) / lookups, 3) if lookups else None,
+                "memory_bytes": self._bodies.size + self._references.size,
+                "cached_bodies": len(self._bodies),
+                "cached_references": len(self._references),
+                "fetch_ms_p50": round(fetch_ms[len(fetch_ms) // 2], 2) if fetch_ms else None,
+                "fetch_ms_p95": round(fetch_ms[int(len(fetch_ms) * 0.95)], 2) if fetch_ms else None
+            }
+
+
+_image_fetcher = None
+_image_fetcher_lock = threading.Lock()
+
+
+def get_image_fetcher():
+    """Process-wide fetcher configured from the environment"""
+    global _image_fetcher
+    if _image_fetcher is None:
+        with _image_fetcher_lock:
+            if _image_fetcher is None:
+                _image_fetcher = ImageFetcher(
+                    max_memory_bytes=int(os.getenv("IMAGE_FETCH_CACHE_MB", "64")) * 1024 * 1024,
+                    disk_cache_dir=os.getenv("IMAGE_FETCH_DISK_CACHE") or None,
+                    max_age=float(os.getenv("IMAGE_FETCH_MAX_AGE", "300")),
+                    connect_timeout=float(os.getenv("IMAGE_FETCH_CONNECT_TIMEOUT", "3")),
+                    read_timeout=float(os.getenv("IMAGE_FETCH_READ_TIMEOUT", "10")),
+                    max_body_bytes=int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+                )
+    return _image_fetcher
@@ -0,0 +1,153 @@
+import cv2
+import numpy as np
+
+
+class MultiFrameLiveness:
+    """Liveness over a short burst of live frames, scored in small batches.
+
+    Frames are downscaled to a common size and stacked, so glare, texture
+    (Laplacian variance) and edge density are computed for a whole batch with
+    one OpenCV call on the stacked mosaic plus NumPy reductions. Across
+    frames, a real face shows small natural motion and a texture that varies
+    from frame to frame; a printed photo or a looped screenshot shows
+    neither. Scoring stops as soon as the running confidence is decisive, so
+    most bursts only decode and score the first few frames.
+    """
+
+    TARGET_WIDTH = 360
+    MAX_FRAMES = 8
+    # Same floor as detect_anti_spoof: smaller frames look flat and are not scored
+    MIN_FRAME_SIDE = 120
+
+    def __init__(self, batch_size=2, min_frames=2, accept_above=80.0, reject_below=40.0):
+        self.batch_size = batch_size
+        self.min_frames = min_frames
+        self.accept_above = accept_above
+        self.reject_below = reject_below
+
+    def _stack(self, frames, size):
+        grays = []
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            grays.append(cv2.resize(gray, size, interpolation=cv2.INTER_AREA))
+        return np.stack(grays)
+
+    def _frame_scores(self, stack):
+        """Per-frame glare ratio, Laplacian variance and edge density for a (n, h, w) stack"""
+        n, h, w = stack.shape
+        # One OpenCV call per batch: frames are laid out as one tall image
+        mosaic = stack.reshape(n * h, w)
+        laplacian = cv2.Laplacian(mosaic, cv2.CV_32F).reshape(n, h, w)
+        edges = cv2.Canny(mosaic, 50, 150).reshape(n, h, w)
+        # The first and last row of each frame see its neighbour across the seam
+        return {
+            'glare': (stack >= 250).mean(axis=(1, 2)),
+            'texture': laplacian[:, 1:-1].var(axis=(1, 2)),
+            'edges': (edges[:, 1:-1] > 0).mean(axis=(1, 2))
+        }
+
+    @staticmethod
+    def _frame_confidence(scores):
+        confidence = np.full(len(scores['glare']), 100.0)
+        confidence -= 25 * (scores['glare'] > 0.08)
+        confidence -= 30 * (scores['texture'] < 18)
+        confidence -= 20 * (scores['edges'] < 0.02)
+        return confidence
+
+    def _aggregate(self, confidences, textures, stack):
+        """Mean frame confidence adjusted by inter-frame motion and temporal texture variance"""
+        confidence = float(np.mean(confidences))
+        indicators = []
+        temporal = {'motion': None, 'texture_variation': None}
+        if len(stack) < 2:
+            return confidence, indicators, temporal
+
+        frames = stack.astype(np.int16)
+        motion = float(np.abs(np.diff(frames, axis=0)).mean())
+        texture_variation = float(np.std(textures) / max(float(np.mean(textures)), 1e-6))
+        temporal = {'motion': round(motion, 3), 'texture_variation': round(texture_variation, 4)}
+
+        if motion < 0.3 and texture_variation < 0.005:
+            indicators.append('No movement between frames - possible photo or frozen replay')
+            confidence -= 35
+        elif motion > 40:
+            indicators.append('Frames are inconsistent - possible substituted images')
+            confidence -= 25
+        else:
+            # Natural micro-motion is the strongest signal we have that this is a live capture
+            confidence += 10
+        return max(0.0, min(100.0, confidence)), indicators, temporal
+
+    def assess(self, frames, decode):
+        """Score up to MAX_FRAMES frames; returns (result, sharpest decoded frame).
+
+        ``frames`` may be encoded images; ``decode`` turns one into a BGR
+        array and is only called for frames that actually get scored. Frames
+        under MIN_FRAME_SIDE are skipped; if none is large enough, the result
+        is the same as detect_anti_spoof gives a too-small frame.
+        """
+        frames = list(frames)[:self.MAX_FRAMES]
+        decoded, confidences, textures, stacks = [], [], [], []
+        size = None
+        frame_indicators = set()
+        confidence, indicators, temporal = 0.0, [], {}
+        early_exit = False
+        first_frame = None
+
+        for start in range(0, len(frames), self.batch_size):
+            batch = [decode(f) for f in frames[start:start + self.batch_size]]
+            if first_frame is None:
+                first_frame = batch[0]
+            small = [f for f in batch if min(f.shape[:2]) < self.MIN_FRAME_SIDE]
+            if small:
+                frame_indicators.add('Frames too small to score were skipped')
+                batch = [f for f in batch if min(f.shape[:2]) >= self.MIN_FRAME_SIDE]
+                if not batch:
+                    continue
+            decoded.extend(batch)
+            if size is None:
+                h, w = batch[0].shape[:2]
+                scale = min(1.0, self.TARGET_WIDTH / float(w))
+                size = (max(1, int(w * scale)), max(1, int(h * scale)))
+
+            stack = self._stack(batch, size)
+            scores = self._frame_scores(stack)
+            stacks.append(stack)
+            confidences.extend(self._frame_confidence(scores))
+            textures.extend(scores['texture'])
+            if np.any(scores['glare'] > 0.08):
+                frame_indicators.add('Screen glare detected')
+            if np.any(scores['texture'] < 18):
+                frame_indicators.add('Low texture - possible flat photo')
+            if np.any(scores['edges'] < 0.02):
+                frame_indicators.add('Unnatural edge distribution')
+
+            confidence, indicators, temporal = self._aggregate(confidences, textures, np.concatenate(stacks))
+            if len(decoded) >= self.min_frames and start + self.batch_size < len(frames):
+                if confidence >= self.accept_above or confidence <= self.reject_below:
+                    early_exit = True
+                    break
+
+        if not decoded:
+            return {
+                'is_real': True,
+                'confidence': 60.0,
+                'indicators': ['Frame too small for reliable anti-spoof; skipping strict checks'],
+                'frames_received': len(frames),
+                'frames_scored': 0,
+                'early_exit': False,
+                'motion': None,
+                'texture_variation': None
+            }, first_frame
+
+        best = int(np.argmax(textures))
+        return {
+            'is_real': confidence > 40,
+            'confidence': round(confidence, 1),
+            'indicators': sorted(frame_indicators) + indicators,
+            'frames_received': len(frames),
+            'frames_scored': len(decoded),
+            'early_exit': early_exit,
+            **temporal
+        }, decoded[best]
+
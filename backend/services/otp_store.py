@@ -0,0 +1,162 @@
+import hashlib
+import heapq
+import hmac
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+OTP_TTL = timedelta(minutes=int(os.getenv("OTP_TTL_MINUTES", "5")))
+# Wrong guesses allowed before the OTP is burned and the voter must re-authenticate
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+
+# verify() outcomes
+OTP_VERIFIED = "verified"
+OTP_INVALID = "invalid"
+OTP_EXPIRED = "expired"
+OTP_LOCKED = "locked"
+OTP_MISSING = "missing"
+
+
+def generate_otp():
+    return f"{secrets.randbelow(900000) + 100000}"
+
+
+def hash_otp(voter_id, otp):
+    """Keyed hash of an OTP, salted with the voter it was issued to.
+
+    Deterministic, so verification is a single equality match on the hash.
+    With OTP_HASH_KEY set, a leaked ``otps`` collection cannot be reversed
+    by hashing the 900,000 possible codes.
+    """
+    key = os.getenv("OTP_HASH_KEY", "").encode()
+    return hmac.new(key, f"{voter_id}:{otp}".encode(), hashlib.sha256).hexdigest()
+
+
+class MongoOTPStore:
+    """OTPs in the small ``otps`` collection, one document per voter ``_id``.
+
+    ``expires_at`` carries a TTL index (see services/db_indexes.py), so
+    abandoned OTPs are removed by the server; since the TTL monitor only
+    runs about once a minute, expiry is also part of every match.
+    """
+
+    def __init__(self, db):
+        self.collection = db.otps
+
+    def issue(self, voter_id, ttl=OTP_TTL):
+        """Replace any pending OTP for the voter with a fresh one; returns the plain code"""
+        otp = generate_otp()
+        now = datetime.utcnow()
+        self.collection.replace_one(
+            {"_id": voter_id},
+            {"otp_hash": hash_otp(voter_id, otp), "attempts": 0, "created_at": now, "expires_at": now + ttl},
+            upsert=True
+        )
+        return otp
+
+    def verify(self, voter_id, otp):
+        now = datetime.utcnow()
+        # The correct code, in time and under the attempt limit, consumes the OTP in one operation
+        consumed = self.collection.find_one_and_delete({
+            "_id": voter_id,
+            "otp_hash": hash_otp(voter_id, otp),
+            "expires_at": {"$gt": now},
+            "attempts": {"$lt": OTP_MAX_ATTEMPTS}
+        }, projection={"_id": 1})
+        if consumed is not None:
+            return OTP_VERIFIED
+
+        # Anything else counts as an attempt; the returned document says why it failed
+        record = self.collection.find_one_and_update(
+            {"_id": voter_id},
+            {"$inc": {"attempts": 1}},
+            projection={"attempts": 1, "expires_at": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if record is None:
+            return OTP_MISSING
+        if record["expires_at"] <= now:
+            self.collection.delete_one({"_id": voter_id})
+            return OTP_EXPIRED
+        if record["attempts"] >= OTP_MAX_ATTEMPTS:
+            self.collection.delete_one({"_id": voter_id})
+            return OTP_LOCKED
+        return OTP_INVALID
+
+
+class MemoryOTPStore:
+    """Process-local OTPs with an expiry heap, for single-node deployments.
+
+    Only correct when one process serves every request (a single worker):
+    an OTP issued by one process is unknown to the others. Expired entries
+    are popped off the heap on every call, so memory stays bounded by the
+    OTPs issued within one TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+        self._expiry_heap = []
+
+    def _purge_expired(self, now):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, voter_id = heapq.heappop(self._expiry_heap)
+            record = self._records.get(voter_id)
+            # A re-issued OTP leaves its predecessor's heap entry behind
+            if record is not None and record["expires_at"] == expires_at:
+                del self._records[voter_id]
+
+    def issue(self, voter_id, ttl=OTP_TTL):
+        otp = generate_otp()
+        now = datetime.utcnow()
+        key = str(voter_id)
+        with self._lock:
+            self._purge_expired(now)
+            self._records[key] = {"otp_hash": hash_otp(voter_id, otp), "attempts": 0, "expires_at": now + ttl}
+            heapq.heappush(self._expiry_heap, (now + ttl, key))
+        return otp
+
+    def verify(self, voter_id, otp):
+        now = datetime.utcnow()
+        key = str(voter_id)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                self._purge_expired(now)
+                return OTP_MISSING
+            if record["expires_at"] <= now:
+                del self._records[key]
+                self._purge_expired(now)
+                return OTP_EXPIRED
+            if hmac.compare_digest(record["otp_hash"], hash_otp(voter_id, otp)):
+                del self._records[key]
+                return OTP_VERIFIED
+            record["attempts"] += 1
+            if record["attempts"] >= OTP_MAX_ATTEMPTS:
+                del self._records[key]
+                return OTP_LOCKED
+            return OTP_INVALID
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._records), "heap_entries": len(self._expiry_heap)}
+
+
+_otp_store = None
+_otp_store_lock = threading.Lock()
+
+
+def get_otp_store(db):
+    """Process-wide store; OTP_STORE=memory selects the in-process backend"""
+    global _otp_store
+    if _otp_store is None:
+        with _otp_store_lock:
+            if _otp_store is None:
+                if os.getenv("OTP_STORE", "mongo") == "memory":
+                    _otp_store = MemoryOTPStore()
+                else:
+                    _otp_store = MongoOTPStore(db)
+    return _otp_store
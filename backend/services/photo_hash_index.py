@@ -0,0 +1,271 @@
+import threading
+from datetime import datetime
+from itertools import combinations
+
+import cv2
+import numpy as np
+
+# Hamming distance (out of 64 bits) under which two photos are treated as the
+# same picture. Recompression and light resizing typically move a pHash by a
+# few bits; unrelated portraits sit around 32.
+PHOTO_DUPLICATE_THRESHOLD = 6
+# Removed rows and their bucket entries are reclaimed once they are this share of all rows
+COMPACT_DEAD_FRACTION = 0.25
+
+_DCT_SIZE = 32
+# Orthonormal DCT-II basis, so pHash is two small matrix products
+_k = np.arange(_DCT_SIZE)
+_DCT = np.sqrt(2.0 / _DCT_SIZE) * np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * _DCT_SIZE))
+_DCT[0] /= np.sqrt(2.0)
+_BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(63, -1, -1, dtype=np.uint64))
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _pack_bits(bits):
+    return int(np.bitwise_or.reduce(_BIT_WEIGHTS[bits.ravel()]))
+
+
+def photo_hashes(image_bytes):
+    """64-bit pHash and dHash of an encoded photo.
+
+    The photo is decoded at a quarter of its size in grayscale; both hashes
+    only look at a 32x32 (pHash) or 9x8 (dHash) thumbnail anyway.
+    """
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        raise ValueError("Could not decode image")
+
+    small = cv2.resize(gray, (_DCT_SIZE, _DCT_SIZE), interpolation=cv2.INTER_AREA).astype(np.float64)
+    low = (_DCT @ small @ _DCT.T)[:8, :8].ravel()
+    # Median over the AC terms: the DC term only encodes overall brightness
+    phash = _pack_bits(low > np.median(low[1:]))
+
+    tiny = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    dhash = _pack_bits(tiny[:, 1:] > tiny[:, :-1])
+    return {"phash": phash, "dhash": dhash}
+
+
+def _to_int64(value):
+    # BSON only has signed 64-bit integers
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_uint64(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class PhotoHashIndex:
+    """Multi-index hashing over 64-bit pHashes for Hamming-radius queries.
+
+    Each hash is split into ``tables`` 16-bit substrings with one hash table
+    per substring. Two hashes within distance ``r`` share at least one
+    substring within ``r // tables`` bits (pigeonhole), so a query probes
+    only the buckets at that small radius and checks the few candidates
+    with a vectorised popcount. At the default radius of 6 that is 17
+    probes per table, whatever the size of the roll.
+    """
+
+    def __init__(self, threshold=PHOTO_DUPLICATE_THRESHOLD, tables=4):
+        self.threshold = threshold
+        self.tables = tables
+        self.bits = 64 // tables
+
+        self._lock = threading.RLock()
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._keys = []
+        self._labels = []
+        self._row_of = {}
+        self._buckets = [{} for _ in range(tables)]
+        self._probe_masks = {}
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _substrings(self, value):
+        mask = (1 << self.bits) - 1
+        return [(value >> (self.bits * t)) & mask for t in range(self.tables)]
+
+    def _masks(self, radius):
+        masks = self._probe_masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for r in range(1, radius + 1):
+                for positions in combinations(range(self.bits), r):
+                    masks.append(sum(1 << p for p in positions))
+            self._probe_masks[radius] = masks
+        return masks
+
+    def add(self, key, label, phash):
+        """Insert or replace one photo"""
+        value = _to_uint64(int(phash))
+        with self._lock:
+            self.remove(key)
+            row = len(self._keys)
+            if row == len(self._hashes):
+                self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+                self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+            self._hashes[row] = value
+            self._alive[row] = True
+            self._keys.append(str(key))
+            self._labels.append(label)
+            self._row_of[str(key)] = row
+            for table, sub in zip(self._buckets, self._substrings(value)):
+                table.setdefault(sub, []).append(row)
+
+    def remove(self, key):
+        # Bucket entries of removed rows are filtered out through _alive until the next compaction
+        with self._lock:
+            row = self._row_of.pop(str(key), None)
+            if row is not None:
+                self._alive[row] = False
+                dead = len(self._keys) - len(self._row_of)
+                if len(self._keys) >= 1024 and dead > COMPACT_DEAD_FRACTION * len(self._keys):
+                    self._compact()
+
+    def _compact(self):
+        """Drop removed rows, renumber the live ones and rebuild the bucket tables"""
+        rows = np.flatnonzero(self._alive[:len(self._keys)])
+        capacity = max(1024, 1 << int(len(rows)).bit_length())
+        hashes = np.zeros(capacity, dtype=np.uint64)
+        hashes[:len(rows)] = self._hashes[rows]
+        self._hashes = hashes
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[:len(rows)] = True
+        self._keys = [self._keys[row] for row in rows]
+        self._labels = [self._labels[row] for row in rows]
+        self._row_of = {key: row for row, key in enumerate(self._keys)}
+        self._buckets = [{} for _ in range(self.tables)]
+        for row in range(len(rows)):
+            for table, sub in zip(self._buckets, self._substrings(int(hashes[row]))):
+                table.setdefault(sub, []).append(row)
+
+    def _distances(self, value, rows):
+        xor = np.bitwise_xor(self._hashes[rows], np.uint64(value))
+        return _POPCOUNT8[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+    def query(self, phash, threshold=None, exclude_label=None):
+        """Photos within ``threshold`` bits of ``phash``, nearest first"""
+        threshold = self.threshold if threshold is None else threshold
+        value = _to_uint64(int(phash))
+        masks = self._masks(threshold // self.tables)
+        with self._lock:
+            candidates = set()
+            for table, sub in zip(self._buckets, self._substrings(value)):
+                for bucket in map(table.get, [sub ^ mask for mask in masks]):
+                    if bucket:
+                        candidates.update(bucket)
+            if not candidates:
+                return []
+            rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            rows = rows[self._alive[rows]]
+            distances = self._distances(value, rows)
+            hits = np.flatnonzero(distances <= threshold)
+            results = [
+                {"image_id": self._keys[rows[i]], "voter_id": self._labels[rows[i]], "distance": int(distances[i])}
+                for i in hits[np.argsort(distances[hits], kind="stable")]
+                if exclude_label is None or self._labels[rows[i]] != exclude_label
+            ]
+            return results
+
+    def find_duplicates(self, threshold=None):
+        """All pairs of photos of different voters within ``threshold`` bits"""
+        threshold = self.threshold if threshold is None else threshold
+        pairs = {}
+        with self._lock:
+            for row in np.flatnonzero(self._alive[:len(self._keys)]):
+                for match in self.query(int(self._hashes[row]), threshold):
+                    other = self._row_of[match["image_id"]]
+                    if other <= row or self._labels[other] == self._labels[row]:
+                        continue
+                    pairs[(row, other)] = match["distance"]
+            return [
+                {
+                    "image_ids": [self._keys[a], self._keys[b]],
+                    "voter_ids": [self._labels[a], self._labels[b]],
+                    "distance": distance
+                }
+                for (a, b), distance in sorted(pairs.items(), key=lambda item: item[1])
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self),
+                "tables": self.tables,
+                "threshold": self.threshold,
+                "largest_bucket": max((len(b) for table in self._buckets for b in table.values()), default=0)
+            }
+
+
+_photo_hash_index = None
+_photo_hash_index_lock = threading.Lock()
+
+
+def load_photo_hash_index(db):
+    """Build the in-memory index from the hashes persisted on GridFS file documents"""
+    index = PhotoHashIndex()
+    for doc in db.fs.files.find({"photo_hash.phash": {"$exists": True}}, {"voter_id": 1, "photo_hash.phash": 1}):
+        index.add(doc["_id"], doc.get("voter_id"), doc["photo_hash"]["phash"])
+    print(f"[OK] Photo hash index loaded: {index.stats()}")
+    return index
+
+
+def get_photo_hash_index(db):
+    """Process-wide index, loaded from Mongo on first use"""
+    global _photo_hash_index
+    if _photo_hash_index is None:
+        with _photo_hash_index_lock:
+            if _photo_hash_index is None:
+                _photo_hash_index = load_photo_hash_index(db)
+    return _photo_hash_index
+
+
+def loaded_photo_hash_index():
+    """The index if it has already been loaded; incremental updates skip loading it"""
+    return _photo_hash_index
+
+
+def find_reused_photo(db, image_bytes, voter_id):
+    """Hash an upload and return (hashes, photos of other voters it duplicates)"""
+    hashes = photo_hashes(image_bytes)
+    matches = get_photo_hash_index(db).query(hashes["phash"], exclude_label=voter_id)
+    return hashes, matches
+
+
+def photo_hash_fields(hashes):
+    """Hashes in the form stored on GridFS file documents (signed, for BSON)"""
+    return {k: _to_int64(v) for k, v in hashes.items()}
+
+
+def store_photo_hash(db, image_id, voter_id, hashes):
+    """Persist the hashes on the GridFS file document and add them to the loaded index"""
+    db.fs.files.update_one({"_id": image_id}, {"$set": {"photo_hash": photo_hash_fields(hashes)}})
+    index = loaded_photo_hash_index()
+    if index is not None:
+        index.add(image_id, voter_id, hashes["phash"])
+
+
+def record_duplicate_photo_anomalies(db, pairs):
+    """Upsert one 'Duplicate Photo' anomaly per pair of voters sharing a photo"""
+    voter_ids = {v for pair in pairs for v in pair["voter_ids"]}
+    stations = {
+        v["voter_id"]: v.get("polling_station")
+        for v in db.voters.find({"voter_id": {"$in": list(voter_ids)}}, {"voter_id": 1, "polling_station": 1})
+    }
+    for pair in pairs:
+        first, second = pair["voter_ids"]
+        db.anomalies.update_one(
+            {"detection_type": "Duplicate Photo", "image_ids": pair["image_ids"]},
+            {"$set": {
+                "booth_name": stations.get(first) or stations.get(second),
+                "detection_type": "Duplicate Photo",
+                "details": f"Voters {first} and {second} were enrolled with the same photo ({pair['distance']} bits apart)",
+                "confidence_score": round(1.0 - pair["distance"] / 64.0, 2),
+                "voter_ids": pair["voter_ids"],
+                "image_ids": pair["image_ids"],
+                "detected_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    return len(pairs)
@@ -0,0 +1,232 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import gridfs
+from bson import ObjectId
+from gridfs.errors import FileExists
+from pymongo import DESCENDING, UpdateOne
+
+from services.enrollment_cache import loaded_enrollment_cache
+from services.face_index import loaded_face_index
+from services.photo_hash_index import loaded_photo_hash_index
+from services.thumbnails import get_thumbnail_store
+
+# Superseded photos a voter keeps (and that garbage collection leaves alone)
+PHOTO_HISTORY_LIMIT = 5
+# Files younger than this are never collected: an upload writes its blob before its pointer
+GC_GRACE_PERIOD = timedelta(hours=1)
+
+
+def photo_sha256(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class PhotoStore:
+    """Content-addressed voter photos in GridFS, with a versioned pointer per voter.
+
+    A voter's photo bytes are stored once, keyed by (voter_id, SHA-256):
+    uploading the same content again for that voter (a retry, a re-submitted
+    form) reuses the existing file instead of writing another copy. The same
+    bytes uploaded for two different voters stay two files, so each image_id
+    belongs to exactly one voter and the face and photo-hash indexes can
+    still report the reuse. Which photo is a voter's current
+    one lives in ``voter_photos`` (``_id`` = voter_id, so it is a point
+    query), together with a version number and the last few superseded
+    photos; ``voters.image_id`` mirrors the current pointer for existing
+    readers. Files nothing points at any more are removed by
+    ``collect_garbage``.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.fs = gridfs.GridFS(db)
+
+    def put(self, image_bytes, voter_id, content_type="image/jpeg", **metadata):
+        """Store content once per voter; returns (image_id, created) where created is False on a dedup hit"""
+        digest = photo_sha256(image_bytes)
+        existing = self.db.fs.files.find_one({"voter_id": voter_id, "sha256": digest}, {"_id": 1})
+        if existing is not None:
+            return existing["_id"], False
+
+        image_id = ObjectId()
+        try:
+            self.fs.put(
+                image_bytes,
+                _id=image_id,
+                filename=f"voter_photo_{voter_id}",
+                content_type=content_type,
+                voter_id=voter_id,
+                upload_date=datetime.utcnow(),
+                sha256=digest,
+                **metadata
+            )
+        except FileExists:
+            # GridIn reports the (voter_id, sha256) index's DuplicateKeyError as FileExists:
+            # a concurrent upload of the same bytes won; drop our chunks and use its file
+            self.db.fs.chunks.delete_many({"files_id": image_id})
+            return self.db.fs.files.find_one({"voter_id": voter_id, "sha256": digest}, {"_id": 1})["_id"], False
+        return image_id, True
+
+    def store_voter_photo(self, image_bytes, voter_id, **metadata):
+        """put() the photo and make it the voter's current one; returns (image_id, created)"""
+        image_id, created = self.put(image_bytes, voter_id, **metadata)
+        self.set_current_many([(voter_id, image_id, photo_sha256(image_bytes))])
+        return image_id, created
+
+    def set_current_many(self, entries):
+        """Point each (voter_id, image_id, sha256) voter at its photo, keeping the previous ones as history"""
+        if not entries:
+            return
+        now = datetime.utcnow()
+        current = {
+            doc["_id"]: doc
+            for doc in self.db.voter_photos.find(
+                {"_id": {"$in": list({voter_id for voter_id, _, _ in entries})}},
+                {"image_id": 1, "sha256": 1, "version": 1}
+            )
+        }
+        pointer_updates, voter_updates = [], []
+        for voter_id, image_id, digest in entries:
+            image_id = str(image_id)
+            previous = current.get(voter_id)
+            if previous is not None and previous["image_id"] == image_id:
+                continue
+            update = {
+                "$set": {"image_id": image_id, "sha256": digest, "updated_at": now},
+                "$inc": {"version": 1}
+            }
+            if previous is not None:
+                # The superseded photo's decoded copy / template is no longer what auth should see
+                if loaded_enrollment_cache() is not None:
+                    loaded_enrollment_cache().invalidate(previous["image_id"])
+                update["$push"] = {"history": {
+                    "$each": [{
+                        "image_id": previous["image_id"],
+                        "sha256": previous.get("sha256"),
+                        "version": previous.get("version"),
+                        "replaced_at": now
+                    }],
+                    "$slice": -PHOTO_HISTORY_LIMIT
+                }}
+            pointer_updates.append(UpdateOne({"_id": voter_id}, update, upsert=True))
+            voter_updates.append(UpdateOne({"voter_id": voter_id}, {"$set": {"image_id": image_id}}))
+            current[voter_id] = {"image_id": image_id, "sha256": digest, "version": (previous or {}).get("version", 0) + 1}
+
+        if pointer_updates:
+            self.db.voter_photos.bulk_write(pointer_updates, ordered=True)
+            self.db.voters.bulk_write(voter_updates, ordered=False)
+
+    def current_image_id(self, voter_id):
+        """The voter's current photo id (a point query), or None"""
+        pointer = self.db.voter_photos.find_one({"_id": voter_id}, {"image_id": 1})
+        if pointer is not None:
+            return pointer["image_id"]
+        # Photos stored before the pointer existed
+        voter = self.db.voters.find_one({"voter_id": voter_id}, {"image_id": 1})
+        if voter and voter.get("image_id"):
+            return voter["image_id"]
+        legacy = self.db.fs.files.find_one({"voter_id": voter_id}, {"_id": 1}, sort=[("uploadDate", DESCENDING)])
+        return str(legacy["_id"]) if legacy else None
+
+    def get_current(self, voter_id):
+        """GridOut of the voter's current photo, or None"""
+        image_id = self.current_image_id(voter_id)
+        if image_id is None:
+            return None
+        try:
+            return self.fs.get(ObjectId(image_id))
+        except gridfs.NoFile:
+            return None
+
+    def referenced_image_ids(self):
+        referenced = set()
+        for voter in self.db.voters.find({"image_id": {"$nin": [None, ""]}}, {"image_id": 1}):
+            referenced.add(str(voter["image_id"]))
+        for pointer in self.db.voter_photos.find({}, {"image_id": 1, "history.image_id": 1}):
+            referenced.add(pointer["image_id"])
+            referenced.update(entry["image_id"] for entry in pointer.get("history", []))
+        return referenced
+
+    def collect_garbage(self, grace=GC_GRACE_PERIOD, include_legacy=False, dry_run=False):
+        """Delete photo files no voter points at, current or in history.
+
+        Only content-addressed files (those with a ``sha256``) are considered
+        unless ``include_legacy`` is set: older standalone uploads never set
+        a voter pointer and are still found through their voter_id metadata.
+        """
+        referenced = self.referenced_image_ids()
+        query = {"uploadDate": {"$lt": datetime.utcnow() - grace}}
+        if not include_legacy:
+            query["sha256"] = {"$exists": True}
+
+        scanned, garbage = 0, []
+        for doc in self.db.fs.files.find(query, {"_id": 1}):
+            scanned += 1
+            if str(doc["_id"]) not in referenced:
+                garbage.append(doc["_id"])
+
+        orphans = self.orphan_chunk_file_ids(grace)
+        if not dry_run:
+            for image_id in garbage:
+                self._delete_file(image_id)
+            if orphans:
+                self.db.fs.chunks.delete_many({"files_id": {"$in": orphans}})
+        if garbage or orphans:
+            print(f"[INFO] Photo GC: {len(garbage)} unreferenced of {scanned} files, "
+                  f"{len(orphans)} orphaned chunk sets{' (dry run)' if dry_run else ' deleted'}")
+        return {
+            "scanned": scanned,
+            "referenced": len(referenced),
+            "garbage": len(garbage),
+            "deleted": 0 if dry_run else len(garbage),
+            "orphan_chunk_sets": len(orphans),
+            "image_ids": [str(i) for i in garbage[:100]]
+        }
+
+    def orphan_chunk_file_ids(self, grace=GC_GRACE_PERIOD):
+        """files_id of chunks whose file document was never written (an interrupted upload or batch)"""
+        # Chunks are written before their file document, so only ids older than the grace period count
+        cutoff = ObjectId.from_datetime(datetime.utcnow() - grace)
+        return [
+            doc["files_id"]
+            for doc in self.db.fs.chunks.aggregate([
+                {"$match": {"n": 0, "files_id": {"$lt": cutoff}}},
+                {"$lookup": {"from": "fs.files", "localField": "files_id", "foreignField": "_id", "as": "file"}},
+                {"$match": {"file": {"$size": 0}}},
+                {"$project": {"_id": 0, "files_id": 1}}
+            ])
+        ]
+
+    def release_voter(self, voter_id, image_id=None):
+        """Drop a deleted voter's pointer and every photo of theirs no other voter uses.
+
+        Returns the number of files deleted. Shared (deduplicated) content
+        stays as long as another voter still points at it.
+        """
+        pointer = self.db.voter_photos.find_one_and_delete({"_id": voter_id})
+        candidates = {str(image_id)} if image_id else set()
+        if pointer is not None:
+            candidates.add(pointer["image_id"])
+            candidates.update(entry["image_id"] for entry in pointer.get("history", []))
+
+        deleted = 0
+        for candidate in candidates:
+            in_use = (
+                self.db.voters.find_one({"image_id": candidate, "voter_id": {"$ne": voter_id}}, {"_id": 1})
+                or self.db.voter_photos.find_one(
+                    {"$or": [{"image_id": candidate}, {"history.image_id": candidate}]}, {"_id": 1}
+                )
+            )
+            if not in_use:
+                self._delete_file(ObjectId(candidate))
+                deleted += 1
+        return deleted
+
+    def _delete_file(self, image_id):
+        for index in (loaded_face_index(), loaded_photo_hash_index()):
+            if index is not None:
+                index.remove(image_id)
+        if loaded_enrollment_cache() is not None:
+            loaded_enrollment_cache().invalidate(image_id)
+        get_thumbnail_store(self.db).delete(image_id)
+        self.fs.delete(image_id)
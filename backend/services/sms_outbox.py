@@ -0,0 +1,258 @@
+import collections
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from utils.sms import SmsSendError, get_sms_transport
+
+# Outbox states. pending -> sending -> sent, or back to pending with a later
+# next_attempt_at, or dead once SMS_MAX_ATTEMPTS is used up (or on a permanent
+# rejection). Messages with an expires_at that pass it unsent become expired.
+SMS_PENDING = "pending"
+SMS_SENDING = "sending"
+SMS_SENT = "sent"
+SMS_DEAD = "dead"
+SMS_EXPIRED = "expired"
+
+
+def enqueue_sms(db, to_number, body, kind=None, expires_at=None):
+    """Queue a message in ``sms_outbox`` and return its id; this is all a request handler does.
+
+    ``expires_at`` is for time-bound content such as an OTP: the message is
+    not sent after it, and its body is dropped once it is no longer pending.
+    """
+    now = datetime.utcnow()
+    message = {
+        "to": to_number,
+        "body": body,
+        "kind": kind,
+        "status": SMS_PENDING,
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now
+    }
+    if expires_at is not None:
+        message["expires_at"] = expires_at
+    message_id = db.sms_outbox.insert_one(message).inserted_id
+    if _sms_dispatcher is not None:
+        _sms_dispatcher.wake()
+    return message_id
+
+
+class SharedRateLimiter:
+    """Fixed-window send counter in Mongo, shared by every dispatcher.
+
+    The provider's cap is per account, not per process: each send takes a
+    slot in the current window of one ``sms_rate_limit`` document, whichever
+    process or thread sends it, and waits for the next window when it is full.
+    """
+
+    def __init__(self, db, rate_per_sec, key="provider"):
+        self.collection = db.sms_rate_limit
+        self.rate = float(rate_per_sec)
+        # Rates under 1/s get one slot per 1/rate seconds
+        self.window_seconds = max(1.0, 1.0 / self.rate)
+        self.capacity = max(1, int(self.rate * self.window_seconds))
+        self.key = key
+
+    def acquire(self):
+        while True:
+            now = time.time()
+            window = int(now // self.window_seconds)
+            # A free slot in the current window...
+            if self.collection.find_one_and_update(
+                {"_id": self.key, "window": window, "count": {"$lt": self.capacity}},
+                {"$inc": {"count": 1}},
+                projection={"_id": 1}
+            ) is not None:
+                return
+            # ...or the first slot of a new window
+            try:
+                result = self.collection.update_one(
+                    {"_id": self.key, "window": {"$lt": window}},
+                    {"$set": {"window": window, "count": 1}},
+                    upsert=True
+                )
+                if result.modified_count or result.upserted_id is not None:
+                    return
+            except DuplicateKeyError:
+                # The window is current and full; the upsert tried to insert a second document
+                pass
+            time.sleep(max(0.001, (window + 1) * self.window_seconds - now))
+
+
+class SmsDispatcher:
+    """Background delivery of the SMS outbox.
+
+    One thread claims ready messages in batches (one update_many tags the
+    whole batch with a claim token and a lease), hands them to a pool of
+    sending threads that share a pooled HTTP transport, then records every
+    outcome in one bulk write. Failures are retried with jittered
+    exponential backoff.
+
+    A claimed message whose lease runs out (its process died mid-send) is
+    claimed again, so delivery is at-least-once. Several processes can
+    each run a dispatcher against the same outbox: claims never overlap,
+    and the provider's per-second cap is enforced across all of them by
+    a SharedRateLimiter in the database.
+    """
+
+    def __init__(self, db, transport=None, workers=4, rate_per_sec=10, max_attempts=5,
+                 backoff_base=2.0, backoff_max=300.0, lease_seconds=60, poll_interval=1.0, batch_size=None):
+        self.collection = db.sms_outbox
+        self.transport = transport or get_sms_transport(pool_size=workers)
+        self.workers = workers
+        self.rate_limiter = SharedRateLimiter(db, rate_per_sec)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size or workers * 4
+        self._counters = collections.Counter()
+        self._counters_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms-send")
+        self._thread = threading.Thread(target=self._run, name="sms-dispatcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._claim_batch()
+            except Exception as e:
+                print(f"[ERROR] SMS outbox claim failed: {e}")
+                batch = []
+            if not batch:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            outcomes = list(self._executor.map(self._deliver, batch))
+            try:
+                self._record(outcomes)
+            except Exception as e:
+                # The leases run out and the batch is claimed again
+                print(f"[ERROR] Could not record SMS outcomes: {e}")
+
+    def _claim_batch(self):
+        now = datetime.utcnow()
+        ready = {"$or": [
+            {"status": SMS_PENDING, "next_attempt_at": {"$lte": now}},
+            {"status": SMS_SENDING, "lease_until": {"$lt": now}}
+        ]}
+        ids = [doc["_id"] for doc in self.collection.find(ready, {"_id": 1}).sort("next_attempt_at", ASCENDING).limit(self.batch_size)]
+        if not ids:
+            return []
+        claim = ObjectId()
+        # Re-checking `ready` means a message another dispatcher claimed in between is skipped
+        self.collection.update_many(
+            {"_id": {"$in": ids}, **ready},
+            {"$set": {"status": SMS_SENDING, "claim": claim, "lease_until": now + self.lease}, "$inc": {"attempts": 1}}
+        )
+        return list(self.collection.find({"claim": claim}))
+
+    def _deliver(self, message):
+        """Send one claimed message; returns (message, outcome, detail)"""
+        if message.get("expires_at") and message["expires_at"] <= datetime.utcnow():
+            return message, SMS_EXPIRED, None
+        self.rate_limiter.acquire()
+        try:
+            return message, SMS_SENT, self.transport.send(message["to"], message["body"])
+        except SmsSendError as e:
+            return message, (SMS_PENDING if e.retryable else SMS_DEAD), str(e)
+        except Exception as e:
+            return message, SMS_PENDING, f"{type(e).__name__}: {e}"
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    def _record(self, outcomes):
+        now = datetime.utcnow()
+        updates, counts = [], collections.Counter()
+        for message, outcome, detail in outcomes:
+            unset = {"claim": "", "lease_until": ""}
+            if outcome == SMS_PENDING and message["attempts"] >= self.max_attempts:
+                outcome = SMS_DEAD
+            if outcome == SMS_SENT:
+                fields = {"status": SMS_SENT, "sid": detail, "finished_at": now}
+            elif outcome == SMS_EXPIRED:
+                fields = {"status": SMS_EXPIRED, "finished_at": now}
+            elif outcome == SMS_DEAD:
+                fields = {"status": SMS_DEAD, "last_error": detail, "dead_at": now}
+                print(f"[WARN] SMS {message['_id']} to ******{str(message['to'])[-4:]} dead-lettered "
+                      f"after {message['attempts']} attempts: {detail}")
+            else:
+                fields = {"status": SMS_PENDING, "last_error": detail,
+                          "next_attempt_at": now + self._backoff(message["attempts"])}
+            if outcome != SMS_PENDING and message.get("expires_at"):
+                unset["body"] = ""
+            counts[outcome if outcome != SMS_PENDING else "retried"] += 1
+            updates.append(UpdateOne({"_id": message["_id"], "claim": message["claim"]},
+                                     {"$set": fields, "$unset": unset}))
+        self.collection.bulk_write(updates, ordered=False)
+        with self._counters_lock:
+            self._counters.update(counts)
+            self._counters["batches"] += 1
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "workers": self.workers,
+            "rate_per_sec": self.rate_limiter.rate,
+            "pending": self.collection.count_documents({"status": SMS_PENDING}),
+            "dead": self.collection.count_documents({"status": SMS_DEAD})
+        }
+
+
+_sms_dispatcher = None
+_sms_dispatcher_lock = threading.Lock()
+
+
+def start_sms_dispatcher(db):
+    """Start the process-wide dispatcher configured from the environment.
+
+    SMS_DISPATCH_WORKERS is its number of sending threads; whether the web
+    app runs a dispatcher at all is SMS_DISPATCH_IN_APP (see app.py).
+    """
+    global _sms_dispatcher
+    if _sms_dispatcher is None:
+        with _sms_dispatcher_lock:
+            if _sms_dispatcher is None:
+                _sms_dispatcher = SmsDispatcher(
+                    db,
+                    workers=max(1, int(os.getenv("SMS_DISPATCH_WORKERS", "4"))),
+                    rate_per_sec=float(os.getenv("SMS_RATE_PER_SEC", "10")),
+                    max_attempts=int(os.getenv("SMS_MAX_ATTEMPTS", "5")),
+                    backoff_base=float(os.getenv("SMS_BACKOFF_BASE_SECONDS", "2")),
+                    backoff_max=float(os.getenv("SMS_BACKOFF_MAX_SECONDS", "300")),
+                    lease_seconds=float(os.getenv("SMS_LEASE_SECONDS", "60"))
+                ).start()
+    return _sms_dispatcher
+
+
+def loaded_sms_dispatcher():
+    """The dispatcher if this process runs one"""
+    return _sms_dispatcher
@@ -0,0 +1,134 @@
+import collections
+import os
+import threading
+
+import cv2
+import gridfs
+import numpy as np
+from bson import ObjectId
+
+from utils.byte_lru import ByteBoundedLRU
+from utils.image_header import read_image_header
+
+THUMBNAIL_SIZES = (64, 160)
+# format -> (extension, content type, encoder params)
+THUMBNAIL_FORMATS = {
+    "webp": (".webp", "image/webp", [cv2.IMWRITE_WEBP_QUALITY, 80]),
+    "jpeg": (".jpg", "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, 80])
+}
+THUMBNAIL_BUCKET = "thumbnails"
+
+
+def _reduced_read_flag(header, size):
+    """Largest libjpeg DCT downscale that still leaves the long side at or above ``size``"""
+    if header is None or header.format != 'JPEG':
+        return cv2.IMREAD_COLOR
+    long_side = max(header.size)
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if long_side // factor >= size:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def render_thumbnail(image_bytes, size, fmt="webp"):
+    """Encode a copy of a photo whose longer side is ``size`` pixels"""
+    extension, _, params = THUMBNAIL_FORMATS[fmt]
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), _reduced_read_flag(read_image_header(image_bytes), size))
+    if image is None:
+        raise ValueError("Could not decode image")
+    h, w = image.shape[:2]
+    scale = size / float(max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode {fmt} thumbnail")
+    return encoded.tobytes()
+
+
+class ThumbnailStore:
+    """Small derivatives of voter photos, kept in their own GridFS bucket.
+
+    A thumbnail is rendered from the original the first time it is asked for
+    and stored in the ``thumbnails`` bucket under (image_id, size, format),
+    so every later request, from any process, is a single small read. The
+    most used ones are also held in a byte-bounded in-process LRU.
+    """
+
+    def __init__(self, db, max_memory_bytes=16 * 1024 * 1024):
+        self.db = db
+        self.originals = gridfs.GridFS(db)
+        self.bucket = gridfs.GridFS(db, collection=THUMBNAIL_BUCKET)
+
+        self._lock = threading.Lock()
+        self._cache = ByteBoundedLRU(max_memory_bytes)
+        self._counters = collections.Counter()
+
+    def get(self, image_id, size, fmt="webp"):
+        """Thumbnail bytes for a stored photo; raises gridfs.NoFile if the original is gone"""
+        if size not in THUMBNAIL_SIZES or fmt not in THUMBNAIL_FORMATS:
+            raise ValueError(f"Unsupported thumbnail {size}px {fmt}")
+        image_id = str(image_id)
+        key = (image_id, size, fmt)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._counters["memory_hits"] += 1
+                return cached[0]
+
+        stored = self.bucket.find_one({"image_id": image_id, "size": size, "format": fmt})
+        if stored is not None:
+            data = stored.read()
+            source = "bucket_hits"
+        else:
+            data = render_thumbnail(self.originals.get(ObjectId(image_id)).read(), size, fmt)
+            self.bucket.put(
+                data,
+                filename=f"{image_id}_{size}{THUMBNAIL_FORMATS[fmt][0]}",
+                content_type=THUMBNAIL_FORMATS[fmt][1],
+                image_id=image_id,
+                size=size,
+                format=fmt
+            )
+            source = "rendered"
+
+        with self._lock:
+            self._counters[source] += 1
+            self._cache.put(key, data, len(data))
+        return data
+
+    def delete(self, image_id):
+        """Drop every derivative of a photo that is being deleted or replaced"""
+        image_id = str(image_id)
+        with self._lock:
+            for size in THUMBNAIL_SIZES:
+                for fmt in THUMBNAIL_FORMATS:
+                    self._cache.pop((image_id, size, fmt))
+        for stored in self.db[THUMBNAIL_BUCKET].files.find({"image_id": image_id}, {"_id": 1}):
+            self.bucket.delete(stored["_id"])
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["memory_hits"] + self._counters["bucket_hits"] + self._counters["rendered"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["memory_hits"] / lookups, 3) if lookups else None,
+                "memory_bytes": self._cache.size,
+                "cached_thumbnails": len(self._cache)
+            }
+
+
+_thumbnail_store = None
+_thumbnail_store_lock = threading.Lock()
+
+
+def get_thumbnail_store(db):
+    """Process-wide store configured from the environment"""
+    global _thumbnail_store
+    if _thumbnail_store is None:
+        with _thumbnail_store_lock:
+            if _thumbnail_store is None:
+                _thumbnail_store = ThumbnailStore(
+                    db, max_memory_bytes=int(os.getenv("THUMBNAIL_CACHE_MB", "16")) * 1024 * 1024
+                )
+    return _thumbnail_store
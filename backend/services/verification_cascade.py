@@ -0,0 +1,79 @@
+import time
+
+from deepface import DeepFace
+
+from services.advanced_face_verification import AdvancedFaceVerification
+from utils.face_detection import detect_largest_face
+
+
+class VerificationCascade:
+    """Cheap first pass that settles clear matches and clear mismatches.
+
+    A Haar detector on a downscaled frame finds the face, and a light
+    embedding model (SFace by default) scores it against the stored photo.
+    Only distances inside the ambiguous band ``[accept_below, reject_above)``
+    are escalated to the full Facenet pass; so is anything the cheap stages
+    cannot handle (no face found, no light embedding stored).
+    """
+
+    LIGHT_MODEL = 'SFace'
+    DETECT_WIDTH = 320
+
+    def __init__(self, accept_below=0.30, reject_above=0.80):
+        self.accept_below = accept_below
+        self.reject_above = reject_above
+
+    def detect_face(self, image):
+        """Largest face box (x, y, w, h) in full-resolution coordinates, or None"""
+        return detect_largest_face(image, self.DETECT_WIDTH)
+
+    def light_embedding(self, image, box=None):
+        """Embed a face crop with the light model; detects the face first if no box is given"""
+        box = box or self.detect_face(image)
+        if box is None:
+            return None
+        x, y, w, h = box
+        crop = image[max(0, y):y + h, max(0, x):x + w]
+        representation = DeepFace.represent(
+            crop,
+            model_name=self.LIGHT_MODEL,
+            detector_backend='skip',
+            enforce_detection=False
+        )
+        return [float(v) for v in representation[0]['embedding']]
+
+    def pre_check(self, live_image, stored_light_embedding):
+        """Run the cheap stages; returns (decision, distance, stage records).
+
+        decision is 'accept', 'reject' or 'escalate'.
+        """
+        stages = []
+
+        start = time.perf_counter()
+        box = self.detect_face(live_image)
+        stages.append({
+            'stage': 'fast_detection',
+            'decision': 'pass' if box else 'escalate',
+            'ms': round((time.perf_counter() - start) * 1000.0, 2)
+        })
+        if box is None or not stored_light_embedding:
+            return 'escalate', None, stages
+
+        start = time.perf_counter()
+        live_embedding = self.light_embedding(live_image, box)
+        distance = AdvancedFaceVerification.cosine_distance(stored_light_embedding, live_embedding)
+        if distance < self.accept_below:
+            decision = 'accept'
+        elif distance >= self.reject_above:
+            decision = 'reject'
+        else:
+            decision = 'escalate'
+        stages.append({
+            'stage': 'light_embedding',
+            'model': self.LIGHT_MODEL,
+            'distance': round(distance, 4),
+            'decision': decision,
+            'ms': round((time.perf_counter() - start) * 1000.0, 2)
+        })
+        return decision, distance, stages
+
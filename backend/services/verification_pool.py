@@ -0,0 +1,148 @@
+import collections
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from services.advanced_face_verification import AdvancedFaceVerification
+
+
+class VerificationPoolBusy(Exception):
+    """Raised instead of queueing when the pool already has max_pending jobs"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Face verification queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# --- Worker process side ---
+_worker_verifier = None
+
+
+def _init_worker(cascade, preprocessing):
+    global _worker_verifier
+    _worker_verifier = AdvancedFaceVerification()
+    if cascade:
+        _worker_verifier.enable_cascade(*cascade)
+    if preprocessing:
+        _worker_verifier.configure_preprocessing(**preprocessing)
+    else:
+        _worker_verifier.configure_preprocessing(enabled=False)
+    _worker_verifier.warm_up()
+
+
+def _run_in_worker(method, args):
+    started = time.time()
+    result = getattr(_worker_verifier, method)(*args)
+    return result, started, time.time()
+
+
+# --- Request side ---
+class VerificationPool:
+    """Runs AdvancedFaceVerification methods in dedicated worker processes.
+
+    Each worker loads and warms its own model, so the CPU-heavy OpenCV and
+    TensorFlow work never runs on a Flask request thread. Admission is bounded
+    by ``max_pending``: once that many jobs are queued or running, ``run``
+    raises VerificationPoolBusy immediately instead of waiting.
+    """
+
+    def __init__(self, workers=2, max_pending=None, timeout=30, cascade=None, preprocessing=None):
+        self.workers = max(1, int(workers))
+        self.max_pending = int(max_pending or self.workers * 4)
+        self.timeout = timeout
+
+        # spawn, not fork: forking a process that already loaded TensorFlow is unsafe
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            # (accept_below, reject_above) and the preprocessing sizes, so workers
+            # run the same pipeline as the parent
+            initargs=(cascade, preprocessing)
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "timed_out": 0, "rejected_busy": 0}
+        self._wait_ms = collections.deque(maxlen=1000)
+        self._service_ms = collections.deque(maxlen=1000)
+
+    def run(self, method, *args):
+        with self._lock:
+            if self._in_flight >= self.max_pending:
+                self._counters["rejected_busy"] += 1
+                raise VerificationPoolBusy(self._retry_after_locked())
+            self._in_flight += 1
+            self._counters["submitted"] += 1
+
+        submitted = time.time()
+        try:
+            future = self._executor.submit(_run_in_worker, method, args)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+                self._counters["failed"] += 1
+            raise
+        # The slot is held until the worker is actually done: a job that outlives
+        # its caller's timeout is still load on the pool
+        future.add_done_callback(self._release)
+        try:
+            result, started, finished = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._counters["timed_out"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._counters["failed"] += 1
+            raise
+
+        with self._lock:
+            self._counters["completed"] += 1
+            self._wait_ms.append(max(0.0, started - submitted) * 1000.0)
+            self._service_ms.append((finished - started) * 1000.0)
+        return result
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _retry_after_locked(self):
+        # Rough drain time for the current backlog, at least one second
+        if not self._service_ms:
+            return 1
+        mean_service_s = sum(self._service_ms) / len(self._service_ms) / 1000.0
+        return max(1, math.ceil(mean_service_s * self._in_flight / self.workers))
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.workers),
+                **self._counters,
+                "wait_ms": _summary(self._wait_ms),
+                "service_ms": _summary(self._service_ms)
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _summary(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99)
+    }
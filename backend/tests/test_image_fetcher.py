@@ -0,0 +1,131 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from services.image_fetcher import ImageFetcher, ImageFetchError
+
+PHOTO = b"\xff\xd8\xff\xe0" + b"\x00" * 2048 + b"\xff\xd9"
+BODY_LIMIT = 16 * 1024
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections.add(self.client_address)
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith("/photo"):
+            if self.headers.get("If-None-Match") == '"v1"':
+                return self._send(304, b"", etag='"v1"')
+            return self._send(200, PHOTO, etag='"v1"')
+        if self.path == "/slow":
+            time.sleep(1.0)
+            return self._send(200, PHOTO)
+        if self.path.startswith("/redirect/"):
+            hops = int(self.path.rsplit("/", 1)[1])
+            if hops == 0:
+                return self._send(200, PHOTO)
+            self.send_response(302)
+            self.send_header("Location", f"/redirect/{hops - 1}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/big":
+            return self._send(200, b"\x00" * (BODY_LIMIT * 2))
+        if self.path == "/big-undeclared":
+            # Chunked, so the size is only known by reading it
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for _ in range(8):
+                chunk = b"\x00" * 4096
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        if self.path == "/page.html":
+            return self._send(200, b"<html></html>", content_type="text/html; charset=utf-8")
+        self._send(404, b"", content_type="text/plain")
+
+    def _send(self, status, body, content_type="image/jpeg", etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    httpd.daemon_threads = True
+    httpd.connections = set()
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    return ImageFetcher(max_memory_bytes=1024 * 1024, read_timeout=0.3, max_body_bytes=BODY_LIMIT, max_redirects=2)
+
+
+def test_fetch_caches_body(server, fetcher):
+    assert fetcher.fetch(server.url + "/photo")["content"] == PHOTO
+    assert fetcher.fetch(server.url + "/photo")["content"] == PHOTO
+    assert server.requests == ["/photo"]
+    assert fetcher.stats()["memory_hits"] == 1
+
+
+def test_stale_entry_is_revalidated_with_etag(server, fetcher):
+    fetcher.max_age = 0
+    fetcher.fetch(server.url + "/photo")
+    entry = fetcher.fetch(server.url + "/photo")
+    assert entry["content"] == PHOTO
+    assert fetcher.stats()["revalidated"] == 1
+
+
+def test_read_timeout(server, fetcher):
+    with pytest.raises((requests.Timeout, requests.ConnectionError)):
+        fetcher.fetch(server.url + "/slow")
+
+
+def test_redirect_limit(server, fetcher):
+    assert fetcher.fetch(server.url + "/redirect/2")["content"] == PHOTO
+    with pytest.raises(requests.TooManyRedirects):
+        fetcher.fetch(server.url + "/redirect/3")
+
+
+@pytest.mark.parametrize("path", ["/big", "/big-undeclared"])
+def test_oversized_body_is_rejected(server, fetcher, path):
+    with pytest.raises(ImageFetchError):
+        fetcher.fetch(server.url + path)
+    assert fetcher.stats()["cached_bodies"] == 0
+
+
+def test_non_image_content_type_is_rejected(server, fetcher):
+    with pytest.raises(ImageFetchError):
+        fetcher.fetch(server.url + "/page.html")
+    assert fetcher.stats()["cached_bodies"] == 0
+
+
+def test_connections_are_reused(server, fetcher):
+    for n in range(5):
+        fetcher.fetch(server.url + f"/photo?n={n}")
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
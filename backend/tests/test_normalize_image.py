@@ -0,0 +1,81 @@
+import base64
+import struct
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+from flask import Flask
+
+from utils import image_validator
+from utils.image_validator import VoterImageValidator
+
+
+def png_header_only(width, height):
+    """A PNG whose IHDR declares width x height but carries almost no pixel data"""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    idat = zlib.compress(b"\x00" * 64)
+
+    def chunk(kind, payload):
+        return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', idat) + chunk(b'IEND', b'')
+
+
+@pytest.fixture
+def client():
+    from routes.image_routes import image_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(image_bp, url_prefix='/api/admin')
+    return app.test_client()
+
+
+@pytest.fixture
+def no_decode(monkeypatch):
+    def imdecode(*args):
+        raise AssertionError("oversized image was decoded")
+    monkeypatch.setattr(image_validator.cv2, "imdecode", imdecode)
+
+
+def test_oversized_dimensions_rejected_before_decoding(client, no_decode):
+    bomb = png_header_only(20000, 20000)
+    response = client.post('/api/admin/upload-voter-image?normalize=1', json={
+        "voter_id": "ABC1234567",
+        "image": "data:image/png;base64," + base64.b64encode(bomb).decode('ascii')
+    })
+    assert response.status_code == 400
+    assert "megapixels" in response.get_json()["errors"][0]
+
+
+def test_oversized_raw_body_rejected_before_decoding(client, no_decode):
+    response = client.post('/api/admin/upload-voter-image?normalize=1&voter_id=ABC1234567',
+                           data=png_header_only(10000, 5000), content_type='image/png')
+    assert response.status_code == 400
+
+
+def test_unrecognised_format_rejected():
+    with pytest.raises(ValueError):
+        VoterImageValidator().normalize_image(b"GIF89a" + b"\x00" * 64)
+
+
+def test_large_source_decoded_reduced():
+    validator = VoterImageValidator()
+    image = np.full((3000, 4000, 3), 128, np.uint8)
+    ok, encoded = cv2.imencode('.jpg', image)
+    assert ok
+
+    flag, factor = validator._reduced_read_flag(4000, 3000)
+    assert (flag, factor) == (cv2.IMREAD_REDUCED_COLOR_2, 2)
+
+    jpeg_bytes, report = validator.normalize_image(encoded.tobytes())
+    decoded = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape[:2] == (validator.REQUIRED_HEIGHT_PX, validator.REQUIRED_WIDTH_PX)
+    # Reported in source pixels, not in the reduced decode's
+    x, y, w, h = report["crop_box"]
+    assert h > 1500 and x + w <= 4000 and y + h <= 3000
+
+
+def test_small_source_decoded_full_size():
+    validator = VoterImageValidator()
+    assert validator._reduced_read_flag(800, 600) == (cv2.IMREAD_COLOR, 1)
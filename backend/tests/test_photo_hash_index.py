@@ -0,0 +1,63 @@
+import numpy as np
+
+from services.photo_hash_index import PhotoHashIndex
+
+
+def random_hashes(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [int(h) for h in rng.integers(0, 1 << 63, size=count, dtype=np.int64)]
+
+
+def bucket_entries(index):
+    return sum(len(bucket) for table in index._buckets for bucket in table.values())
+
+
+def test_removed_rows_are_reclaimed():
+    index = PhotoHashIndex()
+    hashes = random_hashes(5000)
+    for i, phash in enumerate(hashes):
+        index.add(f"img{i}", f"voter{i}", phash)
+    assert len(index._keys) == 5000
+    assert bucket_entries(index) == 5000 * index.tables
+    capacity = len(index._hashes)
+
+    # Past a quarter of the rows dead, the next removal compacts
+    for i in range(1251):
+        index.remove(f"img{i}")
+
+    assert len(index) == 3749
+    assert len(index._keys) == len(index._labels) == 3749
+    assert bucket_entries(index) == 3749 * index.tables
+    assert len(index._hashes) < capacity
+    assert index._alive[:3749].all() and not index._alive[3749:].any()
+
+    # Survivors are still found under their keys and labels
+    for i in (1251, 2500, 4999):
+        match = index.query(hashes[i], threshold=0)
+        assert match == [{"image_id": f"img{i}", "voter_id": f"voter{i}", "distance": 0}]
+    assert index.query(hashes[0], threshold=0) == []
+
+
+def test_replacing_photos_does_not_grow_the_index():
+    index = PhotoHashIndex()
+    hashes = random_hashes(2000, seed=1)
+    for i in range(1000):
+        index.add(f"img{i}", f"voter{i}", hashes[i])
+    # Every photo replaced twice: without compaction this leaves 3000 rows
+    for round_ in (1, 2):
+        for i in range(1000):
+            index.add(f"img{i}", f"voter{i}", hashes[(i + round_ * 500) % 2000])
+
+    assert len(index) == 1000
+    assert len(index._keys) <= 1000 / (1 - 0.25) + 1
+    assert bucket_entries(index) == len(index._keys) * index.tables
+
+
+def test_small_index_is_not_compacted():
+    index = PhotoHashIndex()
+    for i, phash in enumerate(random_hashes(100, seed=2)):
+        index.add(f"img{i}", f"voter{i}", phash)
+    for i in range(90):
+        index.remove(f"img{i}")
+    assert len(index) == 10
+    assert len(index._keys) == 100
@@ -0,0 +1,37 @@
+import collections
+
+
+class ByteBoundedLRU:
+    """OrderedDict LRU that evicts by total size rather than entry count.
+
+    Not thread-safe on its own; callers hold their own lock around it.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = collections.OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        self.pop(key)
+        self._items[key] = (value, nbytes)
+        self.size += nbytes
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.size -= evicted
+
+    def pop(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+    def __len__(self):
+        return len(self._items)
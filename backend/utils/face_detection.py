@@ -0,0 +1,40 @@
+import threading
+import cv2
+
+_local = threading.local()
+
+
+def haar_face_detector():
+    """Per-thread Haar cascade; parsing the XML on every call is expensive and the
+    classifier object is not safe to share between threads."""
+    detector = getattr(_local, 'detector', None)
+    if detector is None:
+        detector = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        _local.detector = detector
+    return detector
+
+
+def detect_largest_face(image, max_width=320):
+    """Largest face box (x, y, w, h) in full-resolution coordinates, or None.
+
+    Detection runs on a copy downscaled to at most ``max_width`` pixels wide.
+    """
+    h, w = image.shape[:2]
+    scale = min(1.0, max_width / float(w))
+    small = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    faces = haar_face_detector().detectMultiScale(gray, 1.1, 4, minSize=(24, 24))
+    if len(faces) == 0:
+        return None
+    x, y, fw, fh = max(faces, key=lambda f: f[2] * f[3])
+    return tuple(int(round(v / scale)) for v in (x, y, fw, fh))
+
+
+def crop_face(image, box, margin=0.3):
+    """Crop ``box`` expanded by ``margin`` of its size on every side, clipped to the image"""
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    img_h, img_w = image.shape[:2]
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(img_w, x + w + dx), min(img_h, y + h + dy)
+    return image[y0:y1, x0:x1]
@@ -0,0 +1,51 @@
+from flask import Response, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.wsgi import wrap_file
+
+# Photo URLs keyed by image_id never change content: a new upload gets a new id
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def grid_file_etag(grid_out):
+    """Strong ETag for a GridFS file: its content hash when one was stored, else its id.
+
+    GridFS files are never modified in place, so the file id alone is already
+    a strong validator; a stored MD5/SHA-256 additionally survives re-uploads
+    of identical bytes.
+    """
+    for field in ("sha256", "md5"):
+        value = getattr(grid_out, field, None)
+        if value:
+            return f"{field}-{value}"
+    return str(grid_out._id)
+
+
+def send_grid_file(grid_out, immutable=False, default_mimetype="image/jpeg"):
+    """Stream a GridFS file as a binary response with ETag, 304 and Range support.
+
+    The body is read chunk by chunk from GridFS as the client consumes it;
+    nothing is base64-encoded or held in memory whole. ``immutable`` marks
+    URLs that address one specific file (by image_id) so browsers keep them
+    for a year; voter-keyed URLs can point at a new photo later and are
+    revalidated instead (a 304 costs no body).
+    """
+    response = Response(
+        wrap_file(request.environ, grid_out),
+        mimetype=getattr(grid_out, "content_type", None) or default_mimetype,
+        direct_passthrough=True
+    )
+    response.content_length = grid_out.length
+    response.last_modified = grid_out.upload_date
+    response.set_etag(grid_file_etag(grid_out))
+    # Voter photos are personal data: never let a shared proxy keep them
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    try:
+        return response.make_conditional(request.environ, accept_ranges=True, complete_length=grid_out.length)
+    except RequestedRangeNotSatisfiable as e:
+        grid_out.close()
+        return e.get_response()
@@ -0,0 +1,56 @@
+import struct
+from collections import namedtuple
+
+# Same attributes the validator used to read off a PIL image
+ImageHeader = namedtuple('ImageHeader', ['format', 'size'])
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Start-of-frame markers carry the dimensions (DHT, JPG and DAC share the range but do not)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def read_image_header(data):
+    """Format and (width, height) of a JPEG or PNG from its header bytes; None if unrecognised.
+
+    Only walks the JPEG marker segments up to the first frame header (or reads
+    the PNG IHDR chunk); no pixel data is touched.
+    """
+    if data[:8] == _PNG_SIGNATURE and data[12:16] == b'IHDR' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return ImageHeader('PNG', (width, height))
+
+    if data[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Stand-alone markers have no length field
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return ImageHeader('JPEG', (width, height))
+        i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def base64_decoded_size(encoded, start=0):
+    """Decoded byte length of ``encoded[start:]``, computed from its length alone.
+
+    Works on the original string without slicing or stripping it, so sizing
+    a multi-megabyte payload costs the same as sizing a small one.
+    """
+    end = len(encoded)
+    while end > start and encoded[end - 1] in ' \t\r\n':
+        end -= 1
+    padding = 0
+    while padding < 2 and end - padding > start and encoded[end - 1 - padding] == '=':
+        padding += 1
+    return (end - start) * 3 // 4 - padding
@@ -1,9 +1,8 @@
 import cv2
 import numpy as np
-from PIL import Image, ImageFilter
-import io
 import base64
-import os
+from utils.face_detection import detect_largest_face, haar_face_detector
+from utils.image_header import base64_decoded_size, read_image_header
 
 class VoterImageValidator:
     def __init__(self):
@@ -18,12 +17,34 @@ class VoterImageValidator:
         # Calculate required pixel dimensions (cm to pixels)
         self.REQUIRED_WIDTH_PX = int(self.REQUIRED_WIDTH_CM * self.DPI / 2.54)
         self.REQUIRED_HEIGHT_PX = int(self.REQUIRED_HEIGHT_CM * self.DPI / 2.54)
+
+        # normalize_image() refuses sources above this from their header, before decoding
+        self.NORMALIZE_MAX_PIXELS = 40 * 1000 * 1000
         
-    def validate_image(self, image_data):
-        """Main validation function - returns validation result"""
+    def validate_image(self, image_data, fail_fast=False):
+        """Main validation function - returns validation result.
+
+        Cheap checks (format, byte size, header dimensions) run first on the
+        encoded bytes. A base64 payload is size-checked from its length before
+        it is decoded, and one that is too large is rejected outright in either
+        mode; format and dimensions come from the JPEG/PNG header alone. The photo is then
+        decoded once into a grayscale buffer shared by the orientation, blur
+        and face checks. With ``fail_fast`` the first failing check ends the
+        run, so a wrong-size upload never reaches OpenCV; otherwise every
+        check runs and all errors are reported (the admin UI's full report).
+        """
         try:
-            # Convert base64 to PIL Image if needed
+            # Convert base64 to bytes if needed
             if isinstance(image_data, str) and image_data.startswith('data:image'):
+                # Size gate from the base64 length: an oversized payload is never copied or decoded
+                decoded_size = base64_decoded_size(image_data, image_data.find(',') + 1)
+                size_check = self._validate_size_bytes(decoded_size)
+                if not size_check["valid"] and (fail_fast or decoded_size > self.MAX_SIZE_KB * 1024):
+                    return {
+                        "valid": False,
+                        "errors": [size_check["error"]],
+                        "checks": [dict(size_check, check="file_size")]
+                    }
                 # Extract base64 data
                 image_data = image_data.split(',')[1]
                 image_bytes = base64.b64decode(image_data)
@@ -32,42 +53,156 @@ class VoterImageValidator:
             else:
                 return {"valid": False, "error": "Invalid image data format"}
             
-            # Load image with PIL
-            image = Image.open(io.BytesIO(image_bytes))
+            # Format and dimensions from the header bytes; nothing is decoded yet
+            header = read_image_header(image_bytes)
             
-            # Run all validations
-            validations = [
-                self._validate_format(image),
-                self._validate_file_size(image_bytes),
-                self._validate_dimensions(image),
-                self._validate_orientation(image_bytes),
-                self._validate_blur(image_bytes),
-                self._validate_face_detection(image_bytes)
-            ]
-            
-            # Collect all errors
+            checks = []
             errors = []
-            for validation in validations:
+            state = {}
+            stages = [
+                ("format", lambda: self._validate_format(header)),
+                ("file_size", lambda: self._validate_file_size(image_bytes)),
+                ("dimensions", lambda: self._validate_dimensions(header)),
+                ("decode", lambda: self._decode_gray(image_bytes, state)),
+                ("orientation", lambda: self._validate_orientation(state["gray"])),
+                ("blur", lambda: self._validate_blur(state["gray"])),
+                ("face_detection", lambda: self._validate_face_detection(state["gray"]))
+            ]
+            for name, check in stages:
+                if errors and fail_fast:
+                    checks.append({"check": name, "valid": None, "skipped": True})
+                    continue
+                validation = check()
+                checks.append(dict(validation, check=name))
                 if not validation["valid"]:
                     errors.append(validation["error"])
+                    if name == "decode":
+                        # Nothing left to run the OpenCV checks on
+                        fail_fast = True
             
             if errors:
-                return {"valid": False, "errors": errors}
+                return {"valid": False, "errors": errors, "checks": checks}
             else:
-                return {"valid": True, "message": "Image validation successful"}
+                # face_box is stored with the photo so enrollment can crop without detecting again
+                return {
+                    "valid": True,
+                    "message": "Image validation successful",
+                    "checks": checks,
+                    "face_box": checks[-1].get("face_box")
+                }
                 
         except Exception as e:
             return {"valid": False, "error": f"Image processing failed: {str(e)}"}
     
+    def normalize_image(self, image_data, max_attempts=8):
+        """Turn an arbitrary photo into a compliant JPEG and return (jpeg_bytes, report).
+
+        The photo is cropped around the largest detected face (or the image
+        centre) to the required aspect ratio, with the face at about half the
+        crop height, and resized to REQUIRED_WIDTH_PX x REQUIRED_HEIGHT_PX.
+        JPEG quality is then binary-searched so the file lands inside
+        MIN_SIZE_KB-MAX_SIZE_KB in at most ``max_attempts`` encodes; if no
+        quality fits, the encode closest to the range is returned and the
+        validation report says why.
+
+        The source's dimensions are read from its header first: anything over
+        NORMALIZE_MAX_PIXELS is refused without decoding it, and a large
+        source is decoded at 1/2, 1/4 or 1/8 scale (still at least twice the
+        output size). ``crop_box`` is reported in source pixels either way.
+        """
+        if isinstance(image_data, str):
+            image_bytes = base64.b64decode(image_data.split(',', 1)[1] if image_data.startswith('data:image') else image_data)
+        else:
+            image_bytes = image_data
+        header = read_image_header(image_bytes)
+        if header is None:
+            raise ValueError(f"Unsupported image format. Only {', '.join(self.ALLOWED_FORMATS)} allowed.")
+        src_w, src_h = header.size
+        if src_w * src_h > self.NORMALIZE_MAX_PIXELS:
+            raise ValueError(f"Image dimensions {src_w}x{src_h} too large. "
+                             f"Maximum {self.NORMALIZE_MAX_PIXELS // 1000000} megapixels allowed.")
+        read_flag, scale = self._reduced_read_flag(src_w, src_h)
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), read_flag)
+        if image is None:
+            raise ValueError("Could not decode image")
+
+        img_h, img_w = image.shape[:2]
+        target_w, target_h = self.REQUIRED_WIDTH_PX, self.REQUIRED_HEIGHT_PX
+        face_box = detect_largest_face(image, max_width=480)
+        if face_box is not None:
+            x, y, w, h = face_box
+            # Face at half the crop height, inside the 30-70% the face check asks for
+            crop_h = h / 0.5
+            centre_x, centre_y = x + w / 2.0, y + h / 2.0
+        else:
+            crop_h = img_h
+            centre_x, centre_y = img_w / 2.0, img_h / 2.0
+        crop_w = crop_h * target_w / target_h
+        fit = min(1.0, img_w / crop_w, img_h / crop_h)
+        crop_w, crop_h = int(crop_w * fit), int(crop_h * fit)
+        x0 = int(min(max(centre_x - crop_w / 2.0, 0), img_w - crop_w))
+        y0 = int(min(max(centre_y - crop_h / 2.0, 0), img_h - crop_h))
+        crop = image[y0:y0 + crop_h, x0:x0 + crop_w]
+        interpolation = cv2.INTER_AREA if crop_w > target_w else cv2.INTER_CUBIC
+        resized = cv2.resize(crop, (target_w, target_h), interpolation=interpolation)
+
+        min_bytes, max_bytes = self.MIN_SIZE_KB * 1024, self.MAX_SIZE_KB * 1024
+        low, high = 10, 100
+        best, best_gap, attempts = None, None, 0
+        while low <= high and attempts < max_attempts:
+            quality = (low + high) // 2
+            ok, encoded = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            attempts += 1
+            if not ok:
+                raise ValueError("Could not encode image")
+            size = len(encoded)
+            gap = max(min_bytes - size, size - max_bytes, 0)
+            if best is None or gap < best_gap:
+                best, best_gap = (quality, encoded.tobytes()), gap
+            if size > max_bytes:
+                high = quality - 1
+            elif size < min_bytes:
+                low = quality + 1
+            else:
+                break
+
+        quality, jpeg_bytes = best
+        return jpeg_bytes, {
+            "crop_box": [x0 * scale, y0 * scale, crop_w * scale, crop_h * scale],
+            "face_found": face_box is not None,
+            "width": target_w,
+            "height": target_h,
+            "jpeg_quality": quality,
+            "encode_attempts": attempts,
+            "size_kb": round(len(jpeg_bytes) / 1024, 1)
+        }
+
+    def _reduced_read_flag(self, width, height):
+        """Largest decode-time downscale that keeps the image at least twice the output size; (flag, factor)"""
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if width // factor >= 2 * self.REQUIRED_WIDTH_PX and height // factor >= 2 * self.REQUIRED_HEIGHT_PX:
+                return flag, factor
+        return cv2.IMREAD_COLOR, 1
+
+    def _decode_gray(self, image_bytes, state):
+        """Decode the photo once; every OpenCV check works on this grayscale buffer"""
+        state["gray"] = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if state["gray"] is None:
+            return {"valid": False, "error": "Image could not be decoded."}
+        return {"valid": True}
+    
     def _validate_format(self, image):
         """Check if image format is allowed"""
-        if image.format not in self.ALLOWED_FORMATS:
+        if image is None or image.format not in self.ALLOWED_FORMATS:
             return {"valid": False, "error": f"Invalid format. Only {', '.join(self.ALLOWED_FORMATS)} allowed."}
         return {"valid": True}
     
     def _validate_file_size(self, image_bytes):
         """Check file size constraints"""
-        size_kb = len(image_bytes) / 1024
+        return self._validate_size_bytes(len(image_bytes))
+    
+    def _validate_size_bytes(self, size_bytes):
+        size_kb = size_bytes / 1024
         if size_kb < self.MIN_SIZE_KB:
             return {"valid": False, "error": f"Image too small. Minimum {self.MIN_SIZE_KB}KB required."}
         if size_kb > self.MAX_SIZE_KB:
@@ -76,6 +211,8 @@ class VoterImageValidator:
     
     def _validate_dimensions(self, image):
         """Check image dimensions (allowing 10% tolerance)"""
+        if image is None:
+            return {"valid": False, "error": "Could not read image dimensions."}
         width, height = image.size
         
         # Allow 10% tolerance
@@ -90,14 +227,9 @@ class VoterImageValidator:
             
         return {"valid": True}
     
-    def _validate_orientation(self, image_bytes):
+    def _validate_orientation(self, gray):
         """Check if image is properly oriented (not upside down or tilted)"""
         try:
-            # Convert to OpenCV format
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
             # Detect edges to check orientation
             edges = cv2.Canny(gray, 50, 150, apertureSize=3)
             lines = cv2.HoughLines(edges, 1, np.pi/180, threshold=100)
@@ -120,14 +252,9 @@ class VoterImageValidator:
             # If orientation detection fails, assume it's okay
             return {"valid": True}
     
-    def _validate_blur(self, image_bytes):
+    def _validate_blur(self, gray):
         """Check if image is clear (not blurred)"""
         try:
-            # Convert to OpenCV format
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
             # Calculate Laplacian variance (measure of blur)
             laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
             
@@ -140,17 +267,11 @@ class VoterImageValidator:
         except Exception:
             return {"valid": True}
     
-    def _validate_face_detection(self, image_bytes):
+    def _validate_face_detection(self, gray):
         """Check if image contains a properly positioned face"""
         try:
-            # Convert to OpenCV format
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Use Haar Cascade for face detection
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+            # Use Haar Cascade for face detection (cached per thread, not re-parsed per upload)
+            faces = haar_face_detector().detectMultiScale(gray, 1.1, 4)
             
             if len(faces) == 0:
                 return {"valid": False, "error": "No face detected. Please ensure the photo shows a clear frontal face."}
@@ -167,7 +288,7 @@ class VoterImageValidator:
             if face_ratio < 0.3 or face_ratio > 0.7:
                 return {"valid": False, "error": "Face size inappropriate. Face should be 30-70% of image height."}
             
-            return {"valid": True}
+            return {"valid": True, "face_box": [int(face_x), int(face_y), int(face_w), int(face_h)]}
             
         except Exception as e:
             # If face detection fails, we'll allow it but warn
@@ -0,0 +1,83 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Log-spaced bucket upper bounds from 0.1 ms to ~70 s (25% apart), so any
+# percentile is reported within 25% of the true value in constant memory.
+BUCKET_BOUNDS_MS = [0.1 * 1.25 ** i for i in range(61)]
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return round(min(BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms, self.max_ms), 2)
+        return round(self.max_ms, 2)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 2)
+        }
+
+
+class LatencyRegistry:
+    """Process-wide per-stage latency histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, stage, ms):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.observe(ms)
+
+    def observe_all(self, timings):
+        for stage, ms in (timings or {}).items():
+            self.observe(stage, ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: h.summary() for stage, h in sorted(self._histograms.items())}
+
+
+REGISTRY = LatencyRegistry()
+
+
+@contextmanager
+def span(stage, timings=None, registry=REGISTRY):
+    """Time a block, record it in the registry and, if given, in a per-request timings dict"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000.0
+        if registry is not None:
+            registry.observe(stage, ms)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + ms, 2)
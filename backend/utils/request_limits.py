@@ -0,0 +1,40 @@
+import os
+from functools import wraps
+from flask import request, jsonify
+
+# A compliant photo is at most 100KB, about 137KB as base64; leave room for the voter fields around it
+IMAGE_REQUEST_MAX_BYTES = int(os.getenv("IMAGE_REQUEST_MAX_BYTES", str(256 * 1024)))
+# ?normalize=1 uploads are raw camera/phone photos that the server shrinks itself
+NORMALIZE_REQUEST_MAX_BYTES = int(os.getenv("NORMALIZE_REQUEST_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def normalize_requested(data=None):
+    """Whether an upload asked for auto-normalize mode (``?normalize=1`` or ``"normalize": true``)"""
+    if request.args.get('normalize', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return bool((data or {}).get('normalize'))
+
+
+def limit_request_body(max_bytes=IMAGE_REQUEST_MAX_BYTES, normalize_max_bytes=None):
+    """Answer 413 for bodies over ``max_bytes`` before the view reads or parses them.
+
+    With ``normalize_max_bytes``, requests carrying ``?normalize=1`` get that
+    larger cap instead (the body has not been parsed yet, so only the query
+    string can raise it).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            max_bytes_here = max_bytes
+            if normalize_max_bytes and normalize_requested():
+                max_bytes_here = normalize_max_bytes
+            if request.content_length is not None and request.content_length > max_bytes_here:
+                return jsonify({"error": f"Request body too large. Maximum {max_bytes_here // 1024}KB allowed."}), 413
+            try:
+                # Also caps chunked bodies that send no Content-Length (Flask >= 3.1)
+                request.max_content_length = max_bytes_here
+            except AttributeError:
+                pass
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
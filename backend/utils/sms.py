@@ -1,35 +1,77 @@
 import os
-from twilio.rest import Client
 
-def get_twilio_client():
-    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    
-    if not account_sid or not auth_token:
-        print("Warning: Twilio credentials not found in .env file. SMS will be printed to console.")
-        return None
-    
-    return Client(account_sid, auth_token)
+import requests
+from requests.adapters import HTTPAdapter
 
-twilio_client = get_twilio_client()
+# Point at fake_sms_server.py for load tests: SMS_API_BASE_URL=http://127.0.0.1:8099
+SMS_API_BASE_URL = os.getenv("SMS_API_BASE_URL", "https://api.twilio.com")
+SMS_HTTP_TIMEOUT = float(os.getenv("SMS_HTTP_TIMEOUT", "10"))
 
-def send_sms(to_number, body):
-    from_number = os.getenv("TWILIO_PHONE_NUMBER")
 
-    if not twilio_client or not from_number:
+class SmsSendError(Exception):
+    """A message the provider did not accept; ``retryable`` is False for permanent rejections"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TwilioTransport:
+    """Twilio's Messages REST call over one pooled, keep-alive HTTP session.
+
+    The session is shared by every sending thread, so ``pool_size`` should
+    be at least the number of threads sending at once.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number, base_url=SMS_API_BASE_URL,
+                 pool_size=10, timeout=SMS_HTTP_TIMEOUT):
+        self.from_number = from_number
+        self.timeout = timeout
+        self.url = f"{base_url.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.session = requests.Session()
+        self.session.auth = (account_sid, auth_token)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, to_number, body):
+        """Returns the provider's message sid; raises SmsSendError"""
+        try:
+            response = self.session.post(
+                self.url,
+                data={"To": f"+91{to_number}", "From": self.from_number, "Body": body},  # Assuming Indian country code
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise SmsSendError(f"{type(e).__name__}: {e}")
+        if response.status_code in (200, 201):
+            return response.json().get("sid")
+        # Throttling and server errors are worth retrying; other 4xx (bad number, bad auth) are not
+        raise SmsSendError(
+            f"HTTP {response.status_code}: {response.text[:200]}",
+            retryable=response.status_code == 429 or response.status_code >= 500
+        )
+
+
+class ConsoleTransport:
+    """Development stand-in when no provider credentials are configured"""
+
+    def send(self, to_number, body):
         print("-" * 50)
         print(f"SIMULATED SMS to +91{to_number}")
         print(f"BODY: {body}")
         print("-" * 50)
-        return {"success": True, "sid": "simulated_sms_id"}
+        return "simulated_sms_id"
+
+
+def get_sms_transport(pool_size=10):
+    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+    from_number = os.getenv("TWILIO_PHONE_NUMBER")
+
+    if not account_sid or not auth_token or not from_number:
+        print("Warning: Twilio credentials not found in .env file. SMS will be printed to console.")
+        return ConsoleTransport()
+
+    return TwilioTransport(account_sid, auth_token, from_number, pool_size=pool_size)
 
-    try:
-        message = twilio_client.messages.create(
-            body=body,
-            from_=from_number,
-            to=f"+91{to_number}"  # Assuming Indian country code
-        )
-        return {"success": True, "sid": message.sid}
-    except Exception as e:
-        print(f"Twilio SMS Error: {e}")
-        return {"success": False, "error": str(e)}
\ No newline at end of file
@@ -0,0 +1,75 @@
+import base64
+from flask import request
+from utils.image_validator import VoterImageValidator
+
+UPLOAD_READ_CHUNK = 64 * 1024
+# Reading stops here: anything longer fails the validator's size check anyway
+PHOTO_MAX_BYTES = VoterImageValidator().MAX_SIZE_KB * 1024
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png')
+# Form and query-string values are strings; these are read as booleans
+FLAG_FIELDS = ('allow_duplicate_photo', 'fail_fast', 'normalize')
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def read_stream(stream, max_bytes):
+    """Read a file-like upload in chunks, giving up as soon as it passes ``max_bytes``"""
+    chunks, total = [], 0
+    while True:
+        chunk = stream.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLarge(f"Image too large. Maximum {max_bytes // 1024}KB allowed.")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def read_photo_upload(max_image_bytes=PHOTO_MAX_BYTES, normalize_max_bytes=None):
+    """Fields and photo of an upload request, as ``(fields, image)``.
+
+    Three encodings are accepted:
+
+    - JSON (the original API): fields are the JSON object and ``image`` is
+      its base64 / data-URL string, untouched.
+    - multipart/form-data: fields come from the form and the ``image`` part
+      is read in chunks into bytes.
+    - a raw ``image/jpeg`` or ``image/png`` body: fields come from the query
+      string and the body is read in chunks into bytes.
+
+    The binary paths never build a base64 string or a parsed JSON copy of the
+    photo, and stop reading at ``max_image_bytes`` (``normalize_max_bytes``
+    when normalize mode is on). ``image`` is None when no photo was sent.
+    """
+    mimetype = request.mimetype
+    if mimetype not in RAW_IMAGE_TYPES and mimetype != 'multipart/form-data':
+        fields = dict(request.json or {})
+        return fields, fields.pop('image', None)
+
+    if mimetype == 'multipart/form-data':
+        fields = request.form.to_dict()
+        upload = request.files.get('image')
+        stream = upload.stream if upload else None
+    else:
+        fields = request.args.to_dict()
+        stream = request.stream
+    for flag in FLAG_FIELDS:
+        if flag in fields:
+            fields[flag] = fields[flag].strip().lower() in ('1', 'true', 'yes', 'on')
+
+    if normalize_max_bytes and fields.get('normalize'):
+        max_image_bytes = normalize_max_bytes
+    image = read_stream(stream, max_image_bytes) if stream is not None else None
+    return fields, image or None
+
+
+def photo_bytes(image_data):
+    """Raw bytes of an uploaded photo, whether it arrived as bytes or as base64 / a data URL"""
+    if isinstance(image_data, bytes):
+        return image_data
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    return base64.b64decode(image_data)